@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        # /metrics에 write-behind·SQLite 잠금 지표가 항상 포함되도록 수집기를 등록해 둔다
+        from . import writebehind  # noqa: F401
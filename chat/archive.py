@@ -0,0 +1,301 @@
+import gzip
+import heapq
+import os
+import secrets
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone as dt_timezone
+from functools import lru_cache
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import ArchivedSegment, ChatRoom, Message
+from .page_cache import newest_page_cache, page_entries, serialize_message
+from .pagination import encode_cursor
+
+# 세그먼트 파일은 한 줄에 메시지 하나: "<timestamp isoformat>\t<id>\t<MessageSerializer JSON>\n" (gzip).
+# (timestamp, id) 순으로 정렬되어 있고 JSON은 메시지 목록 API의 results 항목 그대로다.
+
+# 다시 쓴 세그먼트의 이전 파일과 실패한 실행이 남긴 파일은 고아가 되며 prune_orphans가 이보다 오래된 것만 지운다.
+# 이전 경로를 막 읽은 요청이나 실행 중인 archive_messages가 쓰는 파일을 건드리지 않기 위해서다
+PRUNE_MIN_AGE = 3600
+
+
+def segment_path(name):
+    return os.path.join(settings.CHAT_ARCHIVE_DIR, name)
+
+
+def month_of(timestamp):
+    return timestamp.astimezone(dt_timezone.utc).date().replace(day=1)
+
+
+def month_end(month):
+    if month.month == 12:
+        return datetime(month.year + 1, 1, 1, tzinfo=dt_timezone.utc)
+    return datetime(month.year, month.month + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def iter_segment(name):
+    with gzip.open(segment_path(name), 'rb') as f:
+        for line in f:
+            timestamp, message_id, item = line.rstrip(b'\n').split(b'\t', 2)
+            yield (datetime.fromisoformat(timestamp.decode()), int(message_id)), item
+
+
+@lru_cache(maxsize=settings.CHAT_ARCHIVE_CACHE_SEGMENTS)
+def load_segment(name):
+    # 세그먼트는 다시 쓸 때마다 새 파일 이름을 받으므로 이름만으로 캐시해도 낡은 내용을 돌려주지 않는다
+    keys, items = [], []
+    for key, item in iter_segment(name):
+        keys.append(key)
+        items.append(item)
+    return keys, items
+
+
+def write_segment(room_id, month, entries):
+    """entries((timestamp, id), JSON bytes)를 새 세그먼트 파일로 쓰고 (이름, 메시지 수, 첫 key, 마지막 key, 원본 크기)를 반환한다."""
+    name = os.path.join(str(room_id), f'{month:%Y-%m}-{secrets.token_hex(4)}.jsonl.gz')
+    path = segment_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    count = raw_bytes = 0
+    first = last = None
+    with open(path, 'wb') as f:
+        with gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as gz:
+            for key, item in entries:
+                line = f'{key[0].isoformat()}\t{key[1]}\t'.encode() + item + b'\n'
+                gz.write(line)
+                raw_bytes += len(line)
+                count += 1
+                first = first or key
+                last = key
+        f.flush()
+        # 핫 테이블에서 지우기 전에 파일이 디스크에 남아 있어야 한다
+        os.fsync(f.fileno())
+    return name, count, first, last, raw_bytes
+
+
+def remove_segment_file(name):
+    try:
+        os.remove(segment_path(name))
+    except FileNotFoundError:
+        pass
+
+
+def archive_month(room_id, month, cutoff, batch_size):
+    """
+    room_id 방의 month 한 달치 중 cutoff보다 오래된 메시지를 그 달의 세그먼트에 합치고 핫 테이블에서 지운다.
+    기존 세그먼트는 합친 내용으로 새 파일에 다시 쓰고 이전 파일은 고아로 남긴다. 옮긴 메시지 수를 반환한다.
+    """
+    upper = min(month_end(month), cutoff)
+    start = datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+    rows = (
+        Message.objects.filter(room_id=room_id, timestamp__gte=start, timestamp__lt=upper)
+        .select_related('sender').order_by('timestamp', 'id')
+    )
+    segment = ArchivedSegment.objects.filter(room_id=room_id, month=month).first()
+    moved_ids = []
+
+    def fresh():
+        for message in rows.iterator(chunk_size=batch_size):
+            moved_ids.append(message.id)
+            yield (message.timestamp, message.id), serialize_message(message)
+
+    existing = iter_segment(segment.path) if segment is not None else ()
+    name, count, first, last, raw_bytes = write_segment(
+        room_id, month, heapq.merge(existing, fresh(), key=itemgetter(0)),
+    )
+    if not moved_ids:
+        remove_segment_file(name)
+        return 0
+
+    fields = {
+        'path': name, 'message_count': count,
+        'first_timestamp': first[0], 'first_message_id': first[1],
+        'last_timestamp': last[0], 'last_message_id': last[1],
+        'raw_bytes': raw_bytes, 'stored_bytes': os.path.getsize(segment_path(name)),
+    }
+    # 세그먼트 행 갱신과 삭제를 한 트랜잭션으로 묶는다. 여기서 실패하면 새 파일은 고아로 남고 --report에 나타난다.
+    # 삭제 트리거가 전문 검색 인덱스에서도 메시지를 지운다
+    with transaction.atomic():
+        ArchivedSegment.objects.update_or_create(room_id=room_id, month=month, defaults=fields)
+        ChatRoom.objects.filter(id=room_id).filter(
+            Q(archived_until__isnull=True) | Q(archived_until__lt=last[0])
+        ).update(archived_until=last[0])
+        for index in range(0, len(moved_ids), batch_size):
+            Message.objects.filter(id__in=moved_ids[index:index + batch_size]).delete()
+
+    if newest_page_cache is not None:
+        # 캐시된 최신 페이지가 옮긴 메시지를 담고 있거나 '방의 전체 메시지'로 표시되어 있을 수 있다
+        newest_page_cache.invalidate(room_id)
+    return len(moved_ids)
+
+
+def archive_messages(cutoff, batch_size, room_ids=None, progress=None):
+    """cutoff보다 오래된 메시지를 방별·월별 세그먼트로 옮긴다. 옮긴 메시지 수를 반환한다."""
+    if room_ids is None:
+        room_ids = ChatRoom.objects.order_by('id').values_list('id', flat=True)
+    archived = 0
+    for room_id in room_ids:
+        # (room, timestamp, id) 인덱스로 남은 메시지 중 가장 오래된 것의 달부터 차례로 옮긴다
+        while True:
+            oldest = (
+                Message.objects.filter(room_id=room_id, timestamp__lt=cutoff)
+                .order_by('timestamp', 'id').values_list('timestamp', flat=True).first()
+            )
+            if oldest is None:
+                break
+            month = month_of(oldest)
+            moved = archive_month(room_id, month, cutoff, batch_size)
+            if not moved:
+                break
+            archived += moved
+            if progress is not None:
+                progress(room_id, month, moved)
+    return archived
+
+
+def archived_before(room_id, bound, limit):
+    """bound (없으면 맨 끝)보다 오래된 아카이브 항목을 최대 limit개, 오래된 순으로 반환한다."""
+    segments = ArchivedSegment.objects.filter(room_id=room_id)
+    if bound is not None:
+        timestamp, message_id = bound
+        segments = segments.filter(
+            Q(first_timestamp__lt=timestamp) | Q(first_timestamp=timestamp, first_message_id__lt=message_id)
+        )
+    entries = []
+    for name in segments.order_by('-month').values_list('path', flat=True):
+        keys, items = load_segment(name)
+        end = len(keys) if bound is None else bisect_left(keys, bound)
+        start = max(0, end - (limit - len(entries)))
+        entries[:0] = zip(keys[start:end], items[start:end])
+        if len(entries) >= limit:
+            break
+    return entries
+
+
+def archived_after(room_id, bound, limit):
+    """bound보다 최신인 아카이브 항목을 최대 limit개, 오래된 순으로 반환한다."""
+    timestamp, message_id = bound
+    segments = ArchivedSegment.objects.filter(room_id=room_id).filter(
+        Q(last_timestamp__gt=timestamp) | Q(last_timestamp=timestamp, last_message_id__gt=message_id)
+    )
+    entries = []
+    for name in segments.order_by('month').values_list('path', flat=True):
+        keys, items = load_segment(name)
+        start = bisect_right(keys, bound)
+        end = start + limit - len(entries)
+        entries.extend(zip(keys[start:end], items[start:end]))
+        if len(entries) >= limit:
+            break
+    return entries
+
+
+def room_messages(room_id):
+    """
+    방의 핫 테이블 메시지 queryset. 각 행에 ChatRoom.archived_until(room_archived_until)을 붙여
+    read_through가 아카이브를 읽어야 하는지 추가 쿼리 없이 판단한다.
+    """
+    return (
+        Message.objects.filter(room_id=room_id).select_related('sender')
+        .annotate(room_archived_until=F('room__archived_until'))
+    )
+
+
+def archived_until(room_id, messages):
+    """room_messages()로 읽은 messages에서 방의 archived_until을 꺼낸다. 핫 메시지가 없을 때만 쿼리한다."""
+    if messages:
+        return messages[0].room_archived_until
+    return ChatRoom.objects.filter(id=room_id).values_list('archived_until', flat=True).first()
+
+
+def read_through(room_id, page_size, messages, prev_cursor, next_cursor, before=None, after=None):
+    """
+    paginate_messages 결과(messages, prev_cursor, next_cursor)가 핫 테이블의 가장 오래된 끝에 닿았거나
+    after 커서가 아카이브 구간을 가리키면 세그먼트를 이어 읽어 합친 (entries, prev_cursor, next_cursor)를 반환한다.
+    entries는 ((timestamp, id), JSON bytes) 목록이다. 아카이브를 읽을 필요가 없으면 None.
+    messages는 room_messages()에서 읽은 것이어야 한다.
+    """
+    if after is None and prev_cursor is not None:
+        return None
+    until = archived_until(room_id, messages)
+    if until is None:
+        return None
+
+    if after is not None:
+        if after[0] > until:
+            return None
+        archived = archived_after(room_id, after, page_size + 1)
+        if not archived:
+            return None
+        entries = sorted(archived + page_entries(messages), key=itemgetter(0))
+        has_more = len(entries) > page_size or next_cursor is not None
+        entries = entries[:page_size]
+        prev_cursor = encode_cursor(*entries[0][0])
+        next_cursor = encode_cursor(*entries[-1][0]) if has_more else None
+        return entries, prev_cursor, next_cursor
+
+    bound = (messages[0].timestamp, messages[0].id) if messages else before
+    archived = archived_before(room_id, bound, page_size - len(messages) + 1)
+    if not archived:
+        return None
+    entries = archived + page_entries(messages)
+    has_more = len(entries) > page_size
+    entries = entries[-page_size:]
+    prev_cursor = encode_cursor(*entries[0][0]) if has_more else None
+    if before is not None:
+        next_cursor = encode_cursor(*entries[-1][0])
+    return entries, prev_cursor, next_cursor
+
+
+def archive_report():
+    """
+    방별 핫 테이블 메시지 수와 세그먼트 현황, 세그먼트 행과 파일이 어긋난 목록(orphaned: 행 없는 파일,
+    missing: 파일 없는 행)을 모은다. SQLite면 DB 파일 크기와 VACUUM으로 돌려받을 수 있는 크기도 넣는다.
+    """
+    rooms = {}
+    for room_id, count in Message.objects.order_by().values_list('room_id').annotate(count=Count('id')):
+        rooms[room_id] = {'room_id': room_id, 'hot_messages': count, 'segments': 0,
+                          'archived_messages': 0, 'raw_bytes': 0, 'stored_bytes': 0}
+    totals = (
+        ArchivedSegment.objects.order_by().values('room_id')
+        .annotate(segments=Count('id'), archived_messages=Sum('message_count'),
+                  raw_bytes=Sum('raw_bytes'), stored_bytes=Sum('stored_bytes'))
+    )
+    for row in totals:
+        rooms.setdefault(row['room_id'], {'room_id': row['room_id'], 'hot_messages': 0}).update(row)
+
+    known = set(ArchivedSegment.objects.values_list('path', flat=True))
+    files = {}
+    if os.path.isdir(settings.CHAT_ARCHIVE_DIR):
+        for directory, _, filenames in os.walk(settings.CHAT_ARCHIVE_DIR):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                files[os.path.relpath(path, settings.CHAT_ARCHIVE_DIR)] = os.path.getmtime(path)
+
+    report = {
+        'rooms': [rooms[room_id] for room_id in sorted(rooms)],
+        'orphaned': sorted((name, mtime) for name, mtime in files.items() if name not in known),
+        'missing': sorted(known - set(files)),
+    }
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA page_size')
+            page_size = cursor.fetchone()[0]
+            cursor.execute('PRAGMA page_count')
+            report['db_bytes'] = cursor.fetchone()[0] * page_size
+            cursor.execute('PRAGMA freelist_count')
+            report['free_bytes'] = cursor.fetchone()[0] * page_size
+    return report
+
+
+def prune_orphans(orphaned):
+    """archive_report()의 orphaned 중 PRUNE_MIN_AGE보다 오래된 파일을 지우고 지운 이름 목록을 반환한다."""
+    removed = []
+    for name, mtime in orphaned:
+        if time.time() - mtime >= PRUNE_MIN_AGE:
+            remove_segment_file(name)
+            removed.append(name)
+    return removed
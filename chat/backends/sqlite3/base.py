@@ -0,0 +1,33 @@
+import time
+
+from django.db.backends.sqlite3 import base
+
+from chat.db import lock_wait_stats
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    운영용 SQLite 백엔드. 연결마다 OPTIONS['pragmas'](WAL 등)를 적용하고,
+    immediate_transactions가 켜진 연결(chat.db.db_writer 스레드)은 트랜잭션을 BEGIN IMMEDIATE로 시작해
+    읽기 후 쓰기로 잠금을 올리다 실패하는 대신 busy_timeout 동안 쓰기 잠금을 기다린다.
+    """
+
+    immediate_transactions = False
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        kwargs.pop('pragmas', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict['OPTIONS'].get('pragmas', {}).items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if not self.immediate_transactions:
+            return super()._start_transaction_under_autocommit()
+        started = time.perf_counter()
+        self.cursor().execute('BEGIN IMMEDIATE')
+        lock_wait_stats.record(time.perf_counter() - started)
@@ -0,0 +1,90 @@
+import asyncio
+import functools
+
+# 송신이 밀린 소켓을 끊을 때의 close code. 클라이언트는 마지막 cursor를 last_seen으로 주고 다시 접속한다
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
+# DaphneProtocolMiddleware가 daphne의 WebSocket protocol을 담아 두는 scope 키
+PROTOCOL_SCOPE_KEY = 'chat.daphne_protocol'
+
+
+class WriteGate:
+    """
+    daphne(Twisted) 소켓의 송신 버퍼 상태를 asyncio에서 기다릴 수 있게 한다.
+    transport에 streaming producer로 등록하면 버퍼가 bufferSize(64KiB)를 넘을 때 pauseProducing,
+    다 비워지면 resumeProducing이 호출된다.
+    """
+
+    def __init__(self):
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+    @property
+    def writable(self):
+        return self._writable.is_set()
+
+    async def wait(self):
+        await self._writable.wait()
+
+    def pauseProducing(self):
+        self._writable.clear()
+
+    def resumeProducing(self):
+        self._writable.set()
+
+    def stopProducing(self):
+        # 연결이 끊겼다. 대기 중인 송신은 disconnect에서 정리된다
+        self._writable.set()
+
+
+def find_protocol(send):
+    """
+    daphne가 넘긴 ASGI send에서 WebSocket protocol을 찾는다. 없으면 None.
+    daphne 3은 functools.partial(server.handle_reply, protocol)을, 2.5는 protocol을 closure로 잡은 lambda를 넘긴다.
+    """
+    if isinstance(send, functools.partial):
+        candidates = send.args
+    else:
+        candidates = []
+        for cell in getattr(send, '__closure__', None) or ():
+            try:
+                candidates.append(cell.cell_contents)
+            except ValueError:
+                # 아직 값이 없는 cell
+                pass
+    for candidate in candidates:
+        if getattr(candidate, 'transport', None) is not None and hasattr(candidate, 'registerProducer'):
+            return candidate
+    return None
+
+
+class DaphneProtocolMiddleware:
+    """
+    WebSocket 스택의 가장 바깥에 두는 ASGI middleware. 세션·인증 middleware가 send를 감싸기 전에
+    daphne protocol을 찾아 scope[PROTOCOL_SCOPE_KEY]에 남긴다. 소비자는 attach_write_gate로 여기에 WriteGate를 건다.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        protocol = find_protocol(send)
+        if protocol is not None:
+            scope = dict(scope, **{PROTOCOL_SCOPE_KEY: protocol})
+        return await self.app(scope, receive, send)
+
+
+def attach_write_gate(protocol):
+    """
+    daphne WebSocket protocol(scope[PROTOCOL_SCOPE_KEY])에 WriteGate를 등록한다.
+    protocol이 없으면(다른 서버나 테스트) 또는 이미 다른 producer가 있으면 None.
+    """
+    if getattr(protocol, 'transport', None) is None or not hasattr(protocol, 'registerProducer'):
+        return None
+    gate = WriteGate()
+    try:
+        protocol.registerProducer(gate, True)
+    except RuntimeError:
+        # 이미 다른 producer가 등록되어 있다
+        return None
+    return gate
@@ -0,0 +1,93 @@
+import time
+from datetime import timedelta
+
+from django.utils import timezone
+
+from chat.codecs import CODECS
+from chat.pagination import encode_cursor
+from chat.replay import message_frame
+
+from .support import compare_metrics, percentile
+
+# 회귀 판단에 쓰는 지표: (이름, 높을수록 좋은지)
+TRACKED_METRICS = [
+    ('bytes', False),
+    ('encode_us_p50', False),
+    ('decode_us_p50', False),
+]
+
+SAMPLE_TEXTS = [
+    '네',
+    '내일 아침 9시에 호텔 로비에서 만나요!',
+    'The hotel address is 24 Sejong-daero, Jung-gu, Seoul. Check-in after 3pm, bring your passport.',
+    '오늘 일정 정리: 경복궁 → 북촌 한옥마을 → 인사동 점심 → 남산타워 야경. 교통카드 충전 잊지 마세요. ' * 3,
+]
+
+
+def sample_messages(count, start=None):
+    start = start or timezone.now()
+    frames = []
+    for index in range(count):
+        timestamp = start + timedelta(seconds=index)
+        frames.append(message_frame(
+            SAMPLE_TEXTS[index % len(SAMPLE_TEXTS)], {'travel_user_id': 1000 + index % 7},
+            timestamp.isoformat(), encode_cursor(timestamp, 10000 + index),
+        ))
+    return frames
+
+
+def sample_shapes():
+    """실제 소켓 프레임 모양: 단일 메시지, 참가자 목록, 묶음 프레임, 재접속 replay, ephemeral."""
+    messages = sample_messages(200)
+    return {
+        'message_short': messages[1],
+        'message_long': messages[3],
+        'participants_20': {'type': 'participants', 'participants': [{'travel_user_id': 1000 + i} for i in range(20)]},
+        'batch_16': messages[:16],
+        'replay_200': {'type': 'replay', 'messages': messages, 'complete': True},
+        'ephemeral': {'type': 'ephemeral', 'events': [['typing', 1001, True], ['read', 1002, messages[0]['cursor']]]},
+    }
+
+
+def _timed(fn, arg, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn(arg)
+        samples.append((time.perf_counter() - started) * 1_000_000)
+    return samples
+
+
+def run_benchmark(iterations):
+    results = []
+    for shape, content in sample_shapes().items():
+        for codec in CODECS.values():
+            encoded = codec.encode(content)
+            if codec.decode(encoded) != content:
+                raise AssertionError(f'{codec.name} round trip changed {shape}')
+            encode_samples = _timed(codec.encode, content, iterations)
+            decode_samples = _timed(codec.decode, encoded, iterations)
+            results.append({
+                'shape': shape,
+                'codec': codec.name,
+                'bytes': len(encoded.encode() if isinstance(encoded, str) else encoded),
+                'encode_us_p50': percentile(encode_samples, 0.50),
+                'encode_us_p95': percentile(encode_samples, 0.95),
+                'decode_us_p50': percentile(decode_samples, 0.50),
+                'decode_us_p95': percentile(decode_samples, 0.95),
+            })
+    return {'benchmark': 'codecs', 'iterations': iterations, 'results': results}
+
+
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    baseline_results = {(item['shape'], item['codec']): item for item in (baseline or {}).get('results', [])}
+    for item in results['results']:
+        previous = baseline_results.get((item['shape'], item['codec']))
+        if previous is None:
+            continue
+        for name, higher_is_better in TRACKED_METRICS:
+            problem = compare_metrics(name, item.get(name), previous.get(name), higher_is_better, tolerance)
+            if problem:
+                regressions.append(f"{item['shape']}/{item['codec']} {problem}")
+    return regressions
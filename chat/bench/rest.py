@@ -0,0 +1,171 @@
+import time
+from contextlib import contextmanager
+
+from rest_framework.test import APIClient
+
+from chat.friends import friend_cache
+from chat.identity import user_identity_cache
+from chat.models import ChatRoom, Message, User
+from chat.pagination import message_cursor
+from chat.summaries import record_messages
+from chat.tokens import jwt_verification_cache
+from chat.upstream import upstream
+from chat.upstream_stub import StubUpstreamServer
+
+from .support import QueryCounter, compare_metrics, percentile
+
+# 엔드포인트별 요청 1회당 허용 쿼리 수. 데이터 크기와 무관하게 고정이어야 한다.
+QUERY_BUDGETS = {
+    'room_list': 2,
+    'room_list_expanded': 4,
+    'room_detail': 4,
+    'message_list': 1,
+    'message_list_older': 1,
+    'room_create': 14,
+    'login': 2,
+}
+
+FOCAL_USER_ID = 1
+
+
+def seed_dataset(rooms, messages_per_room, members_per_room):
+    """
+    FOCAL_USER_ID 사용자가 모든 방에 속한 데이터셋을 만든다.
+    방마다 members_per_room명(FOCAL 포함)이 있고, 메시지는 참가자들이 번갈아 보낸 것으로 채운다.
+    """
+    focal = User.objects.create(travel_user_id=FOCAL_USER_ID, jwt_token=f'token-{FOCAL_USER_ID}',
+                                jwt_refresh_token=f'refresh-{FOCAL_USER_ID}')
+    next_user_id = FOCAL_USER_ID + 1
+    room_ids = []
+    for _ in range(rooms):
+        members = [focal] + User.objects.bulk_create([
+            User(travel_user_id=next_user_id + offset) for offset in range(members_per_room - 1)
+        ])
+        next_user_id += members_per_room - 1
+        room = ChatRoom.objects.create(room_name='bench')
+        room.users.set(members)
+        messages = Message.objects.bulk_create([
+            Message(room=room, sender=members[seq % len(members)], text=f'message {seq}')
+            for seq in range(messages_per_room)
+        ])
+        record_messages(messages)
+        room_ids.append(room.id)
+    return room_ids, next_user_id
+
+
+@contextmanager
+def stub_upstream(friends):
+    original_url = upstream.base_url
+    with StubUpstreamServer(friends=friends) as stub:
+        upstream.base_url = stub.url
+        upstream.breaker.record_success()
+        try:
+            yield stub
+        finally:
+            upstream.base_url = original_url
+
+
+def clear_caches():
+    friend_cache.clear()
+    jwt_verification_cache.clear()
+    user_identity_cache.clear()
+
+
+def endpoint_requests(room_ids, friend_id):
+    client = APIClient()
+    room_id = room_ids[-1]
+    # 방 히스토리 중간쯤에서 이전 페이지를 읽는 경우
+    messages = Message.objects.filter(room_id=room_id).order_by('timestamp', 'id')
+    middle_cursor = message_cursor(messages[messages.count() // 2])
+    return {
+        'room_list': lambda: client.get('/chat/rooms/', {'travel_user_id': FOCAL_USER_ID}),
+        'room_list_expanded': lambda: client.get('/chat/rooms/', {
+            'travel_user_id': FOCAL_USER_ID, 'expand': 'messages',
+        }),
+        'room_detail': lambda: client.get(f'/chat/rooms/{room_id}/'),
+        'message_list': lambda: client.get(f'/chat/{room_id}/messages/'),
+        'message_list_older': lambda: client.get(f'/chat/{room_id}/messages/', {'before': middle_cursor}),
+        'room_create': lambda: client.post('/chat/rooms/', {
+            'travel_user_id': FOCAL_USER_ID, 'users': [{'travel_user_id': friend_id}],
+        }, format='json'),
+        'login': lambda: client.post('/users/', {
+            'jwtToken': f'token-{FOCAL_USER_ID}', 'jwtRefreshToken': f'refresh-{FOCAL_USER_ID}',
+        }, format='json'),
+    }
+
+
+def measure(request, iterations, counter):
+    timings = []
+    queries = []
+    for _ in range(iterations):
+        counter.reset()
+        started = time.perf_counter()
+        response = request()
+        timings.append((time.perf_counter() - started) * 1000)
+        queries.append(counter.count)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{response.status_code}: {response.content[:200]!r}')
+    return {
+        'p50_ms': percentile(timings, 0.50),
+        'p95_ms': percentile(timings, 0.95),
+        'queries': max(queries),
+    }
+
+
+def run_dataset(rooms, messages_per_room, members_per_room, iterations):
+    room_ids, next_user_id = seed_dataset(rooms, messages_per_room, members_per_room)
+    friend_id = next_user_id
+    User.objects.create(travel_user_id=friend_id)
+    clear_caches()
+
+    counter = QueryCounter()
+    counter.install()
+    try:
+        with stub_upstream({FOCAL_USER_ID: [friend_id]}):
+            endpoints = {
+                name: measure(request, iterations, counter)
+                for name, request in endpoint_requests(room_ids, friend_id).items()
+            }
+    finally:
+        counter.uninstall()
+
+    return {
+        'rooms': rooms,
+        'messages_per_room': messages_per_room,
+        'members_per_room': members_per_room,
+        'endpoints': endpoints,
+    }
+
+
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    datasets = results['datasets']
+    for dataset in datasets:
+        label = f"{dataset['rooms']}x{dataset['messages_per_room']}"
+        for name, stats in dataset['endpoints'].items():
+            budget = QUERY_BUDGETS.get(name)
+            if budget is not None and stats['queries'] > budget:
+                regressions.append(f'{label} {name}: {stats["queries"]} queries > budget {budget}')
+
+    # 데이터가 커질수록 쿼리 수가 늘어나면 O(N) 패턴이 생긴 것이다
+    for name in datasets[0]['endpoints'] if datasets else []:
+        counts = [dataset['endpoints'][name]['queries'] for dataset in datasets]
+        if len(set(counts)) > 1:
+            regressions.append(f'{name}: query count grows with dataset size {counts}')
+
+    baseline_datasets = {
+        (dataset['rooms'], dataset['messages_per_room']): dataset
+        for dataset in (baseline or {}).get('datasets', [])
+    }
+    for dataset in datasets:
+        previous = baseline_datasets.get((dataset['rooms'], dataset['messages_per_room']))
+        if previous is None:
+            continue
+        label = f"{dataset['rooms']}x{dataset['messages_per_room']}"
+        for name, stats in dataset['endpoints'].items():
+            previous_stats = previous['endpoints'].get(name, {})
+            for metric in ('p50_ms', 'p95_ms'):
+                problem = compare_metrics(metric, stats[metric], previous_stats.get(metric), False, tolerance)
+                if problem:
+                    regressions.append(f'{label} {name} {problem}')
+    return regressions
@@ -0,0 +1,90 @@
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test.utils import setup_databases, teardown_databases
+
+
+class QueryCounter:
+    """모든 스레드의 DB 연결(database_sync_to_async, db_writer 스레드 포함)에서 실행된 쿼리 수를 센다."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def _on_connection_created(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def install(self):
+        connection_created.connect(self._on_connection_created)
+        for conn in connections.all():
+            self._on_connection_created(None, conn)
+
+    def uninstall(self):
+        connection_created.disconnect(self._on_connection_created)
+        for conn in connections.all():
+            if self in conn.execute_wrappers:
+                conn.execute_wrappers.remove(self)
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+
+
+@contextmanager
+def benchmark_database():
+    """
+    벤치마크 전용 임시 SQLite 파일 DB를 만들고 끝나면 지운다. 운영 DB는 건드리지 않는다.
+    여러 스레드가 함께 쓰므로 테스트 기본값인 공유 메모리 DB 대신 파일을 사용한다.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            yield
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare_metrics(name, current, baseline, higher_is_better, tolerance):
+    """current가 baseline 대비 tolerance(비율) 이상 나빠졌으면 설명 문자열을, 아니면 None을 반환한다."""
+    if current is None or baseline is None:
+        return None
+    if higher_is_better:
+        if current < baseline * (1 - tolerance):
+            return f'{name}: {current:.3f} < baseline {baseline:.3f}'
+    elif current > baseline * (1 + tolerance) and current - baseline > 1e-9:
+        return f'{name}: {current:.3f} > baseline {baseline:.3f}'
+    return None
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+
+from chat.codecs import MsgpackCodec
+from chat.identity import user_identity_cache
+from chat.models import ChatRoom, User
+from chat.routing import websocket_urlpatterns
+from chat.writebehind import message_queue
+
+from .support import QueryCounter, compare_metrics, percentile
+
+IN_MEMORY_LAYER = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        'CONFIG': {'capacity': 100000},
+    },
+}
+
+# 회귀 판단에 쓰는 지표: (이름, 높을수록 좋은지)
+TRACKED_METRICS = [
+    ('messages_per_second', True),
+    ('deliveries_per_second', True),
+    ('latency_p50_ms', False),
+    ('latency_p95_ms', False),
+    ('latency_p99_ms', False),
+    ('queries_per_message', False),
+]
+
+
+def decode_frames(output):
+    """communicator 출력 하나를 이벤트 dict 목록으로 바꾼다."""
+    if output['type'] != 'websocket.send':
+        return []
+    if output.get('bytes') is not None:
+        payload = MsgpackCodec.decode(output['bytes'])
+    else:
+        payload = json.loads(output['text'])
+    return payload if isinstance(payload, list) else [payload]
+
+
+@sync_to_async
+def seed_rooms(rooms, room_size, first_user_id):
+    room_members = []
+    travel_user_id = first_user_id
+    for _ in range(rooms):
+        users = User.objects.bulk_create([
+            User(travel_user_id=travel_user_id + offset) for offset in range(room_size)
+        ])
+        travel_user_id += room_size
+        room = ChatRoom.objects.create(room_name='bench')
+        room.users.set(users)
+        room_members.append((room.id, [user.travel_user_id for user in users]))
+    user_identity_cache.clear()
+    return room_members, travel_user_id
+
+
+class Client:
+    def __init__(self, application, room_id, travel_user_id, batch=False, codec='json'):
+        self.room_id = room_id
+        self.travel_user_id = travel_user_id
+        self.codec = codec
+        query = '?batch=1' if batch else ''
+        subprotocols = [codec] if codec != 'json' else None
+        self.communicator = WebsocketCommunicator(application, f'/ws/chat/{room_id}/{query}', subprotocols=subprotocols)
+        self.received = 0
+
+    async def connect(self):
+        connected, _ = await self.communicator.connect(timeout=30)
+        if not connected:
+            raise RuntimeError(f'client for room {self.room_id} was rejected')
+
+    async def send(self, content):
+        if self.codec == 'msgpack':
+            await self.communicator.send_to(bytes_data=MsgpackCodec.encode(content))
+        else:
+            await self.communicator.send_json_to(content)
+
+    async def listen(self, expected, sent_at, latencies, timeout):
+        deadline = time.perf_counter() + timeout
+        while self.received < expected:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return
+            try:
+                output = await self.communicator.receive_output(timeout=remaining)
+            except asyncio.TimeoutError:
+                return
+            now = time.perf_counter()
+            for event in decode_frames(output):
+                if event.get('type') != 'message':
+                    continue
+                started = sent_at.get(event.get('message'))
+                if started is not None:
+                    latencies.append((now - started) * 1000)
+                    self.received += 1
+
+
+async def run_scenario(application, room_size, rooms, messages_per_room, rate, first_user_id, timeout, batch, codec):
+    room_members, next_user_id = await seed_rooms(rooms, room_size, first_user_id)
+
+    clients = {room_id: [Client(application, room_id, member, batch, codec) for member in members]
+               for room_id, members in room_members}
+    all_clients = [client for room_clients in clients.values() for client in room_clients]
+    for client in all_clients:
+        await client.connect()
+        # 접속 직후 오는 participants 프레임
+        await client.communicator.receive_output(timeout=30)
+
+    counter = QueryCounter()
+    counter.install()
+    sent_at = {}
+    latencies = []
+    listeners = [
+        asyncio.ensure_future(client.listen(messages_per_room, sent_at, latencies, timeout))
+        for client in all_clients
+    ]
+
+    async def send_room(room_id, room_clients):
+        interval = 1.0 / rate if rate else 0
+        for seq in range(messages_per_room):
+            sender = room_clients[seq % len(room_clients)]
+            text = f'bench:{room_id}:{seq}'
+            sent_at[text] = time.perf_counter()
+            await sender.send({
+                'type': 'message', 'sender_id': sender.travel_user_id, 'message': text,
+            })
+            if interval:
+                await asyncio.sleep(interval)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send_room(room_id, room_clients) for room_id, room_clients in clients.items()))
+    await asyncio.gather(*listeners)
+    elapsed = time.perf_counter() - started
+    if settings.CHAT_WRITE_BEHIND:
+        await message_queue.flush()
+    counter.uninstall()
+
+    for client in all_clients:
+        await client.communicator.disconnect()
+
+    sent = rooms * messages_per_room
+    delivered = sum(client.received for client in all_clients)
+    return {
+        'room_size': room_size,
+        'rooms': rooms,
+        'messages_per_room': messages_per_room,
+        'rate': rate,
+        'batch': batch,
+        'codec': codec,
+        'clients': len(all_clients),
+        'sent': sent,
+        'delivered': delivered,
+        'expected_deliveries': sent * room_size,
+        'elapsed_seconds': elapsed,
+        'messages_per_second': sent / elapsed if elapsed else None,
+        'deliveries_per_second': delivered / elapsed if elapsed else None,
+        'latency_p50_ms': percentile(latencies, 0.50),
+        'latency_p95_ms': percentile(latencies, 0.95),
+        'latency_p99_ms': percentile(latencies, 0.99),
+        'queries': counter.count,
+        'queries_per_message': counter.count / sent if sent else None,
+        'queries_per_delivery': counter.count / delivered if delivered else None,
+    }, next_user_id
+
+
+async def run_benchmark(room_sizes, rooms, messages_per_room, rate, timeout=60, batch=False, codec='json'):
+    application = URLRouter(websocket_urlpatterns)
+    scenarios = []
+    next_user_id = 1
+    for room_size in room_sizes:
+        result, next_user_id = await run_scenario(
+            application, room_size, rooms, messages_per_room, rate, next_user_id, timeout, batch, codec
+        )
+        scenarios.append(result)
+    return {
+        'benchmark': 'ws_fanout',
+        'write_behind': settings.CHAT_WRITE_BEHIND,
+        'scenarios': scenarios,
+    }
+
+
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    def scenario_key(scenario):
+        return (scenario['room_size'], scenario['rooms'], scenario['messages_per_room'], scenario['rate'],
+                scenario.get('batch', False), scenario.get('codec', 'json'))
+
+    baseline_scenarios = {scenario_key(scenario): scenario for scenario in (baseline or {}).get('scenarios', [])}
+    for scenario in results['scenarios']:
+        key = scenario_key(scenario)
+        if scenario['delivered'] < scenario['expected_deliveries']:
+            regressions.append(
+                f"room_size={key[0]} delivered {scenario['delivered']} of {scenario['expected_deliveries']}"
+            )
+        previous = baseline_scenarios.get(key)
+        if previous is None:
+            continue
+        for name, higher_is_better in TRACKED_METRICS:
+            problem = compare_metrics(name, scenario.get(name), previous.get(name), higher_is_better, tolerance)
+            if problem:
+                regressions.append(f'room_size={key[0]} {problem}')
+    return regressions
@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from django.conf import settings
+
+
+class TTLCache:
+    """
+    프로세스 내부용 LRU 캐시. maxsize를 넘으면 가장 오래 사용하지 않은 항목부터 버리고,
+    ttl(초)이 지난 항목은 조회 시점에 만료된다. ttl이 None이면 만료 없이 LRU로만 동작한다.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl is not None and ttl <= 0:
+            self.delete(key)
+            return
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisTTLCache:
+    """
+    TTLCache와 같은 인터페이스의 Redis 기반 캐시. 여러 프로세스(gunicorn/daphne 워커)가 공유한다.
+    값은 JSON으로 저장되며, 만료는 키 TTL로, 용량 초과 시 제거는 Redis의 maxmemory-policy(allkeys-lru)에 맡긴다.
+    """
+
+    def __init__(self, url, prefix, ttl=None):
+        self.prefix = prefix
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url)
+
+    def _key(self, key):
+        return f'{self.prefix}:{key}'
+
+    def get(self, key, default=None):
+        value = self._client.get(self._key(key))
+        if value is None:
+            return default
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl is not None and ttl <= 0:
+            self.delete(key)
+            return
+        px = int(ttl * 1000) if ttl is not None else None
+        self._client.set(self._key(key), json.dumps(value), px=px)
+
+    def delete(self, key):
+        self._client.delete(self._key(key))
+
+    def clear(self):
+        keys = list(self._client.scan_iter(match=f'{self.prefix}:*'))
+        if keys:
+            self._client.delete(*keys)
+
+
+class SingleFlight:
+    """같은 key로 동시에 들어온 호출은 먼저 들어온 하나만 실행하고 나머지는 그 결과를 기다려 함께 받는다."""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+def make_cache(backend, prefix, maxsize, ttl=None):
+    if backend == 'redis':
+        return RedisTTLCache(settings.REDIS_URL, f'chat:{prefix}', ttl)
+    return TTLCache(maxsize, ttl)
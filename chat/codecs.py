@@ -0,0 +1,68 @@
+import json
+
+import msgpack
+
+from .cache import TTLCache
+
+# WebSocket 프레임 인코딩. 클라이언트가 'msgpack' subprotocol을 요청하면 바이너리 프레임을 쓰고, 기본은 JSON 텍스트다.
+
+
+class JsonCodec:
+    name = 'json'
+    binary = False
+
+    @staticmethod
+    def encode(content):
+        return json.dumps(content)
+
+    @staticmethod
+    def decode(data):
+        return json.loads(data)
+
+    @staticmethod
+    def join(encoded):
+        # 이미 인코딩된 프레임들을 다시 인코딩하지 않고 배열 프레임으로 묶는다
+        return '[' + ', '.join(encoded) + ']'
+
+
+class MsgpackCodec:
+    name = 'msgpack'
+    binary = True
+
+    @staticmethod
+    def encode(content):
+        return msgpack.packb(content, use_bin_type=True)
+
+    @staticmethod
+    def decode(data):
+        return msgpack.unpackb(data, raw=False)
+
+    @staticmethod
+    def join(encoded):
+        # msgpack 배열은 길이 헤더 뒤에 원소들을 이어 붙인 것과 같다
+        return msgpack.Packer().pack_array_header(len(encoded)) + b''.join(encoded)
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec, MsgpackCodec)}
+
+
+def negotiate(subprotocols):
+    """요청된 subprotocol 중 지원하는 첫 번째 codec과 accept에 돌려줄 subprotocol 이름. 없으면 JSON."""
+    for subprotocol in subprotocols or ():
+        codec = CODECS.get(subprotocol)
+        if codec is not None:
+            return codec, subprotocol
+    return JsonCodec, None
+
+
+# 같은 프로세스의 여러 수신 소켓이 같은 이벤트를 codec별로 한 번만 인코딩하도록 공유하는 캐시
+encoded_frames = TTLCache(maxsize=4096)
+
+
+def encode_shared(codec, key, content):
+    cache_key = (codec.name, key)
+    data = encoded_frames.get(cache_key)
+    if data is None:
+        data = codec.encode(content)
+        encoded_frames.set(cache_key, data)
+    return data
@@ -1,47 +1,606 @@
+import asyncio
 import logging
+import random
+import time
+from collections import deque
+from urllib.parse import parse_qs
 
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.db import database_sync_to_async
-from django.db import transaction
-from .models import ChatRoom, Message, User
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+from .backpressure import PROTOCOL_SCOPE_KEY, SLOW_CONSUMER_CLOSE_CODE, attach_write_gate
+from .codecs import JsonCodec, MsgpackCodec, encode_shared, negotiate
+from .db import db_writer
+from .drain import SERVICE_RESTART_CLOSE_CODE, drainer
+from .identity import get_user_identity, sender_payload, user_identity_cache
+from .metrics import (
+    active_sockets, ephemeral_events, group_send_seconds, observe_handler, outbound_batch_size, outbound_dropped,
+    throttled_events,
+)
+from .models import ChatRoom, User
+from .operations import invite_to_room, leave_room, post_message, room_participants, user_rooms
+from .pagination import decode_cursor, encode_cursor, message_cursor
+from .presence import presence
+from .replay import PENDING_MESSAGE_ID, frames_after, message_frame, recent_frames, recent_messages
+from .throttle import BucketSet, TokenBucket, parse_limits, sender_limiter
+from .writebehind import message_queue
 
 logger = logging.getLogger(__name__)
 
-class ChatConsumer(AsyncJsonWebsocketConsumer):
+# DB에 저장하지 않고 채널 레이어로만 전달하는 이벤트
+EPHEMERAL_TYPES = ('typing', 'read', 'presence')
+
+load_recent_frames = database_sync_to_async(recent_frames)
+load_frames_after = database_sync_to_async(frames_after)
+load_participants = database_sync_to_async(room_participants)
+load_user_rooms = database_sync_to_async(user_rooms)
+
+
+@database_sync_to_async
+def load_members_if_changed(room_id, known_version):
+    version = ChatRoom.objects.filter(id=room_id).values_list('membership_version', flat=True).get()
+    if version == known_version:
+        return version, None
+    participants, version = room_participants(room_id)
+    return version, participants
+
+
+class RoomMembers:
+    """소켓이 알고 있는 방 참가자 목록. membership_version이 바뀐 경우에만 DB에서 다시 읽는다."""
+
+    def __init__(self, room_id, participants, version):
+        self.room_id = room_id
+        self.set(participants, version)
+
+    def set(self, participants, version):
+        self.ids = {participant['travel_user_id'] for participant in participants}
+        self.version = version
+        self.checked_at = time.monotonic()
+
+    def mark_stale(self):
+        self.checked_at = None
+
+    def is_fresh(self):
+        return self.checked_at is not None and time.monotonic() - self.checked_at < settings.CHAT_MEMBERSHIP_TTL
+
+    def trusts(self, travel_user_id):
+        return self.is_fresh() and travel_user_id in self.ids
+
+    def update(self, participants, version):
+        if version is None:
+            # 버전 정보가 없는 이벤트는 신뢰할 수 없으므로 다음 확인 때 DB에서 다시 읽는다
+            self.mark_stale()
+        elif version >= self.version:
+            self.set(participants, version)
+
+    async def refresh(self):
+        # 버전이 바뀐 경우에만 참가자 목록을 다시 읽는다. 변경 여부를 반환한다.
+        version, participants = await load_members_if_changed(self.room_id, self.version)
+        if participants is None:
+            self.checked_at = time.monotonic()
+            return False
+        self.set(participants, version)
+        return True
+
+    async def contains(self, travel_user_id):
+        if not self.is_fresh():
+            await self.refresh()
+        if travel_user_id in self.ids:
+            return True
+        # REST API 등 소켓 밖에서 추가된 참가자일 수 있으므로 버전을 확인한다
+        if await self.refresh():
+            return travel_user_id in self.ids
+        return False
+
+
+class BaseChatConsumer(AsyncJsonWebsocketConsumer):
+    """
+    ChatConsumer와 UserConsumer가 공유하는 부분: 코덱·batch 송신, 메시지 저장과 방송, replay, ephemeral 이벤트.
+    self.rooms는 이 소켓이 구독 중인 방의 {room_id: RoomMembers}이다.
+    """
+    codec = JsonCodec
+    batch_frames = False
+    # True면 방에서 온 프레임마다 room_id를 붙인다
+    addressed = False
+    default_room_id = None
+
+    def setup_connection(self):
+        self.codec, subprotocol = negotiate(self.scope.get('subprotocols'))
+        # batch 모드에서는 모든 프레임이 송신 큐를 거쳐 순서대로 배열 프레임으로 묶인다
+        self.batch_frames = self.query_param('batch') in ('1', 'true')
+        self.outbox = deque()
+        self.outbox_bytes = 0
+        self.outbox_task = None
+        self.dropped_frames = 0
+        self.closing = False
+        # 송신 버퍼가 밀리면 프레임을 daphne 대신 outbox에 쌓고 CHAT_OUTBOX_MAX_BYTES로 제한한다
+        self.write_gate = attach_write_gate(self.scope.get(PROTOCOL_SCOPE_KEY))
+        self.rooms = {}
+        self.replayed_until = {}
+        self.rate_limits = parse_limits(settings.CHAT_RATE_LIMITS)
+        self.rate_buckets = BucketSet(self.rate_limits)
+        self.ephemeral_bucket = TokenBucket(settings.CHAT_EPHEMERAL_RATE, settings.CHAT_EPHEMERAL_BURST)
+        self.ephemeral_pending = {}
+        self.ephemeral_sent = {}
+        self.ephemeral_task = None
+        self.presence_user_id = None
+        drainer.register(self)
+        return subprotocol
+
+    def release_connection(self):
+        drainer.unregister(self)
+        if self.ephemeral_task is not None:
+            self.ephemeral_task.cancel()
+        if self.outbox_task is not None:
+            self.outbox_task.cancel()
+
+    async def drain(self):
+        # 워커 재시작: 클라이언트는 retry_after초 뒤 마지막 cursor를 last_seen으로 주고 다시 접속한다
+        await self.send_json({
+            'type': 'reconnect',
+            'retry_after': round(random.uniform(0, settings.CHAT_RECONNECT_JITTER), 2)
+        }, close=SERVICE_RESTART_CLOSE_CODE)
+
+    def event_room(self, event):
+        # 이미 구독을 해제한 방의 이벤트가 늦게 도착할 수 있다
+        room_id = event.get('room_id', self.default_room_id)
+        return room_id if room_id in self.rooms else None
+
+    async def publish_message(self, room_id, sender_id, text):
+        """메시지를 저장(또는 write-behind 큐에 추가)하고 방에 방송한다. 참가자가 아니면 False."""
+        members = self.rooms[room_id]
+        if settings.CHAT_WRITE_BEHIND:
+            if not await members.contains(sender_id):
+                return False
+            message_obj, sender = await self.enqueue_message(room_id, sender_id, text)
+            cursor = encode_cursor(message_obj.timestamp, PENDING_MESSAGE_ID)
+        else:
+            # 캐시로 참가자임이 확실하면 확인 없이 저장하고, 아니면 확인과 저장을 한 번에 처리한다
+            saved = await db_writer.run(
+                post_message, room_id, sender_id, text, check_membership=not members.trusts(sender_id)
+            )
+            if saved is None:
+                return False
+            message_obj, sender = saved
+            cursor = message_cursor(message_obj)
+        await self.group_send(
+            f'chat_{room_id}',
+            {
+                'type': 'chat_message',
+                'room_id': room_id,
+                'message': text,
+                'sender_id': sender_id,
+                'sender': sender,
+                'timestamp': message_obj.timestamp.isoformat(),
+                'cursor': cursor
+            }
+        )
+        return True
+
+    async def group_send(self, group, event):
+        started = time.perf_counter()
+        # 수신 측에서 늦게 도착한 이벤트를 가려낼 수 있도록 보낸 시각을 붙인다
+        await self.channel_layer.group_send(group, {**event, 'sent_at': time.time()})
+        group_send_seconds.observe(time.perf_counter() - started, event=event['type'])
+
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        if text_data:
+            content = JsonCodec.decode(text_data)
+        elif bytes_data and self.codec is MsgpackCodec:
+            content = MsgpackCodec.decode(bytes_data)
+        else:
+            raise ValueError('Unsupported WebSocket frame for negotiated codec')
+        await self.receive_json(content, **kwargs)
+
+    async def send_json(self, content, close=False):
+        await self.send_encoded(self.codec.encode(content), close)
+
+    async def send_room_frame(self, room_id, frame, shared_key=None):
+        if self.addressed:
+            frame = {'type': frame['type'], 'room_id': room_id, **frame}
+        if shared_key is None:
+            await self.send_json(frame)
+        else:
+            # 같은 이벤트를 받는 이 프로세스의 다른 소켓들과 인코딩 결과를 공유한다
+            await self.send_encoded(encode_shared(self.codec, (self.addressed, *shared_key), frame))
+
+    def writable(self):
+        return self.write_gate is None or self.write_gate.writable
+
+    async def send_encoded(self, data, close=False):
+        # data는 self.codec으로 인코딩된 프레임 하나
+        if self.closing:
+            return
+        if close:
+            await self.flush_outbox()
+            await self.send_data(data, close)
+            return
+        if not self.batch_frames and not self.outbox and self.writable():
+            await self.send_data(data)
+            return
+
+        self.outbox.append(data)
+        self.outbox_bytes += len(data)
+        if self.outbox_bytes > settings.CHAT_OUTBOX_MAX_BYTES:
+            await self.shed_outbox()
+        elif self.batch_frames and len(self.outbox) >= settings.CHAT_BATCH_MAX_FRAMES and self.writable():
+            await self.flush_outbox()
+        elif self.outbox_task is None:
+            self.outbox_task = asyncio.ensure_future(self.flush_outbox_later())
+
+    async def shed_outbox(self):
+        consumer = type(self).__name__
+        if settings.CHAT_SLOW_CONSUMER_POLICY == 'disconnect':
+            outbound_dropped.inc(len(self.outbox), consumer=consumer, reason='disconnect')
+            self.outbox.clear()
+            self.outbox_bytes = 0
+            logger.info('Closing slow WebSocket %s', self.channel_name)
+            await self.close(code=SLOW_CONSUMER_CLOSE_CODE)
+            self.closing = True
+            return
+
+        dropped = 0
+        while self.outbox_bytes > settings.CHAT_OUTBOX_MAX_BYTES and self.outbox:
+            self.outbox_bytes -= len(self.outbox.popleft())
+            dropped += 1
+        self.dropped_frames += dropped
+        outbound_dropped.inc(dropped, consumer=consumer, reason='overflow')
+        if self.outbox_task is None:
+            self.outbox_task = asyncio.ensure_future(self.flush_outbox_later())
+
+    async def flush_outbox_later(self):
+        if self.batch_frames:
+            await asyncio.sleep(settings.CHAT_BATCH_WINDOW)
+        if self.write_gate is not None:
+            await self.write_gate.wait()
+        self.outbox_task = None
+        await self.flush_outbox()
+
+    async def flush_outbox(self):
+        if self.outbox_task is not None:
+            self.outbox_task.cancel()
+            self.outbox_task = None
+        frames, self.outbox = list(self.outbox), deque()
+        self.outbox_bytes = 0
+        if self.dropped_frames:
+            # 클라이언트는 마지막으로 받은 cursor 이후를 REST API(after=)로 다시 읽는다
+            await self.send_data(self.codec.encode({'type': 'dropped', 'count': self.dropped_frames}))
+            self.dropped_frames = 0
+        if not self.batch_frames:
+            for frame in frames:
+                await self.send_data(frame)
+            return
+        for start in range(0, len(frames), settings.CHAT_BATCH_MAX_FRAMES):
+            chunk = frames[start:start + settings.CHAT_BATCH_MAX_FRAMES]
+            outbound_batch_size.observe(len(chunk), consumer=type(self).__name__)
+            await self.send_data(self.codec.join(chunk))
+
+    async def send_data(self, data, close=False):
+        if self.codec.binary:
+            await self.send(bytes_data=data, close=close)
+        else:
+            await self.send(text_data=data, close=close)
+
+    async def replay(self, room_id, last_seen):
+        try:
+            after = decode_cursor(last_seen)
+        except ValidationError:
+            await self.send_json({'error': '올바르지 않은 cursor 값입니다.'})
+            return
+
+        if settings.CHAT_WRITE_BEHIND:
+            await message_queue.flush()
+        await recent_messages.ensure_seeded(room_id, lambda limit: load_recent_frames(room_id, limit))
+        frames = recent_messages.since(room_id, after)
+        complete = True
+        if frames is None:
+            # 버퍼보다 오래된 cursor는 DB에서 읽는다. 너무 많으면 나머지는 REST(after=)로 받도록 complete=False
+            frames, more = await load_frames_after(room_id, after, settings.CHAT_REPLAY_LIMIT)
+            complete = not more
+        if frames:
+            self.replayed_until[room_id] = decode_cursor(frames[-1]['cursor'])
+        await self.send_room_frame(room_id, {
+            'type': 'replay',
+            'messages': frames,
+            'complete': complete
+        })
+
+    def sender_of(self, content):
+        raise NotImplementedError
+
+    async def allow(self, kind, content):
+        """소켓별, 발신자별 버킷을 모두 통과해야 처리한다. 막힌 프레임은 DB나 채널 레이어에 닿기 전에 거절한다."""
+        limit = self.rate_limits.get(kind)
+        if limit is None:
+            return True
+        sender_id = self.sender_of(content)
+        if not self.rate_buckets.allow(kind):
+            scope = 'connection'
+        elif sender_id is not None and not await sender_limiter.allow(kind, sender_id, limit):
+            scope = 'sender'
+        else:
+            return True
+        throttled_events.inc(kind=kind, scope=scope)
+        await self.send_json({
+            'error': '요청이 너무 많습니다. 잠시 후 다시 시도하세요.'
+        })
+        return False
+
+    async def handle_ephemeral(self, room_id, kind, content):
+        if not self.ephemeral_bucket.allow():
+            ephemeral_events.inc(kind=kind, outcome='rate_limited')
+            return
+
+        if kind == 'presence':
+            # heartbeat: ttl 안에 다시 보내지 않으면 offline으로 바뀐다
+            if self.presence_user_id is not None:
+                await asyncio.gather(*(
+                    presence.touch(room_id, self.channel_name, self.presence_user_id) for room_id in self.rooms
+                ))
+            return
+
+        sender_id = self.sender_of(content)
+        members = self.rooms.get(room_id)
+        if sender_id is None or members is None or not await members.contains(sender_id):
+            await self.send_not_participant()
+            return
+
+        if kind == 'typing':
+            value = bool(content.get('typing', True))
+        else:
+            value = content.get('cursor')
+            try:
+                decode_cursor(value or '')
+            except ValidationError:
+                await self.send_json({'error': '올바르지 않은 cursor 값입니다.'})
+                return
+        self.queue_ephemeral(room_id, kind, sender_id, value)
+
+    def queue_ephemeral(self, room_id, kind, sender_id, value):
+        key = (room_id, kind, sender_id)
+        last = self.ephemeral_sent.get(key)
+        if last is not None and last[0] == value and time.monotonic() - last[1] < settings.CHAT_EPHEMERAL_REPEAT:
+            ephemeral_events.inc(kind=kind, outcome='coalesced')
+            return
+        if key in self.ephemeral_pending:
+            ephemeral_events.inc(kind=kind, outcome='coalesced')
+        # 창 안에서 같은 방, 같은 발신자의 같은 종류 이벤트는 마지막 값만 보낸다
+        self.ephemeral_pending[key] = value
+        if self.ephemeral_task is None:
+            self.ephemeral_task = asyncio.ensure_future(self.flush_ephemeral_later())
+
+    async def flush_ephemeral_later(self):
+        await asyncio.sleep(settings.CHAT_EPHEMERAL_WINDOW)
+        self.ephemeral_task = None
+        pending, self.ephemeral_pending = self.ephemeral_pending, {}
+        now = time.monotonic()
+        events_by_room = {}
+        for (room_id, kind, sender_id), value in pending.items():
+            self.ephemeral_sent[(room_id, kind, sender_id)] = (value, now)
+            events_by_room.setdefault(room_id, []).append([kind, sender_id, value])
+            ephemeral_events.inc(kind=kind, outcome='sent')
+        for room_id, events in events_by_room.items():
+            await self.group_send(f'chat_{room_id}', {'type': 'ephemeral', 'room_id': room_id, 'events': events})
+
+    async def join_presence(self, room_id):
+        """presence_user_id로 방에 접속을 등록하고 방의 online 목록을 반환한다."""
+        if await presence.join(room_id, self.channel_name, self.presence_user_id):
+            await self.group_send(f'chat_{room_id}', {
+                'type': 'ephemeral', 'room_id': room_id, 'events': [['presence', self.presence_user_id, True]]
+            })
+        return await presence.online(room_id)
+
+    async def leave_presence(self, room_id):
+        if await presence.leave(room_id, self.channel_name, self.presence_user_id):
+            await self.group_send(f'chat_{room_id}', {
+                'type': 'ephemeral', 'room_id': room_id, 'events': [['presence', self.presence_user_id, False]]
+            })
+
+    async def send_not_participant(self):
+        await self.send_json({
+            'error': '채팅방 참가자만 메시지를 보낼 수 있습니다.'
+        })
+
+    async def announce_participants(self, room_id, participants, version):
+        await self.group_send(
+            f'chat_{room_id}',
+            {
+                'type': 'participants_update',
+                'room_id': room_id,
+                'participants': participants,
+                'version': version
+            }
+        )
+
+    async def leave(self, room_id, travel_user_id):
+        try:
+            participants, version = await db_writer.run(leave_room, room_id, travel_user_id)
+        except (User.DoesNotExist, TypeError, ValueError):
+            await self.send_json({'error': '존재하지 않는 사용자입니다.'})
+            return False
+        await self.announce_participants(room_id, participants, version)
+
+        await self.group_send(
+            f'chat_{room_id}',
+            {
+                'type': 'room_update',
+                'room_id': room_id
+            }
+        )
+
+        await self.send_json({
+            'type': 'left',
+            'room_id': room_id
+        })
+        return True
+
+    async def invite(self, room_id, travel_user_id):
+        try:
+            participants, version = await db_writer.run(invite_to_room, room_id, travel_user_id)
+        except (User.DoesNotExist, TypeError, ValueError):
+            await self.send_json({'error': '존재하지 않는 사용자입니다.'})
+            return
+        await self.announce_participants(room_id, participants, version)
+
+        await self.group_send(
+            f'user_{travel_user_id}',
+            {
+                'type': 'room_update',
+                'room_id': room_id
+            }
+        )
+
+        logger.info(f'Sending room_update to user_{travel_user_id} with room_id {room_id}')
+
+        await self.send_json({
+            'type': 'invite',
+            'room_id': room_id
+        })
+
+    @observe_handler('chat_message')
+    async def chat_message(self, event):
+        room_id = self.event_room(event)
+        if room_id is None:
+            return
+        message = event['message']
+        sender_id = event['sender_id']
+        timestamp = event['timestamp']
+        # 발신 측에서 한 번만 조회한 sender 정보를 그대로 사용한다 (수신자마다 DB 조회하지 않음)
+        sender = event.get('sender') or {'travel_user_id': sender_id}
+        frame = message_frame(message, sender, timestamp, event.get('cursor'))
+
+        if frame['cursor']:
+            recent_messages.add(room_id, frame)
+            replayed_until = self.replayed_until.get(room_id)
+            if replayed_until is not None:
+                # replay에 이미 포함된 메시지는 다시 보내지 않는다
+                if decode_cursor(frame['cursor']) <= replayed_until:
+                    return
+                del self.replayed_until[room_id]
+            await self.send_room_frame(room_id, frame, ('message', room_id, frame['cursor']))
+        else:
+            await self.send_room_frame(room_id, frame)
+
+    async def participants_update(self, event):
+        room_id = self.event_room(event)
+        if room_id is None:
+            return
+        participants = event['participants']
+        version = event.get('version')
+        self.rooms[room_id].update(participants, version)
+
+        frame = {
+            'type': 'participants',
+            'participants': participants
+        }
+        await self.send_room_frame(room_id, frame, None if version is None else ('participants', room_id, version))
+
+    async def ephemeral(self, event):
+        room_id = self.event_room(event)
+        if room_id is None:
+            return
+        sent_at = event.get('sent_at')
+        if sent_at is not None and time.time() - sent_at > settings.CHAT_EPHEMERAL_MAX_AGE:
+            # 이미 의미가 없어진 typing/read/presence는 보내지 않는다
+            outbound_dropped.inc(consumer=type(self).__name__, reason='expired')
+            return
+        # [종류, travel_user_id, 값] 목록. 자기 자신의 이벤트는 돌려보내지 않는다
+        events = [item for item in event['events'] if item[1] != self.presence_user_id]
+        if events:
+            await self.send_room_frame(room_id, {
+                'type': 'ephemeral',
+                'events': events
+            })
+
+    @staticmethod
+    def normalize_id(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    async def enqueue_message(self, room_id, sender_id, message_text):
+        identity = user_identity_cache.get(sender_id)
+        if identity is None:
+            identity = await database_sync_to_async(get_user_identity)(sender_id)
+        message = message_queue.enqueue(room_id, identity, message_text)
+        return message, sender_payload(identity)
+
+    def query_param(self, name):
+        values = parse_qs(self.scope.get('query_string', b'').decode()).get(name)
+        return values[0] if values else None
+
+
+class ChatConsumer(BaseChatConsumer):
+    @observe_handler('connect')
     async def connect(self):
+        active_sockets.inc(consumer='ChatConsumer')
+        subprotocol = self.setup_connection()
         self.room_id = self.scope['url_route']['kwargs']['room_id']
         self.room_group_name = f'chat_{self.room_id}'
+        self.default_room_id = self.room_id
+        recent_messages.attach(self.room_id)
+        if drainer.draining:
+            # 종료 중인 워커다. 클라이언트는 같은 포트의 다른 워커로 다시 접속한다
+            await self.close()
+            return
 
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
 
-        await self.accept()
+        await self.accept(subprotocol)
 
-        participants = await self.get_participants()
+        participants, version = await load_participants(self.room_id)
+        self.members = self.rooms[self.room_id] = RoomMembers(self.room_id, participants, version)
         await self.send_json({
             'type': 'participants',
             'participants': participants
         })
 
+        # ?travel_user_id=로 접속한 사용자는 presence에 등록하고 현재 online 목록을 받는다
+        travel_user_id = self.normalize_id(self.query_param('travel_user_id'))
+        if travel_user_id is not None and travel_user_id in self.members.ids:
+            self.presence_user_id = travel_user_id
+            await self.send_json({
+                'type': 'presence',
+                'online': await self.join_presence(self.room_id)
+            })
+
+        # 재접속한 클라이언트가 마지막으로 받은 메시지의 cursor를 주면 놓친 메시지만 다시 보낸다
+        last_seen = self.query_param('last_seen')
+        if last_seen:
+            await self.replay(self.room_id, last_seen)
+
     async def disconnect(self, close_code):
+        active_sockets.dec(consumer='ChatConsumer')
+        recent_messages.detach(self.room_id)
+        self.release_connection()
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        if self.presence_user_id is not None:
+            await self.leave_presence(self.room_id)
 
+    @observe_handler('receive_json')
     async def receive_json(self, content):
-        sender_id = content.get('sender_id')
         type = content.get('type', 'message')
+        if not await self.allow(type, content):
+            return
 
         if type == 'message':
             await self.handle_message(content)
         elif type == 'leave':
-            await self.handle_leave(content)
+            await self.leave(self.room_id, content.get('sender_id'))
         elif type == 'invite':
-            await self.handle_invite(content)
+            await self.invite(self.room_id, content.get('travel_user_id'))
+        elif type in EPHEMERAL_TYPES:
+            await self.handle_ephemeral(self.room_id, type, content)
 
+    @observe_handler('handle_message')
     async def handle_message(self, content):
         sender_id = content.get('sender_id')
         message = content.get('message')
@@ -51,145 +610,178 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             })
             return
 
-        if not await self.is_participant(self.room_id, sender_id):
-            await self.send_json({
-                'error': '채팅방 참가자만 메시지를 보낼 수 있습니다.'
-            })
-            return
+        sender_id = self.normalize_id(sender_id)
+        if sender_id is None or not await self.publish_message(self.room_id, sender_id, message):
+            await self.send_not_participant()
 
-        timestamp = await self.save_message(self.room_id, sender_id, message)
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'chat_message',
-                'message': message,
-                'sender_id': sender_id,
-                'timestamp': timestamp
-            }
-        )
-
-    async def handle_leave(self, content):
-        sender_id = content.get('sender_id')
-        user = await self.get_user_by_travel_user_id(sender_id)
-        await self.remove_user_from_room(self.room_id, user)
-        participants = await self.get_participants()
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'participants_update',
-                'participants': participants
-            }
-        )
-
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'room_update',
-                'room_id': self.room_id
-            }
-        )
+    def sender_of(self, content):
+        return self.normalize_id(content.get('sender_id', self.presence_user_id))
 
+    async def room_update(self, event):
+        room_id = event['room_id']
+        self.members.mark_stale()
         await self.send_json({
-            'type': 'left',
-            'room_id': self.room_id
+            'type': 'room_update',
+            'room_id': room_id
         })
 
-    async def handle_invite(self, content):
-        travel_user_id = content.get('travel_user_id')
-        user = await self.get_user_by_travel_user_id(travel_user_id)
-        room = await self.get_room(self.room_id)
-        await self.add_user_to_room(room, user)
-        participants = await self.get_participants()
 
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'participants_update',
-                'participants': participants
-            }
-        )
+class UserConsumer(BaseChatConsumer):
+    """
+    사용자 한 명이 참가한 모든 방을 소켓 하나로 주고받는다 (ws/user/<travel_user_id>/).
+    방에서 온 프레임에는 room_id가 붙고, 클라이언트가 보내는 프레임도 room_id로 방을 지정한다. 발신자는 항상 접속한 사용자다.
+    초대되거나 REST API로 추가된 방은 user_<travel_user_id> 그룹의 room_update를 받아 자동으로 구독한다.
+    """
+    addressed = True
 
-        await self.channel_layer.group_send(
-            f'user_{travel_user_id}',
-            {
-                'type': 'room_update',
-                'room_id': self.room_id
-            }
+    @observe_handler('connect')
+    async def connect(self):
+        active_sockets.inc(consumer='UserConsumer')
+        subprotocol = self.setup_connection()
+        self.travel_user_id = self.scope['url_route']['kwargs']['travel_user_id']
+        self.user_group_name = f'user_{self.travel_user_id}'
+        self.presence_user_id = self.travel_user_id
+        if drainer.draining:
+            # 종료 중인 워커다. 클라이언트는 같은 포트의 다른 워커로 다시 접속한다
+            await self.close()
+            return
+
+        rooms = await load_user_rooms(self.travel_user_id)
+        await asyncio.gather(
+            self.channel_layer.group_add(self.user_group_name, self.channel_name),
+            *(self.subscribe(room_id, participants, version) for room_id, (participants, version) in rooms.items())
         )
 
-        logger.info(f'Sending room_update to user_{travel_user_id} with room_id {self.room_id}')
+        await self.accept(subprotocol)
+        await self.send_rooms(rooms)
+
+    async def disconnect(self, close_code):
+        active_sockets.dec(consumer='UserConsumer')
+        self.release_connection()
+        await asyncio.gather(
+            self.channel_layer.group_discard(self.user_group_name, self.channel_name),
+            *(self.unsubscribe(room_id) for room_id in list(self.rooms))
+        )
 
+    async def subscribe(self, room_id, participants, version):
+        self.rooms[room_id] = RoomMembers(room_id, participants, version)
+        recent_messages.attach(room_id)
+        await self.channel_layer.group_add(f'chat_{room_id}', self.channel_name)
+
+    async def unsubscribe(self, room_id):
+        if self.rooms.pop(room_id, None) is None:
+            return False
+        recent_messages.detach(room_id)
+        self.replayed_until.pop(room_id, None)
+        await self.channel_layer.group_discard(f'chat_{room_id}', self.channel_name)
+        await self.leave_presence(room_id)
+        return True
+
+    async def send_rooms(self, rooms):
+        # 구독한 방마다 참가자 목록과 online 목록을 한 프레임으로 보낸다
+        online = await asyncio.gather(*(self.join_presence(room_id) for room_id in rooms))
         await self.send_json({
-            'type': 'invite',
-            'room_id': self.room_id
+            'type': 'rooms',
+            'rooms': [
+                {'room_id': room_id, 'participants': participants, 'online': room_online}
+                for (room_id, (participants, _)), room_online in zip(rooms.items(), online)
+            ]
         })
 
-    async def chat_message(self, event):
-        message = event['message']
-        sender_id = event['sender_id']
-        timestamp = event['timestamp']
+    @observe_handler('receive_json')
+    async def receive_json(self, content):
+        type = content.get('type', 'message')
+        if not await self.allow(type, content):
+            return
+        room_id = self.normalize_id(content.get('room_id'))
 
-        sender = await self.get_user_by_travel_user_id(sender_id)
+        if type == 'subscribe':
+            await self.handle_subscribe(room_id)
+        elif type == 'presence':
+            await self.handle_ephemeral(room_id, type, content)
+        elif room_id not in self.rooms:
+            await self.send_json({
+                'error': '구독 중인 채팅방의 room_id가 필요합니다.'
+            })
+        elif type == 'message':
+            await self.handle_message(room_id, content)
+        elif type == 'unsubscribe':
+            await self.unsubscribe(room_id)
+            await self.send_json({
+                'type': 'unsubscribed',
+                'room_id': room_id
+            })
+        elif type == 'leave':
+            if await self.leave(room_id, self.travel_user_id):
+                await self.unsubscribe(room_id)
+        elif type == 'invite':
+            await self.invite(room_id, content.get('travel_user_id'))
+        elif type == 'replay':
+            await self.replay(room_id, content.get('last_seen') or '')
+        elif type in EPHEMERAL_TYPES:
+            await self.handle_ephemeral(room_id, type, content)
+
+    @observe_handler('handle_message')
+    async def handle_message(self, room_id, content):
+        message = content.get('message')
+        if not message:
+            await self.send_json({
+                'error': 'message는 필수입니다.'
+            })
+            return
 
-        await self.send_json({
-            'type': 'message',
-            'message': message,
-            'sender': {'travel_user_id': sender.travel_user_id},
-            'timestamp': timestamp
-        })
+        if not await self.publish_message(room_id, self.travel_user_id, message):
+            # 소켓 밖에서 방을 나간 경우
+            await self.unsubscribe(room_id)
+            await self.send_not_participant()
 
-    async def participants_update(self, event):
-        participants = event['participants']
+    def sender_of(self, content):
+        return self.travel_user_id
 
-        await self.send_json({
-            'type': 'participants',
-            'participants': participants
-        })
+    async def handle_subscribe(self, room_id):
+        if room_id is None:
+            await self.send_json({'error': 'room_id가 필요합니다.'})
+            return
+        if room_id not in self.rooms and not await self.sync_room(room_id):
+            await self.send_not_participant()
+
+    async def sync_room(self, room_id):
+        """DB의 참가자 목록에 맞춰 방을 구독하거나 구독을 해제한다. 구독 중이면 True."""
+        try:
+            participants, version = await load_participants(room_id)
+        except ChatRoom.DoesNotExist:
+            participants, version = [], None
+        is_member = any(participant['travel_user_id'] == self.travel_user_id for participant in participants)
+        if not is_member:
+            await self.unsubscribe(room_id)
+            return False
+        if room_id in self.rooms:
+            self.rooms[room_id].update(participants, version)
+        else:
+            await self.subscribe(room_id, participants, version)
+            await self.send_rooms({room_id: (participants, version)})
+        return True
+
+    async def participants_update(self, event):
+        await super().participants_update(event)
+        room_id = self.event_room(event)
+        if room_id is not None and event.get('version') is not None \
+                and self.travel_user_id not in self.rooms[room_id].ids:
+            # 다른 소켓이나 REST API로 방을 나갔다
+            await self.unsubscribe(room_id)
 
     async def room_update(self, event):
         room_id = event['room_id']
+        if room_id in self.rooms:
+            self.rooms[room_id].mark_stale()
+        else:
+            # 초대받은 방: 구독을 추가한다
+            await self.sync_room(room_id)
         await self.send_json({
             'type': 'room_update',
             'room_id': room_id
         })
 
-    @database_sync_to_async
-    def save_message(self, room_id, sender_id, message_text):
-        room = ChatRoom.objects.get(id=room_id)
-        sender = User.objects.get(travel_user_id=sender_id)
-        message = Message.objects.create(room=room, sender=sender, text=message_text)
-        return message.timestamp.isoformat()
-
-    @database_sync_to_async
-    def get_user_by_travel_user_id(self, travel_user_id):
-        return User.objects.get(travel_user_id=travel_user_id)
-
-    @database_sync_to_async
-    def get_room(self, room_id):
-        return ChatRoom.objects.get(id=room_id)
-
-    @database_sync_to_async
-    def get_participants(self):
-        room = ChatRoom.objects.get(id=self.room_id)
-        participants = [{'travel_user_id': user.travel_user_id} for user in room.users.all()]
-        return participants
-
-    @database_sync_to_async
-    @transaction.atomic
-    def remove_user_from_room(self, room_id, user):
-        room = ChatRoom.objects.get(id=room_id)
-        room.users.remove(user)
-
-    @database_sync_to_async
-    @transaction.atomic
-    def add_user_to_room(self, room, user):
-        room.users.add(user)
-
-    @database_sync_to_async
-    def is_participant(self, room_id, travel_user_id):
-        room = ChatRoom.objects.get(id=room_id)
-        return room.users.filter(travel_user_id=travel_user_id).exists()
-
 
 # class FriendConsumer(AsyncJsonWebsocketConsumer):
 #     async def connect(self):
@@ -0,0 +1,75 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections, connection
+from django.db.utils import OperationalError
+
+from .metrics import GaugeCollector, registry
+
+
+class LockWaitStats:
+    """SQLite 쓰기 잠금(BEGIN IMMEDIATE)을 얻기까지 기다린 시간과 잠금 실패 횟수."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.locked_errors = 0
+
+    def record(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def record_locked(self):
+        with self._lock:
+            self.locked_errors += 1
+
+    def stats(self):
+        return {
+            'count': self.count,
+            'total_seconds': self.total_seconds,
+            'max_seconds': self.max_seconds,
+            'locked_errors': self.locked_errors,
+        }
+
+
+lock_wait_stats = LockWaitStats()
+
+registry.register(GaugeCollector(
+    'chat_sqlite_lock_wait', 'SQLite write lock wait statistics.',
+    lambda: {(name,): value for name, value in lock_wait_stats.stats().items()}, ['stat'],
+))
+
+
+class SerializedWriter:
+    """
+    비동기 consumer의 쓰기 작업을 전용 스레드 하나에서 순서대로 실행한다.
+    같은 프로세스 안의 쓰기끼리는 SQLite 잠금을 다투지 않고, 읽기(database_sync_to_async)는 이 큐 뒤에서 기다리지 않는다.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-writer')
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._call, fn, *args, **kwargs))
+
+    def _call(self, fn, *args, **kwargs):
+        close_old_connections()
+        connection.immediate_transactions = True
+        try:
+            return fn(*args, **kwargs)
+        except OperationalError as e:
+            if 'locked' in str(e):
+                lock_wait_stats.record_locked()
+            raise
+        finally:
+            close_old_connections()
+
+
+db_writer = SerializedWriter()
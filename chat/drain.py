@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import os
+import signal
+import time
+import weakref
+
+from django.conf import settings
+
+from .writebehind import message_queue
+
+logger = logging.getLogger(__name__)
+
+# 재접속 안내 후 소켓을 닫을 때의 close code (RFC 6455 1012 Service Restart)
+SERVICE_RESTART_CLOSE_CODE = 1012
+
+
+class Drainer:
+    """
+    ASGI 워커 프로세스의 graceful drain. SIGUSR1을 받으면
+    1) listen 포트를 닫아 새 접속을 받지 않고 (같은 포트의 다른 워커가 받는다)
+    2) 열린 소켓마다 {'type': 'reconnect'}를 보내고 1012로 닫은 뒤
+    3) disconnect 처리(presence, group_discard)를 CHAT_DRAIN_TIMEOUT까지 기다리고
+    4) write-behind 큐를 저장한 다음 SIGTERM으로 daphne를 종료한다.
+    """
+
+    def __init__(self):
+        self.sockets = weakref.WeakSet()
+        self.draining = False
+
+    def register(self, consumer):
+        self.sockets.add(consumer)
+
+    def unregister(self, consumer):
+        self.sockets.discard(consumer)
+
+    def install(self, signum=signal.SIGUSR1):
+        signal.signal(signum, self._on_signal)
+
+    def _on_signal(self, signum, frame):
+        # daphne가 설치한 asyncio reactor에서 실행한다. reactor는 여기서 처음 import해야 기본 reactor가 설치되지 않는다
+        from twisted.internet import reactor
+        reactor.callFromThread(lambda: asyncio.ensure_future(self.drain()))
+
+    @staticmethod
+    def stop_listening():
+        from twisted.internet import reactor, tcp
+        for reader in reactor.getReaders():
+            if isinstance(reader, tcp.Port):
+                reader.stopListening()
+
+    async def drain(self):
+        if self.draining:
+            return
+        self.draining = True
+        self.stop_listening()
+
+        sockets = list(self.sockets)
+        logger.info('Draining %d WebSocket connections', len(sockets))
+        await asyncio.gather(*(consumer.drain() for consumer in sockets), return_exceptions=True)
+        deadline = time.monotonic() + settings.CHAT_DRAIN_TIMEOUT
+        while self.sockets and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        await message_queue.flush()
+        logger.info('Drain finished with %d connections left, stopping worker', len(self.sockets))
+        os.kill(os.getpid(), signal.SIGTERM)
+
+
+drainer = Drainer()
@@ -0,0 +1,41 @@
+from django.conf import settings
+
+from .cache import SingleFlight, make_cache
+from .upstream import get_friends
+
+# travel_user_id -> accept 상태인 친구 travelUserId 목록(정렬된 list)
+friend_cache = make_cache(
+    settings.CHAT_FRIEND_CACHE_BACKEND, 'friends', settings.CHAT_FRIEND_CACHE_SIZE, settings.CHAT_FRIEND_CACHE_TTL
+)
+_friend_fetches = SingleFlight()
+
+
+def invalidate_friends(travel_user_id):
+    friend_cache.delete(travel_user_id)
+
+
+def accepted_friend_ids(travel_user_id, cookie, refresh=False):
+    """
+    (친구 id frozenset, 캐시 사용 여부)를 반환한다. 업스트림 호출이 실패하면 get_friends의 error dict를 그대로 반환한다.
+    같은 사용자에 대한 동시 요청은 업스트림을 한 번만 호출한다.
+    """
+    if not refresh:
+        cached = friend_cache.get(travel_user_id)
+        if cached is not None:
+            return frozenset(cached), True
+
+    def fetch():
+        friends = get_friends(cookie)
+        if isinstance(friends, dict):
+            return friends
+        friend_ids = sorted({
+            friend['friendTravelUserDto']['travelUserId'] for friend in friends
+            if friend['friendStatus'] == 'acceptance'
+        })
+        friend_cache.set(travel_user_id, friend_ids)
+        return friend_ids
+
+    result = _friend_fetches.do(travel_user_id, fetch)
+    if isinstance(result, dict):
+        return result
+    return frozenset(result), False
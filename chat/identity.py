@@ -0,0 +1,21 @@
+from django.conf import settings
+
+from .cache import TTLCache
+from .models import User
+
+# travel_user_id -> {'id', 'travel_user_id'}; 팬아웃/저장 경로에서 User 조회를 반복하지 않기 위한 프로세스 캐시
+user_identity_cache = TTLCache(settings.CHAT_IDENTITY_CACHE_SIZE, settings.CHAT_IDENTITY_CACHE_TTL)
+
+
+def get_user_identity(travel_user_id):
+    travel_user_id = int(travel_user_id)
+    identity = user_identity_cache.get(travel_user_id)
+    if identity is None:
+        user = User.objects.only('id', 'travel_user_id').get(travel_user_id=travel_user_id)
+        identity = {'id': user.id, 'travel_user_id': user.travel_user_id}
+        user_identity_cache.set(travel_user_id, identity)
+    return identity
+
+
+def sender_payload(identity):
+    return {'travel_user_id': identity['travel_user_id']}
@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
+from channels.exceptions import ChannelFull
+from channels_redis.core import RedisChannelLayer
+
+from .metrics import layer_deliveries
+
+logger = logging.getLogger(__name__)
+
+# channels_redis의 group_send와 같은 스크립트: 키(프로세스)마다 메시지 하나를 용량 안에서만 넣는다
+_GROUP_SEND_SCRIPT = """
+local over_capacity = 0
+local current_time = ARGV[#ARGV - 1]
+local expiry = ARGV[#ARGV]
+for i = 1, #KEYS do
+    if redis.call('ZCOUNT', KEYS[i], '-inf', '+inf') < tonumber(ARGV[i + #KEYS]) then
+        redis.call('ZADD', KEYS[i], current_time, ARGV[i])
+        redis.call('EXPIRE', KEYS[i], expiry)
+    else
+        over_capacity = over_capacity + 1
+    end
+end
+return over_capacity
+"""
+
+
+class HybridChannelLayer(RedisChannelLayer):
+    """
+    같은 프로세스의 소켓에는 Redis를 거치지 않고 바로 전달하는 RedisChannelLayer.
+
+    그룹 멤버십은 그대로 Redis에 두고(다른 daphne 프로세스의 group_send도 보므로), group_send는 멤버 목록에서
+    이 레이어가 만든 채널(client_prefix가 같은 채널)을 골라 수신 버퍼에 직접 넣는다. 다른 프로세스의 채널에만
+    기존과 같은 형식으로 직렬화해 Redis에 쓴다. 그래서 모든 수신자가 이 프로세스에 있으면 Lua 전송, 직렬화,
+    수신 측 BRPOP이 모두 생략된다.
+
+    수신 버퍼는 receive()가 직접 기다린다. 이 프로세스로 온 Redis 메시지는 레이어마다 하나인 읽기 작업이
+    BRPOP으로 받아 채널별 버퍼에 나눠 넣는다 (RedisChannelLayer는 receive_lock을 잡은 소켓이 BRPOP에 묶여
+    자기 버퍼에 직접 넣은 메시지를 받지 못한다).
+
+    한 group_send 안에서 로컬 전달이 Redis 전송보다 먼저 끝나고, 같은 발신자의 group_send는 순서대로
+    await되므로 수신자별 순서는 기존과 같다. 로컬 채널이 가득 차면 Redis 경로처럼 새 메시지를 버린다.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reader = None
+
+    def is_local(self, channel):
+        return '!' in channel and self.non_local_name(channel).endswith(self.client_prefix + '!')
+
+    async def send(self, channel, message):
+        if not self.is_local(channel):
+            await super().send(channel, message)
+            return
+        assert isinstance(message, dict), "message is not a dict"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        queue = self.receive_buffer[channel]
+        if queue.full():
+            raise ChannelFull()
+        queue.put_nowait(dict(message))
+        layer_deliveries.inc(path='local')
+
+    async def receive(self, channel):
+        if '!' not in channel:
+            return await super().receive(channel)
+        assert self.valid_channel_name(channel)
+        real_channel = self.non_local_name(channel)
+        assert real_channel.endswith(self.client_prefix + '!'), "Wrong client prefix"
+
+        while True:
+            reader = self.ensure_reader(real_channel)
+            queue = self.receive_buffer[channel]
+            getter = asyncio.ensure_future(queue.get())
+            try:
+                await asyncio.wait([getter, reader], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                getter.cancel()
+                if queue.empty() and self.receive_buffer.get(channel) is queue:
+                    del self.receive_buffer[channel]
+            if getter.done() and not getter.cancelled():
+                return getter.result()
+            if not reader.cancelled():
+                # Redis 오류로 읽기 작업이 끝났다. 다음 receive()가 새로 시작한다
+                reader.result()
+
+    def ensure_reader(self, real_channel):
+        loop = asyncio.get_running_loop()
+        reader = self.reader
+        if reader is not None and not reader.done():
+            if reader.get_loop() is loop:
+                return reader
+            if not reader.get_loop().is_closed():
+                raise RuntimeError('Two event loops are trying to receive() on one channel layer at once!')
+        self.reader = loop.create_task(self.read_remote(real_channel))
+        self.reader.add_done_callback(self.reader_done)
+        return self.reader
+
+    @staticmethod
+    def reader_done(reader):
+        if not reader.cancelled() and reader.exception() is not None:
+            logger.warning('Channel layer reader stopped', exc_info=reader.exception())
+
+    async def read_remote(self, real_channel):
+        # 이 프로세스의 채널로 온 Redis 메시지를 BRPOP 하나로 읽어 채널별 수신 버퍼에 나눠 넣는다
+        while True:
+            message_channel, message = await self.receive_single(real_channel)
+            if isinstance(message_channel, list):
+                for channel in message_channel:
+                    self.receive_buffer[channel].put_nowait(message)
+            else:
+                self.receive_buffer[message_channel].put_nowait(message)
+
+    async def close_pools(self):
+        if self.reader is not None:
+            self.reader.cancel()
+            self.reader = None
+        await super().close_pools()
+
+    async def group_send(self, group, message):
+        assert self.valid_group_name(group), "Group name not valid"
+        key = self._group_key(group)
+        connection = self.connection(self.consistent_hash(group))
+        # group_expiry가 지난 멤버는 버린다
+        await connection.zremrangebyscore(key, min=0, max=int(time.time()) - self.group_expiry)
+        channel_names = [name.decode('utf8') for name in await connection.zrange(key, 0, -1)]
+
+        local = [channel for channel in channel_names if self.is_local(channel)]
+        remote = [channel for channel in channel_names if not self.is_local(channel)]
+        if local:
+            self.deliver_local(local, message)
+        if remote:
+            layer_deliveries.inc(len(remote), path='remote')
+            await self.send_remote(group, remote, message)
+
+    def deliver_local(self, channels, message):
+        # Redis 경로에서 같은 프로세스의 여러 채널이 역직렬화된 dict 하나를 공유하는 것과 같다
+        message = dict(message)
+        dropped = 0
+        for channel in channels:
+            queue = self.receive_buffer[channel]
+            if queue.full():
+                dropped += 1
+                continue
+            queue.put_nowait(message)
+        if dropped:
+            logger.info('%s of %s local channels over capacity', dropped, len(channels))
+            layer_deliveries.inc(dropped, path='dropped')
+        layer_deliveries.inc(len(channels) - dropped, path='local')
+
+    async def send_remote(self, group, channels, message):
+        # 같은 Redis 키(같은 프로세스)의 채널들은 __asgi_channel__에 채널 목록을 담은 메시지 하나로 묶는다.
+        # 받는 쪽 RedisChannelLayer/HybridChannelLayer의 receive_single이 이 형식을 풀어 채널별로 나눈다
+        recipients = {}
+        keys_by_connection = defaultdict(list)
+        for channel in channels:
+            name = self.non_local_name(channel) if '!' in channel else channel
+            key = self.prefix + name
+            if key not in recipients:
+                recipients[key] = []
+                keys_by_connection[self.consistent_hash(name)].append(key)
+            recipients[key].append(channel)
+
+        for index, keys in keys_by_connection.items():
+            connection = self.connection(index)
+            now = time.time()
+            pipe = connection.pipeline()
+            for key in keys:
+                pipe.zremrangebyscore(key, min=0, max=int(now) - int(self.expiry))
+            await pipe.execute()
+            args = [self.serialize({**message, '__asgi_channel__': recipients[key]}) for key in keys]
+            args += [self.get_capacity(recipients[key][0]) for key in keys]
+            over_capacity = await connection.eval(_GROUP_SEND_SCRIPT, len(keys), *keys, *args, now, self.expiry)
+            if over_capacity:
+                logger.info('%s of %s channels over capacity in group %s', over_capacity, len(channels), group)
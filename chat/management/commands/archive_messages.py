@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from chat.archive import archive_messages, archive_report, prune_orphans
+from chat.search import optimize_index
+
+
+class Command(BaseCommand):
+    help = ('오래된 메시지를 방별·월별 gzip 세그먼트로 옮기고 compaction 리포트를 출력한다. '
+            '옮긴 메시지는 메시지 목록 API에서 이어 읽힌다.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CHAT_ARCHIVE_AFTER_DAYS,
+                            help='이 일수보다 오래된 메시지를 옮긴다')
+        parser.add_argument('--room', type=int, action='append', dest='rooms', help='옮길 방 id (여러 번 지정 가능)')
+        parser.add_argument('--batch-size', type=int, default=settings.CHAT_ARCHIVE_BATCH_SIZE,
+                            help='한 번에 읽고 지우는 메시지 수')
+        parser.add_argument('--report', action='store_true', help='옮기지 않고 리포트만 출력')
+        parser.add_argument('--vacuum', action='store_true', help='옮긴 뒤 FTS5 인덱스를 병합하고 SQLite VACUUM 실행')
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days must be positive')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        if options['vacuum'] and connection.vendor != 'sqlite':
+            raise CommandError('--vacuum requires SQLite')
+
+        if not options['report']:
+            # 실행 중인 서버와 쓰기 잠금을 다툴 때 도중에 SQLITE_BUSY로 실패하지 않도록 처음부터 쓰기 잠금을 잡는다
+            connection.immediate_transactions = True
+            cutoff = timezone.now() - timedelta(days=options['days'])
+
+            def progress(room_id, month, moved):
+                self.stdout.write(f'Room {room_id} {month:%Y-%m}: archived {moved} messages')
+
+            archived = archive_messages(cutoff, options['batch_size'], options['rooms'], progress)
+            self.stdout.write(self.style.SUCCESS(f'Archived {archived} messages older than {cutoff.isoformat()}'))
+            if options['vacuum']:
+                optimize_index()
+                with connection.cursor() as cursor:
+                    cursor.execute('VACUUM')
+
+        report = archive_report()
+        if not options['report']:
+            removed = prune_orphans(report['orphaned'])
+            for name in removed:
+                self.stdout.write(f'Removed orphaned segment file {name}')
+            report['orphaned'] = [(name, mtime) for name, mtime in report['orphaned'] if name not in removed]
+        self.write_report(report)
+
+    def write_report(self, report):
+        self.stdout.write(f'{"room":>8} {"hot":>10} {"segments":>8} {"archived":>10} {"raw":>12} {"stored":>12} {"ratio":>6}')
+        for row in report['rooms']:
+            ratio = row['raw_bytes'] / row['stored_bytes'] if row['stored_bytes'] else 0
+            self.stdout.write(
+                f'{row["room_id"]:>8} {row["hot_messages"]:>10} {row["segments"]:>8} {row["archived_messages"]:>10} '
+                f'{row["raw_bytes"]:>12} {row["stored_bytes"]:>12} {ratio:>6.1f}'
+            )
+        hot = sum(row['hot_messages'] for row in report['rooms'])
+        archived = sum(row['archived_messages'] for row in report['rooms'])
+        stored = sum(row['stored_bytes'] for row in report['rooms'])
+        self.stdout.write(f'Total: {hot} hot messages, {archived} archived messages in {stored} bytes')
+        if 'db_bytes' in report:
+            self.stdout.write(f'Database: {report["db_bytes"]} bytes, {report["free_bytes"]} reclaimable by VACUUM')
+        for name, _ in report['orphaned']:
+            self.stdout.write(self.style.WARNING(f'Orphaned segment file (no segment row): {name}'))
+        for name in report['missing']:
+            self.stdout.write(self.style.ERROR(f'Missing segment file: {name}'))
@@ -0,0 +1,28 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.bench.codecs import find_regressions, run_benchmark
+from chat.bench.support import load_baseline, save_baseline
+
+
+class Command(BaseCommand):
+    help = '소켓 프레임 codec(JSON, msgpack) 크기와 인코딩/디코딩 시간 비교'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000, help='모양·codec별 반복 횟수')
+        parser.add_argument('--save-baseline', metavar='PATH', help='결과를 JSON 기준값으로 저장')
+        parser.add_argument('--baseline', metavar='PATH', help='JSON 기준값과 비교해 회귀 시 실패')
+        parser.add_argument('--tolerance', type=float, default=0.5, help='기준값 대비 허용 악화 비율')
+
+    def handle(self, *args, **options):
+        results = run_benchmark(options['iterations'])
+
+        self.stdout.write(json.dumps(results, indent=2))
+        if options['save_baseline']:
+            save_baseline(options['save_baseline'], results)
+
+        baseline = load_baseline(options['baseline']) if options['baseline'] else None
+        regressions = find_regressions(results, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError('Benchmark regression:\n' + '\n'.join(regressions))
@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.bench.rest import find_regressions, run_dataset
+from chat.bench.support import benchmark_database, load_baseline, save_baseline
+
+
+class Command(BaseCommand):
+    help = 'REST 엔드포인트 벤치마크와 쿼리 수 예산 검사 (임시 DB와 로컬 업스트림 스텁에서 실행)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--datasets', default='5:20,25:100,100:400',
+                            help='쉼표로 구분한 "방 수:방별 메시지 수" 목록')
+        parser.add_argument('--members', type=int, default=5, help='방별 참가자 수')
+        parser.add_argument('--iterations', type=int, default=20, help='엔드포인트별 요청 횟수')
+        parser.add_argument('--save-baseline', metavar='PATH', help='결과를 JSON 기준값으로 저장')
+        parser.add_argument('--baseline', metavar='PATH', help='JSON 기준값과 비교해 회귀 시 실패')
+        parser.add_argument('--tolerance', type=float, default=0.5, help='기준값 대비 허용 지연 증가 비율')
+
+    def handle(self, *args, **options):
+        datasets = []
+        for spec in options['datasets'].split(','):
+            rooms, messages_per_room = (int(value) for value in spec.split(':'))
+            # 데이터셋마다 새 DB에서 실행해 크기 외의 조건을 같게 한다
+            with benchmark_database():
+                datasets.append(run_dataset(rooms, messages_per_room, options['members'], options['iterations']))
+        results = {'benchmark': 'rest', 'datasets': datasets}
+
+        self.stdout.write(json.dumps(results, indent=2))
+        if options['save_baseline']:
+            save_baseline(options['save_baseline'], results)
+
+        baseline = load_baseline(options['baseline']) if options['baseline'] else None
+        regressions = find_regressions(results, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError('Benchmark regression:\n' + '\n'.join(regressions))
@@ -0,0 +1,48 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from chat.bench.support import benchmark_database, load_baseline, save_baseline
+from chat.bench.ws_fanout import IN_MEMORY_LAYER, find_regressions, run_benchmark
+
+
+class Command(BaseCommand):
+    help = 'ChatConsumer 웹소켓 팬아웃 부하 벤치마크 (임시 DB와 로컬 채널 레이어에서 실행)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--room-sizes', default='2,10,50',
+                            help='쉼표로 구분한 방 인원 수 목록 (방 인원 = 방별 소켓 수)')
+        parser.add_argument('--rooms', type=int, default=10, help='시나리오별 방 개수')
+        parser.add_argument('--messages', type=int, default=20, help='방별 전송 메시지 수')
+        parser.add_argument('--rate', type=float, default=50, help='방별 초당 전송 메시지 수 (0이면 최대 속도)')
+        parser.add_argument('--layer', choices=['memory', 'redis'], default='memory',
+                            help='memory: InMemoryChannelLayer, redis: settings.CHANNEL_LAYERS 사용')
+        parser.add_argument('--batch', action='store_true', help='소켓을 ?batch=1(묶음 프레임) 모드로 연결')
+        parser.add_argument('--codec', choices=['json', 'msgpack'], default='json', help='소켓 subprotocol')
+        parser.add_argument('--timeout', type=float, default=60, help='시나리오별 수신 대기 시간(초)')
+        parser.add_argument('--save-baseline', metavar='PATH', help='결과를 JSON 기준값으로 저장')
+        parser.add_argument('--baseline', metavar='PATH', help='JSON 기준값과 비교해 회귀 시 실패')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='기준값 대비 허용 악화 비율')
+
+    def handle(self, *args, **options):
+        room_sizes = [int(size) for size in options['room_sizes'].split(',') if size]
+        overrides = {'CHANNEL_LAYERS': IN_MEMORY_LAYER} if options['layer'] == 'memory' else {}
+        # 팬아웃 처리량을 재는 것이므로 발신 제한은 끈다
+        overrides['CHAT_RATE_LIMITS'] = {}
+
+        with override_settings(**overrides), benchmark_database():
+            results = asyncio.run(run_benchmark(
+                room_sizes, options['rooms'], options['messages'], options['rate'], options['timeout'],
+                batch=options['batch'], codec=options['codec'],
+            ))
+
+        self.stdout.write(json.dumps(results, indent=2))
+        if options['save_baseline']:
+            save_baseline(options['save_baseline'], results)
+
+        baseline = load_baseline(options['baseline']) if options['baseline'] else None
+        regressions = find_regressions(results, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError('Benchmark regression:\n' + '\n'.join(regressions))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from chat.search import optimize_index, rebuild_index
+
+
+class Command(BaseCommand):
+    help = '메시지 전문 검색(FTS5) 인덱스를 기존 메시지로 다시 채운다. 새 메시지는 트리거로 자동 색인된다.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='한 트랜잭션에서 색인할 메시지 id 범위')
+        parser.add_argument('--optimize', action='store_true', help='색인 후 FTS5 segment를 병합')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Message search index requires SQLite FTS5')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        # 실행 중인 서버와 쓰기 잠금을 다툴 때 도중에 SQLITE_BUSY로 실패하지 않도록 처음부터 쓰기 잠금을 잡는다
+        connection.immediate_transactions = True
+
+        def progress(last_id, max_id, indexed):
+            self.stdout.write(f'Indexed up to id {last_id}/{max_id} ({indexed} messages)')
+
+        indexed = rebuild_index(options['chunk_size'], progress)
+        if options['optimize']:
+            optimize_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} messages'))
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.supervisor import Supervisor, bind_socket
+
+
+class Command(BaseCommand):
+    help = ('daphne 워커 여러 개를 같은 포트로 실행하고 감시한다. '
+            'SIGHUP: 워커를 하나씩 drain하며 재시작, SIGTERM: 모두 drain한 뒤 종료')
+
+    def add_arguments(self, parser):
+        parser.add_argument('-b', '--bind', default='0.0.0.0', help='listen 주소')
+        parser.add_argument('-p', '--port', type=int, default=8003, help='listen 포트')
+        parser.add_argument('--workers', type=int, default=settings.CHAT_WS_WORKERS, help='daphne 워커 수')
+        parser.add_argument('--application', default='config.asgi:application', help='ASGI application 경로')
+        parser.add_argument('--daphne-arg', action='append', default=[], dest='daphne_args',
+                            help='daphne에 그대로 넘길 인자 (여러 번 지정 가능)')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be positive')
+        if options['workers'] > 1:
+            # 프로세스 로컬 저장소는 워커끼리 공유되지 않는다 (접속 상태가 갈리고 발신 제한이 워커 수만큼 느슨해진다)
+            for name in ('CHAT_PRESENCE_BACKEND', 'CHAT_RATE_LIMIT_BACKEND', 'CHAT_PAGE_CACHE_BACKEND'):
+                if getattr(settings, name) == 'local':
+                    raise CommandError(f'{name}=local cannot be used with multiple workers')
+
+        sock = bind_socket(options['bind'], options['port'])
+        self.stdout.write(f"Listening on {options['bind']}:{options['port']} with {options['workers']} workers")
+        Supervisor(sock, options['workers'], options['application'], settings.CHAT_DRAIN_TIMEOUT,
+                   options['daphne_args']).run()
@@ -0,0 +1,195 @@
+import math
+import time
+from functools import wraps
+
+# 프로세스별 Prometheus 지표. 잠금 없이 dict/list 원소를 갱신하므로 매우 드물게 동시 증가가 유실될 수 있지만
+# 요청/메시지 경로에 잠금 경쟁을 만들지 않는다.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    body = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                    for name, value in pairs)
+    return '{' + body + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return lines
+
+    def samples(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+                for key, value in list(self._values.items())]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            # [bucket별 개수..., 합계]
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0])
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+                break
+        series[-1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        lines = []
+        for key, series in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+            lines.append(f'{self.name}_sum{labels} {_format_value(series[-1])}')
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class GaugeCollector(Metric):
+    """렌더링 시점에 callback()이 돌려준 {라벨 값 튜플: 값}을 gauge로 내보낸다."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, callback, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def samples(self):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+                for key, value in self.callback().items()]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_request_seconds = registry.register(Histogram(
+    'chat_http_request_seconds', 'HTTP request latency by view.', ['view', 'method', 'status']))
+http_db_queries = registry.register(Counter(
+    'chat_http_db_queries_total', 'DB queries executed while handling HTTP requests.', ['view']))
+http_db_seconds = registry.register(Counter(
+    'chat_http_db_seconds_total', 'Time spent in DB queries while handling HTTP requests.', ['view']))
+consumer_handler_seconds = registry.register(Histogram(
+    'chat_consumer_handler_seconds', 'WebSocket consumer handler latency.', ['consumer', 'handler']))
+group_send_seconds = registry.register(Histogram(
+    'chat_group_send_seconds', 'Channel layer group_send latency.', ['event']))
+active_sockets = registry.register(Gauge(
+    'chat_active_sockets', 'Open WebSocket connections in this process.', ['consumer']))
+outbound_batch_size = registry.register(Histogram(
+    'chat_outbound_batch_frames', 'Events coalesced into one outbound WebSocket frame.', ['consumer'],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)))
+outbound_dropped = registry.register(Counter(
+    'chat_outbound_dropped_total', 'Outbound events discarded for slow sockets (overflow, disconnect, expired).',
+    ['consumer', 'reason']))
+throttled_events = registry.register(Counter(
+    'chat_throttled_events_total', 'WebSocket frames rejected by rate limits.', ['kind', 'scope']))
+layer_deliveries = registry.register(Counter(
+    'chat_layer_deliveries_total', 'Channel layer deliveries by path (local shortcut, Redis, dropped).', ['path']))
+ephemeral_events = registry.register(Counter(
+    'chat_ephemeral_events_total', 'Typing/read/presence events by outcome.', ['kind', 'outcome']))
+upstream_seconds = registry.register(Histogram(
+    'chat_upstream_seconds', 'Upstream API call latency.', ['endpoint', 'outcome']))
+
+
+def observe_handler(handler):
+    """consumer의 async 핸들러 실행 시간을 chat_consumer_handler_seconds에 기록한다."""
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(self, *args, **kwargs)
+            finally:
+                consumer_handler_seconds.observe(
+                    time.perf_counter() - started, consumer=type(self).__name__, handler=handler
+                )
+        return wrapper
+    return decorator
@@ -0,0 +1,41 @@
+import time
+
+from django.db import connection
+
+from .metrics import http_db_queries, http_db_seconds, http_request_seconds
+
+
+class _QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """view별 응답 시간과 요청 중 실행된 DB 쿼리 수·시간을 chat.metrics에 기록한다."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = _QueryTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        # URL 이름(없으면 URL 패턴)으로 라벨을 붙여 라벨 값의 수가 라우트 수를 넘지 않게 한다
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match.route) if match else 'unmatched'
+        http_request_seconds.observe(elapsed, view=view, method=request.method, status=response.status_code)
+        http_db_queries.inc(timer.count, view=view)
+        http_db_seconds.inc(timer.seconds, view=view)
+        return response
@@ -0,0 +1,49 @@
+# Generated by Django 4.1.12 on 2026-10-18 18:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_summaries(apps, schema_editor):
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    Message = apps.get_model('chat', 'Message')
+    for room in ChatRoom.objects.all().iterator():
+        latest = Message.objects.filter(room_id=room.id).order_by('-timestamp', '-id').first()
+        if latest is None:
+            continue
+        room.last_message_text = latest.text
+        room.last_message_timestamp = latest.timestamp
+        room.last_message_sender_id = latest.sender_id
+        room.message_count = Message.objects.filter(room_id=room.id).count()
+        room.save(update_fields=['last_message_text', 'last_message_timestamp', 'last_message_sender', 'message_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_message_room_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_sender',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.user'),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_text',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_timestamp',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.12 on 2026-10-18 18:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_chatroom_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='membership_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
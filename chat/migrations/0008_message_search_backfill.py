@@ -0,0 +1,22 @@
+from django.db import migrations
+
+# 0006은 FTS5 테이블과 트리거만 만들고 기존 메시지를 색인하지 않았다.
+# external-content 테이블에 없는 행을 트리거가 'delete'하면 인덱스가 깨지므로(database disk image is malformed)
+# 이미 있던 메시지를 여기서 색인한다. 0006을 이미 적용한 DB도 이 migration으로 복구된다.
+
+
+def rebuild(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("INSERT INTO chat_message_fts(chat_message_fts) VALUES ('rebuild')")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_archived_segment'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill(apps, schema_editor):
+    ArchivedSegment = apps.get_model('chat', 'ArchivedSegment')
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    rows = ArchivedSegment.objects.order_by().values('room_id').annotate(until=Max('last_timestamp'))
+    for row in rows:
+        ChatRoom.objects.filter(id=row['room_id']).update(archived_until=row['until'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_message_search_backfill'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='archived_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 class User(models.Model):
     travel_user_id = models.IntegerField(default=0)
@@ -9,9 +10,43 @@ class ChatRoom(models.Model):
     id = models.BigAutoField(primary_key=True)
     room_name = models.CharField(max_length=255, default='Default')
     users = models.ManyToManyField(User, related_name='chat_rooms')
+    # 방 목록 조회용 최신 메시지 요약 (메시지 저장 시 chat.summaries에서 갱신)
+    last_message_text = models.TextField(blank=True, null=True)
+    last_message_timestamp = models.DateTimeField(blank=True, null=True)
+    last_message_sender = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    message_count = models.PositiveIntegerField(default=0)
+    # 참가자 변경 시마다 증가 (chat.signals), 소켓별 참가자 캐시의 무효화 기준
+    membership_version = models.PositiveIntegerField(default=0)
+    # chat.archive가 세그먼트로 옮긴 가장 최신 메시지의 시각. 아카이브가 없으면 None이며 메시지 목록 API의 이어 읽기 기준이다
+    archived_until = models.DateTimeField(blank=True, null=True)
 
 class Message(models.Model):
     room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name="messages")
     sender = models.ForeignKey(User, on_delete=models.CASCADE, default=1)
     text = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # write-behind 모드에서 enqueue 시점의 시각을 보존하기 위해 auto_now_add 대신 default를 사용한다
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['room', 'timestamp', 'id'], name='chat_msg_room_ts_id_idx'),
+        ]
+
+class ArchivedSegment(models.Model):
+    # chat.archive가 핫 테이블에서 옮긴 방별·월별 메시지 묶음. 본문은 CHAT_ARCHIVE_DIR 아래 gzip 파일(path)에 있다
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='archived_segments')
+    month = models.DateField()
+    path = models.CharField(max_length=255)
+    message_count = models.PositiveIntegerField(default=0)
+    first_timestamp = models.DateTimeField()
+    first_message_id = models.BigIntegerField()
+    last_timestamp = models.DateTimeField()
+    last_message_id = models.BigIntegerField()
+    raw_bytes = models.PositiveBigIntegerField(default=0)
+    stored_bytes = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'month'], name='chat_segment_room_month_uniq'),
+        ]
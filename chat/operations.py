@@ -0,0 +1,66 @@
+from django.db import transaction
+
+from .identity import get_user_identity, sender_payload, user_identity_cache
+from .models import ChatRoom, Message
+from .page_cache import cache_messages, with_sender
+from .summaries import record_messages
+
+# 소켓 핸들러에서 한 번의 database_sync_to_async 호출(스레드 전환)로 끝내기 위한 DB 작업 모음.
+# 모델 인스턴스 대신 id만 주고받는다.
+
+Membership = ChatRoom.users.through
+
+
+def room_participants(room_id):
+    version = ChatRoom.objects.filter(id=room_id).values_list('membership_version', flat=True).get()
+    travel_user_ids = Membership.objects.filter(chatroom_id=room_id).values_list('user__travel_user_id', flat=True)
+    return [{'travel_user_id': travel_user_id} for travel_user_id in travel_user_ids], version
+
+
+def user_rooms(travel_user_id):
+    """사용자가 참가한 모든 방의 {room_id: (participants, membership_version)}. 방 수와 관계없이 쿼리 두 번."""
+    memberships = Membership.objects.filter(user__travel_user_id=travel_user_id)
+    versions = dict(memberships.values_list('chatroom_id', 'chatroom__membership_version'))
+    participants = {room_id: [] for room_id in versions}
+    rows = (Membership.objects.filter(chatroom_id__in=memberships.values('chatroom_id'))
+            .values_list('chatroom_id', 'user__travel_user_id'))
+    for room_id, member_id in rows:
+        if room_id in participants:
+            participants[room_id].append({'travel_user_id': member_id})
+    return {room_id: (participants[room_id], version) for room_id, version in versions.items()}
+
+
+@transaction.atomic
+def post_message(room_id, travel_user_id, text, check_membership=True):
+    """
+    참가자 확인과 메시지 저장을 하나의 트랜잭션으로 처리한다.
+    참가자가 아니면 None, 저장했으면 (message, sender payload)를 반환한다.
+    """
+    if check_membership:
+        sender_pk = (Membership.objects.filter(chatroom_id=room_id, user__travel_user_id=travel_user_id)
+                     .values_list('user_id', flat=True).first())
+        if sender_pk is None:
+            return None
+        identity = {'id': sender_pk, 'travel_user_id': int(travel_user_id)}
+        user_identity_cache.set(identity['travel_user_id'], identity)
+    else:
+        identity = get_user_identity(travel_user_id)
+
+    message = with_sender(Message.objects.create(room_id=room_id, sender_id=identity['id'], text=text), identity)
+    record_messages([message])
+    transaction.on_commit(lambda: cache_messages(room_id, [message]))
+    return message, sender_payload(identity)
+
+
+@transaction.atomic
+def leave_room(room_id, travel_user_id):
+    identity = get_user_identity(travel_user_id)
+    ChatRoom(id=room_id).users.remove(identity['id'])
+    return room_participants(room_id)
+
+
+@transaction.atomic
+def invite_to_room(room_id, travel_user_id):
+    identity = get_user_identity(travel_user_id)
+    ChatRoom(id=room_id).users.add(identity['id'])
+    return room_participants(room_id)
@@ -0,0 +1,265 @@
+import logging
+import threading
+from bisect import bisect
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import redis
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+from .models import User
+from .pagination import encode_cursor
+from .serializers import MessageSerializer
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def serialize_message(message):
+    """MessageListAPIView 응답의 results 항목과 같은 JSON bytes."""
+    return JSONRenderer().render(MessageSerializer(message).data)
+
+
+def page_entries(messages):
+    return [((message.timestamp, message.id), serialize_message(message)) for message in messages]
+
+
+def with_sender(message, identity):
+    # 직렬화할 때 sender를 다시 조회하지 않도록 이미 알고 있는 식별자로 채운다
+    message.sender = User(id=identity['id'], travel_user_id=identity['travel_user_id'])
+    return message
+
+
+def _json_cursor(cursor):
+    return b'null' if cursor is None else b'"' + cursor.encode() + b'"'
+
+
+def render_results(entries, prev_cursor, next_cursor):
+    """직렬화된 항목들로 {'results', 'prev', 'next'} 응답 본문을 만든다 (재직렬화 없음)."""
+    return (b'{"results":[' + b','.join(item for _, item in entries) + b'],"prev":' + _json_cursor(prev_cursor)
+            + b',"next":' + _json_cursor(next_cursor) + b'}')
+
+
+def render_page(entries, has_more):
+    """캐시된 최신 페이지 응답 본문. next는 항상 null이다."""
+    return render_results(entries, encode_cursor(*entries[0][0]) if has_more else None, None)
+
+
+class _Page:
+    __slots__ = ('keys', 'items', 'complete')
+
+    def __init__(self, entries, complete):
+        self.keys = [key for key, _ in entries]
+        self.items = [item for _, item in entries]
+        self.complete = complete
+
+
+class LocalPageCache:
+    """
+    방별 최신 메시지 페이지의 프로세스 내부 캐시. 방 수는 rooms를 넘으면 LRU로 버린다.
+    다른 프로세스에서 저장된 메시지는 반영되지 않으므로 단일 프로세스 배포에서만 사용한다.
+    """
+
+    def __init__(self, size, rooms):
+        self.size = size
+        self.rooms = rooms
+        self._pages = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def generation(self, room_id):
+        return self._generations.get(room_id, 0)
+
+    def get(self, room_id, limit):
+        with self._lock:
+            page = self._pages.get(room_id)
+            if page is None:
+                return None
+            self._pages.move_to_end(room_id)
+            if len(page.keys) <= limit and not page.complete:
+                return None
+            return list(zip(page.keys[-limit:], page.items[-limit:])), len(page.keys) > limit or not page.complete
+
+    def fill(self, room_id, entries, complete, generation):
+        with self._lock:
+            # 읽는 동안 새 메시지가 추가되었으면 DB 결과가 이미 낡았을 수 있으므로 채우지 않는다
+            if self._generations.get(room_id, 0) != generation:
+                return
+            self._pages[room_id] = _Page(entries[-self.size:], complete and len(entries) <= self.size)
+            self._pages.move_to_end(room_id)
+            while len(self._pages) > self.rooms:
+                evicted, _ = self._pages.popitem(last=False)
+                self._generations.pop(evicted, None)
+
+    def add(self, room_id, entries):
+        with self._lock:
+            self._generations[room_id] = self._generations.get(room_id, 0) + 1
+            page = self._pages.get(room_id)
+            if page is None:
+                return
+            for key, item in entries:
+                index = bisect(page.keys, key)
+                if index and page.keys[index - 1] == key:
+                    continue
+                page.keys.insert(index, key)
+                page.items.insert(index, item)
+            overflow = len(page.keys) - self.size
+            if overflow > 0:
+                del page.keys[:overflow]
+                del page.items[:overflow]
+                page.complete = False
+
+    def invalidate(self, room_id):
+        with self._lock:
+            self._generations[room_id] = self._generations.get(room_id, 0) + 1
+            self._pages.pop(room_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self._generations.clear()
+
+
+# 방별 sorted set: score는 timestamp(마이크로초), member는 zero-padded id + JSON.
+# score가 -inf인 빈 member는 '방의 전체 메시지가 들어 있음' 표시이며, 넘치면 가장 먼저 잘려 나간다.
+_FILL_SCRIPT = """
+if tonumber(redis.call('GET', KEYS[2]) or '0') ~= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+for i = 5, #ARGV, 2 do
+    redis.call('ZADD', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+if ARGV[3] == '1' then
+    redis.call('ZADD', KEYS[1], '-inf', '')
+end
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -(tonumber(ARGV[2]) + 1))
+redis.call('PEXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+_ADD_SCRIPT = """
+redis.call('INCR', KEYS[2])
+redis.call('PEXPIRE', KEYS[2], ARGV[2])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 3, #ARGV, 2 do
+    redis.call('ZADD', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -(tonumber(ARGV[1]) + 1))
+redis.call('PEXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+ID_WIDTH = 20
+
+
+def _score(timestamp):
+    delta = timestamp - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _timestamp(score):
+    return EPOCH + timedelta(microseconds=int(score))
+
+
+class RedisPageCache:
+    """
+    LocalPageCache와 같은 인터페이스의 Redis 구현. gunicorn과 daphne 프로세스가 같은 캐시를 공유한다.
+    방 단위 LRU는 키 TTL과 Redis의 maxmemory-policy(allkeys-lru)에 맡긴다.
+    Redis 오류는 캐시 미스로 처리한다.
+    """
+
+    def __init__(self, url, size, ttl, prefix='chat:page'):
+        self.size = size
+        self.ttl_ms = int(ttl * 1000)
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._fill = self._client.register_script(_FILL_SCRIPT)
+        self._add = self._client.register_script(_ADD_SCRIPT)
+
+    def _keys(self, room_id):
+        return [f'{self.prefix}:{room_id}', f'{self.prefix}:{room_id}:gen']
+
+    @staticmethod
+    def _members(entries):
+        args = []
+        for (timestamp, message_id), item in entries:
+            args.extend([_score(timestamp), str(message_id).zfill(ID_WIDTH).encode() + item])
+        return args
+
+    def generation(self, room_id):
+        try:
+            return int(self._client.get(self._keys(room_id)[1]) or 0)
+        except redis.RedisError:
+            logger.warning('Page cache generation lookup failed for room %s', room_id, exc_info=True)
+            return None
+
+    def get(self, room_id, limit):
+        try:
+            rows = self._client.zrevrange(self._keys(room_id)[0], 0, limit, withscores=True)
+        except redis.RedisError:
+            logger.warning('Page cache read failed for room %s', room_id, exc_info=True)
+            return None
+        complete = bool(rows) and rows[-1][0] == b''
+        if complete:
+            rows.pop()
+        if len(rows) <= limit and not complete:
+            return None
+        entries = [((_timestamp(score), int(member[:ID_WIDTH])), member[ID_WIDTH:]) for member, score in rows[:limit]]
+        return entries[::-1], len(rows) > limit or not complete
+
+    def fill(self, room_id, entries, complete, generation):
+        if generation is None:
+            return
+        try:
+            self._fill(keys=self._keys(room_id), args=[
+                generation, self.size, '1' if complete and len(entries) <= self.size else '0', self.ttl_ms,
+                *self._members(entries),
+            ])
+        except redis.RedisError:
+            logger.warning('Page cache fill failed for room %s', room_id, exc_info=True)
+
+    def add(self, room_id, entries):
+        try:
+            self._add(keys=self._keys(room_id), args=[self.size, self.ttl_ms, *self._members(entries)])
+        except redis.RedisError:
+            logger.warning('Page cache update failed for room %s, invalidating', room_id, exc_info=True)
+            self.invalidate(room_id)
+
+    def invalidate(self, room_id):
+        try:
+            key, generation_key = self._keys(room_id)
+            pipe = self._client.pipeline()
+            pipe.delete(key)
+            pipe.incr(generation_key)
+            pipe.pexpire(generation_key, self.ttl_ms)
+            pipe.execute()
+        except redis.RedisError:
+            logger.warning('Page cache invalidation failed for room %s', room_id, exc_info=True)
+
+    def clear(self):
+        keys = list(self._client.scan_iter(match=f'{self.prefix}:*'))
+        if keys:
+            self._client.delete(*keys)
+
+
+def make_page_cache(backend):
+    if backend == 'redis':
+        return RedisPageCache(settings.REDIS_URL, settings.CHAT_PAGE_CACHE_SIZE, settings.CHAT_PAGE_CACHE_TTL)
+    if backend == 'local':
+        return LocalPageCache(settings.CHAT_PAGE_CACHE_SIZE, settings.CHAT_PAGE_CACHE_ROOMS)
+    return None
+
+
+# CHAT_PAGE_CACHE_BACKEND가 비어 있으면 None (캐시 사용 안 함)
+newest_page_cache = make_page_cache(settings.CHAT_PAGE_CACHE_BACKEND)
+
+
+def cache_messages(room_id, messages):
+    """저장된 메시지를 캐시된 최신 페이지에 반영한다. messages의 sender는 채워져 있어야 한다."""
+    if newest_page_cache is not None and messages:
+        newest_page_cache.add(room_id, page_entries(messages))
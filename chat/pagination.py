@@ -0,0 +1,62 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+
+def encode_cursor(timestamp, message_id):
+    raw = f'{timestamp.isoformat()}|{message_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    # 소켓 프레임에서 온 cursor는 문자열이 아닐 수 있고, timezone이 없는 timestamp는 저장된 메시지 시각과 비교할 수 없다
+    if not isinstance(cursor, str):
+        raise ValidationError('올바르지 않은 cursor 값입니다.')
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        timestamp, message_id = raw.split('|')
+        timestamp, message_id = datetime.fromisoformat(timestamp), int(message_id)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValidationError('올바르지 않은 cursor 값입니다.')
+    if timestamp.tzinfo is None:
+        raise ValidationError('올바르지 않은 cursor 값입니다.')
+    return timestamp, message_id
+
+
+def message_cursor(message):
+    return encode_cursor(message.timestamp, message.id)
+
+
+def paginate_messages(queryset, page_size, before=None, after=None):
+    """
+    (timestamp, id) 기준 keyset 페이지네이션.
+    before/after는 decode된 (timestamp, id) 튜플이며, 결과는 항상 오래된 순으로 정렬된다.
+    반환값은 (messages, prev_cursor, next_cursor)이고 prev는 더 오래된 메시지, next는 더 최신 메시지를 가리킨다.
+    """
+    if after is not None:
+        timestamp, message_id = after
+        rows = list(
+            queryset.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=message_id))
+            .order_by('timestamp', 'id')[:page_size + 1]
+        )
+        has_more = len(rows) > page_size
+        messages = rows[:page_size]
+        prev_cursor = message_cursor(messages[0]) if messages else encode_cursor(timestamp, message_id)
+        next_cursor = message_cursor(messages[-1]) if has_more else None
+        return messages, prev_cursor, next_cursor
+
+    if before is not None:
+        timestamp, message_id = before
+        queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id))
+    rows = list(queryset.order_by('-timestamp', '-id')[:page_size + 1])
+    has_more = len(rows) > page_size
+    messages = rows[:page_size][::-1]
+    prev_cursor = message_cursor(messages[0]) if has_more else None
+    if before is None:
+        next_cursor = None
+    else:
+        next_cursor = message_cursor(messages[-1]) if messages else encode_cursor(*before)
+    return messages, prev_cursor, next_cursor
@@ -0,0 +1,112 @@
+import asyncio
+import time
+
+import redis.asyncio as aioredis
+from django.conf import settings
+
+# 방별 접속 상태. 소켓(channel_name)마다 만료 시각을 두고, 만료되지 않은 소켓이 하나라도 있는 사용자를 online으로 본다.
+# 프로세스가 비정상 종료되어 leave가 호출되지 않아도 ttl이 지나면 offline이 된다.
+
+
+class LocalPresence:
+    """단일 프로세스용 presence 저장소."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._rooms = {}
+
+    def _live(self, room_id):
+        now = time.monotonic()
+        connections = self._rooms.get(room_id, {})
+        for key in [key for key, (_, expires_at) in connections.items() if expires_at <= now]:
+            del connections[key]
+        return connections
+
+    async def online(self, room_id):
+        return sorted({user for user, _ in self._live(room_id).values()})
+
+    async def join(self, room_id, connection, travel_user_id):
+        """접속을 등록하고, 이 사용자가 새로 online이 되었는지 반환한다."""
+        connections = self._live(room_id)
+        was_online = any(user == travel_user_id for user, _ in connections.values())
+        self._rooms.setdefault(room_id, connections)[connection] = (travel_user_id, time.monotonic() + self.ttl)
+        return not was_online
+
+    async def touch(self, room_id, connection, travel_user_id):
+        self._rooms.setdefault(room_id, {})[connection] = (travel_user_id, time.monotonic() + self.ttl)
+
+    async def leave(self, room_id, connection, travel_user_id):
+        """접속을 제거하고, 이 사용자가 offline이 되었는지 반환한다."""
+        connections = self._live(room_id)
+        connections.pop(connection, None)
+        if not connections:
+            self._rooms.pop(room_id, None)
+        return not any(user == travel_user_id for user, _ in connections.values())
+
+
+class RedisPresence:
+    """
+    Redis sorted set 기반 presence 저장소 (여러 daphne 프로세스가 공유).
+    방마다 member '<travel_user_id>|<channel_name>', score는 만료 시각(ms)이다.
+    """
+
+    def __init__(self, url, ttl, prefix='chat:presence'):
+        self.url = url
+        self.ttl_ms = int(ttl * 1000)
+        self.prefix = prefix
+        self._clients = {}
+
+    def _client(self):
+        # redis.asyncio 커넥션은 이벤트 루프에 묶이므로 루프마다 따로 만든다
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = aioredis.Redis.from_url(self.url)
+        return client
+
+    def _key(self, room_id):
+        return f'{self.prefix}:{room_id}'
+
+    @staticmethod
+    def _now_ms():
+        return int(time.time() * 1000)
+
+    async def online(self, room_id):
+        members = await self._client().zrangebyscore(self._key(room_id), self._now_ms(), '+inf')
+        return sorted({int(member.split(b'|', 1)[0]) for member in members})
+
+    async def join(self, room_id, connection, travel_user_id):
+        key, now = self._key(room_id), self._now_ms()
+        async with self._client().pipeline(transaction=True) as pipe:
+            pipe.zremrangebyscore(key, '-inf', now)
+            pipe.zrangebyscore(key, now, '+inf')
+            pipe.zadd(key, {f'{travel_user_id}|{connection}': now + self.ttl_ms})
+            pipe.pexpire(key, self.ttl_ms)
+            _, members, _, _ = await pipe.execute()
+        prefix = f'{travel_user_id}|'.encode()
+        return not any(member.startswith(prefix) for member in members)
+
+    async def touch(self, room_id, connection, travel_user_id):
+        key, now = self._key(room_id), self._now_ms()
+        async with self._client().pipeline(transaction=True) as pipe:
+            pipe.zadd(key, {f'{travel_user_id}|{connection}': now + self.ttl_ms})
+            pipe.pexpire(key, self.ttl_ms)
+            await pipe.execute()
+
+    async def leave(self, room_id, connection, travel_user_id):
+        key, now = self._key(room_id), self._now_ms()
+        async with self._client().pipeline(transaction=True) as pipe:
+            pipe.zrem(key, f'{travel_user_id}|{connection}')
+            pipe.zrangebyscore(key, now, '+inf')
+            _, members = await pipe.execute()
+        prefix = f'{travel_user_id}|'.encode()
+        return not any(member.startswith(prefix) for member in members)
+
+
+def make_presence(backend):
+    if backend == 'redis':
+        return RedisPresence(settings.REDIS_URL, settings.CHAT_PRESENCE_TTL)
+    return LocalPresence(settings.CHAT_PRESENCE_TTL)
+
+
+presence = make_presence(settings.CHAT_PRESENCE_BACKEND)
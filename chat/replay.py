@@ -0,0 +1,154 @@
+import asyncio
+import bisect
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Message
+from .pagination import decode_cursor, encode_cursor
+
+# write-behind 메시지는 방송 시점에 id가 없으므로 같은 timestamp의 어떤 메시지보다 뒤로 정렬되는 id를 쓴다.
+# after 조회 시 (timestamp > t)와 같아진다.
+PENDING_MESSAGE_ID = 2 ** 63 - 1
+
+
+def message_frame(text, sender, timestamp, cursor):
+    return {
+        'type': 'message',
+        'message': text,
+        'sender': sender,
+        'timestamp': timestamp,
+        'cursor': cursor,
+    }
+
+
+def _frames(rows):
+    return [
+        message_frame(text, {'travel_user_id': travel_user_id}, timestamp.isoformat(),
+                      encode_cursor(timestamp, message_id))
+        for message_id, text, timestamp, travel_user_id in rows
+    ]
+
+
+def _message_rows(room_id):
+    return Message.objects.filter(room_id=room_id).values_list('id', 'text', 'timestamp', 'sender__travel_user_id')
+
+
+def recent_frames(room_id, limit):
+    """최신 메시지 limit개를 오래된 순 frame 목록으로 반환한다."""
+    rows = list(_message_rows(room_id).order_by('-timestamp', '-id')[:limit])
+    return _frames(rows[::-1])
+
+
+def frames_after(room_id, after, limit):
+    """after((timestamp, id)) 이후 메시지를 최대 limit개까지 반환한다. (frames, 더 남았는지)"""
+    timestamp, message_id = after
+    rows = list(
+        _message_rows(room_id)
+        .filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=message_id))
+        .order_by('timestamp', 'id')[:limit + 1]
+    )
+    return _frames(rows[:limit]), len(rows) > limit
+
+
+def _just_before(key):
+    timestamp, message_id = key
+    return timestamp, message_id - 1
+
+
+class _RoomBuffer:
+    def __init__(self):
+        self.keys = []
+        self.frames = []
+        self.cursors = set()
+        # base 이후의 메시지는 모두 버퍼에 있다. complete면 방의 전체 메시지가 들어 있다.
+        self.base = None
+        self.complete = False
+        self.seeded = False
+        self.seed_lock = asyncio.Lock()
+
+
+class RecentMessageBuffer:
+    """
+    방별 최근 메시지 ring buffer (프로세스 로컬).
+    이 프로세스에 해당 방의 소켓이 하나라도 연결되어 있는 동안 chat_message 이벤트로 채워지고,
+    마지막 소켓이 끊기면 놓친 메시지가 생길 수 있으므로 버린다.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._rooms = {}
+        self._subscribers = {}
+
+    def attach(self, room_id):
+        self._subscribers[room_id] = self._subscribers.get(room_id, 0) + 1
+        self._rooms.setdefault(room_id, _RoomBuffer())
+
+    def detach(self, room_id):
+        remaining = self._subscribers.get(room_id, 0) - 1
+        if remaining > 0:
+            self._subscribers[room_id] = remaining
+        else:
+            self._subscribers.pop(room_id, None)
+            self._rooms.pop(room_id, None)
+
+    def add(self, room_id, frame, key=None):
+        room = self._rooms.get(room_id)
+        cursor = frame.get('cursor')
+        if room is None or cursor is None or cursor in room.cursors:
+            return
+        key = key or decode_cursor(cursor)
+        index = bisect.bisect(room.keys, key)
+        if self._is_duplicate(room, index, key):
+            return
+
+        room.keys.insert(index, key)
+        room.frames.insert(index, frame)
+        room.cursors.add(cursor)
+        if room.base is None and not room.complete and len(room.keys) == 1:
+            # 첫 메시지를 받은 시점부터는 빠짐없이 버퍼에 쌓인다
+            room.base = _just_before(key)
+        while len(room.keys) > self.size:
+            room.base = room.keys.pop(0)
+            room.cursors.discard(room.frames.pop(0)['cursor'])
+            room.complete = False
+
+    @staticmethod
+    def _is_duplicate(room, index, key):
+        # DB에서 읽은 메시지와 write-behind로 방송된 같은 메시지는 id만 다르고 timestamp는 같다
+        for neighbor in (index - 1, index):
+            if 0 <= neighbor < len(room.keys):
+                other = room.keys[neighbor]
+                if other[0] == key[0] and PENDING_MESSAGE_ID in (other[1], key[1]):
+                    return True
+        return False
+
+    async def ensure_seeded(self, room_id, load):
+        """처음 replay 요청이 들어온 방은 DB의 최신 메시지로 버퍼를 채운다. load(limit)는 frame 목록을 돌려주는 코루틴."""
+        room = self._rooms.get(room_id)
+        if room is None or room.seeded:
+            return
+        async with room.seed_lock:
+            if room.seeded:
+                return
+            frames = await load(self.size)
+            if len(frames) < self.size:
+                room.complete = True
+                room.base = None
+            else:
+                seeded_base = _just_before(decode_cursor(frames[0]['cursor']))
+                room.base = seeded_base if room.base is None else min(room.base, seeded_base)
+            # 버퍼가 넘치면 add()가 complete와 base를 다시 맞춘다
+            for frame in frames:
+                self.add(room_id, frame)
+            room.seeded = True
+
+    def since(self, room_id, after):
+        """버퍼로 답할 수 있으면 after 이후 frame 목록, 아니면 None."""
+        room = self._rooms.get(room_id)
+        if room is None or not (room.complete or (room.base is not None and after >= room.base)):
+            return None
+        return room.frames[bisect.bisect(room.keys, after):]
+
+
+recent_messages = RecentMessageBuffer(settings.CHAT_REPLAY_BUFFER_SIZE)
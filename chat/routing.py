@@ -3,5 +3,6 @@ from . import consumers
 
 websocket_urlpatterns = [
     path('ws/chat/<int:room_id>/', consumers.ChatConsumer.as_asgi()),
+    path('ws/user/<int:travel_user_id>/', consumers.UserConsumer.as_asgi()),
     # path('ws/friend/<int:travel_user_id>/', consumers.FriendConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -0,0 +1,94 @@
+import html
+import re
+
+from django.db import connection, transaction
+from rest_framework.exceptions import ValidationError
+
+from .models import Message
+
+FTS_TABLE = 'chat_message_fts'
+
+# snippet()에 넘기는 강조 표시. 본문을 escape한 뒤 <mark>로 바꾼다
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+_MAX_TERMS = 10
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def build_match_query(query):
+    """
+    사용자 입력을 FTS5 MATCH 식으로 바꾼다. 단어마다 prefix 검색("호텔"*)을 하고 모두 포함된 메시지를 찾는다.
+    조사가 붙은 한국어 단어("호텔은")도 앞부분으로 찾을 수 있고, FTS5 연산자는 그대로 해석되지 않는다.
+    """
+    terms = _TERM_RE.findall(query or '')[:_MAX_TERMS]
+    if not terms:
+        raise ValidationError('검색어가 필요합니다.')
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def highlight(snippet):
+    return html.escape(snippet).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def search_messages(travel_user_id, query, limit, offset=0, room_id=None):
+    """
+    travel_user_id가 참가한 방의 메시지를 bm25 순위로 검색한다.
+    Message 목록을 반환하며 각 항목에 snippet, rank, sender_travel_user_id 속성이 붙는다.
+    """
+    params = [_MARK_START, _MARK_END, build_match_query(query), travel_user_id]
+    room_filter = ''
+    if room_id is not None:
+        room_filter = 'AND m.room_id = %s'
+        params.append(room_id)
+    params.extend([limit, offset])
+    return list(Message.objects.raw(f"""
+        SELECT m.id, m.room_id, m.sender_id, m.text, m.timestamp,
+               u.travel_user_id AS sender_travel_user_id,
+               snippet({FTS_TABLE}, 0, %s, %s, '…', 16) AS snippet,
+               bm25({FTS_TABLE}) AS rank
+        FROM {FTS_TABLE}
+        JOIN chat_message m ON m.id = {FTS_TABLE}.rowid
+        JOIN chat_user u ON u.id = m.sender_id
+        WHERE {FTS_TABLE} MATCH %s
+          AND m.room_id IN (
+              SELECT cu.chatroom_id FROM chat_chatroom_users cu
+              JOIN chat_user member ON member.id = cu.user_id
+              WHERE member.travel_user_id = %s
+          )
+          {room_filter}
+        ORDER BY rank, m.timestamp DESC, m.id DESC
+        LIMIT %s OFFSET %s
+    """, params))
+
+
+def rebuild_index(chunk_size, progress=None):
+    """
+    인덱스를 비우고 기존 메시지를 id 순으로 chunk_size개씩 다시 넣는다. 넣은 메시지 수를 반환한다.
+    비우기 전에 max(id)를 읽어 두므로 그 뒤에 저장된 메시지는 트리거로만 색인되어 중복되지 않는다.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM chat_message')
+            max_id = cursor.fetchone()[0]
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')")
+
+    indexed = 0
+    last_id = 0
+    while last_id < max_id:
+        upper = min(last_id + chunk_size, max_id)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {FTS_TABLE}(rowid, text) SELECT id, text FROM chat_message WHERE id > %s AND id <= %s',
+                    [last_id, upper],
+                )
+                indexed += cursor.rowcount
+        last_id = upper
+        if progress is not None:
+            progress(last_id, max_id, indexed)
+    return indexed
+
+
+def optimize_index():
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
@@ -13,6 +13,23 @@ class MessageSerializer(serializers.ModelSerializer):
         model = Message
         fields = "__all__"
 
+class ChatRoomListSerializer(serializers.ModelSerializer):
+    latest_message = serializers.CharField(source='last_message_text', read_only=True)
+    latest_message_timestamp = serializers.SerializerMethodField()
+    latest_message_sender = UserSerializer(source='last_message_sender', read_only=True)
+    users = UserSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = ChatRoom
+        fields = ['id', 'room_name', 'users', 'latest_message', 'latest_message_timestamp',
+                  'latest_message_sender', 'message_count']
+
+    def get_latest_message_timestamp(self, obj):
+        # ChatRoomSerializer와 같은 isoformat() 표현을 유지한다 (DRF DateTimeField는 UTC를 'Z'로 바꾼다)
+        if obj.last_message_timestamp:
+            return obj.last_message_timestamp.isoformat()
+        return None
+
 class ChatRoomSerializer(serializers.ModelSerializer):
     latest_message = serializers.SerializerMethodField()
     latest_message_timestamp = serializers.SerializerMethodField()
@@ -24,15 +41,11 @@ class ChatRoomSerializer(serializers.ModelSerializer):
         fields = ['id', 'room_name', 'users', 'latest_message', 'latest_message_timestamp', 'messages']
 
     def get_latest_message(self, obj):
-        latest_msg = obj.messages.order_by('-timestamp').first()
-        if latest_msg:
-            return latest_msg.text
-        return None
+        return obj.last_message_text
 
     def get_latest_message_timestamp(self, obj):
-        latest_msg = obj.messages.order_by('-timestamp').first()
-        if latest_msg:
-            return latest_msg.timestamp.isoformat()
+        if obj.last_message_timestamp:
+            return obj.last_message_timestamp.isoformat()
         return None
 
     def create(self, validated_data):
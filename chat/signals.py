@@ -0,0 +1,42 @@
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import ChatRoom, Message
+from .page_cache import newest_page_cache
+
+
+@receiver(m2m_changed, sender=ChatRoom.users.through)
+def bump_membership_version(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # user.chat_rooms 쪽에서 변경된 경우 pk_set은 방 id 목록이다
+        if action == 'pre_clear':
+            instance._cleared_room_ids = list(instance.chat_rooms.values_list('id', flat=True))
+            return
+        if action == 'post_clear':
+            room_ids = getattr(instance, '_cleared_room_ids', [])
+        elif action in ('post_add', 'post_remove'):
+            room_ids = pk_set or []
+        else:
+            return
+    elif action == 'post_clear' or (action in ('post_add', 'post_remove') and pk_set):
+        room_ids = [instance.pk]
+    else:
+        return
+
+    if room_ids:
+        ChatRoom.objects.filter(id__in=room_ids).update(membership_version=F('membership_version') + 1)
+
+
+@receiver(post_save, sender=Message)
+def invalidate_page_on_edit(sender, instance, created, **kwargs):
+    # 새 메시지는 저장 경로에서 캐시에 추가되므로 수정된 경우만 무효화한다
+    if not created and newest_page_cache is not None:
+        newest_page_cache.invalidate(instance.room_id)
+
+
+@receiver(post_delete, sender=ChatRoom)
+def invalidate_page_on_room_delete(sender, instance, **kwargs):
+    # Message에는 post_delete를 연결하지 않는다 (대량 삭제가 건별 삭제로 바뀌므로). 메시지를 직접 지우는 곳에서 무효화한다
+    if newest_page_cache is not None:
+        newest_page_cache.invalidate(instance.pk)
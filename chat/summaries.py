@@ -0,0 +1,39 @@
+from collections import Counter
+
+from django.db import models
+from django.db.models import Case, F, Q, Value, When
+
+from .models import ChatRoom
+
+
+def record_messages(messages):
+    """
+    새로 저장된 메시지들을 방 요약(last_message_*, message_count)에 반영한다.
+    메시지를 저장한 트랜잭션 안에서 호출해야 한다.
+    """
+    counts = Counter()
+    latest = {}
+    for message in messages:
+        counts[message.room_id] += 1
+        current = latest.get(message.room_id)
+        if current is None or (message.timestamp, message.id or 0) > (current.timestamp, current.id or 0):
+            latest[message.room_id] = message
+
+    for room_id, message in latest.items():
+        # 동시에 저장된 더 최신 메시지가 있다면 요약을 덮어쓰지 않는다
+        newer = Q(last_message_timestamp__isnull=True) | Q(last_message_timestamp__lte=message.timestamp)
+        ChatRoom.objects.filter(id=room_id).update(
+            message_count=F('message_count') + counts[room_id],
+            last_message_text=Case(
+                When(newer, then=Value(message.text)),
+                default=F('last_message_text'), output_field=models.TextField(),
+            ),
+            last_message_timestamp=Case(
+                When(newer, then=Value(message.timestamp)),
+                default=F('last_message_timestamp'), output_field=models.DateTimeField(),
+            ),
+            last_message_sender=Case(
+                When(newer, then=Value(message.sender_id)),
+                default=F('last_message_sender'), output_field=models.BigIntegerField(),
+            ),
+        )
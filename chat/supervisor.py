@@ -0,0 +1,143 @@
+import logging
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# 이보다 빨리 죽은 워커는 재시작 간격을 두 배로 늘린다 (최대 MAX_RESTART_DELAY초)
+STABLE_SECONDS = 10
+MAX_RESTART_DELAY = 30
+POLL_INTERVAL = 0.5
+
+# daphne 2.x에는 daphne/__main__.py가 없어 `python -m daphne`로 실행할 수 없다. console script(daphne)와 같은 진입점을
+# 이 인터프리터로 직접 호출한다
+DAPHNE_ENTRYPOINT = 'from daphne.cli import CommandLineInterface; CommandLineInterface.entrypoint()'
+
+
+def bind_socket(host, port, backlog=2048):
+    """워커들이 함께 accept할 listen 소켓. 워커에는 daphne --fd로 넘긴다."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Worker:
+    def __init__(self, process):
+        self.process = process
+        self.started = time.monotonic()
+        self.draining = False
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+
+class Supervisor:
+    """
+    daphne 워커 여러 개를 미리 bind한 소켓 하나로 실행하고 감시한다.
+    - 워커가 죽으면 다시 띄운다 (계속 죽으면 간격을 늘린다).
+    - SIGHUP: 새 워커를 먼저 띄운 뒤 기존 워커를 하나씩 drain한다 (배포).
+    - SIGTERM/SIGINT: 모든 워커를 drain하고 종료한다.
+    drain은 워커에 SIGUSR1을 보내 chat.drain.Drainer가 처리한다. drain_timeout 안에 끝나지 않으면 SIGTERM, SIGKILL.
+    """
+
+    def __init__(self, sock, workers, application, drain_timeout, daphne_args=()):
+        self.sock = sock
+        self.size = workers
+        self.command = [
+            sys.executable, '-c', DAPHNE_ENTRYPOINT, '--fd', str(sock.fileno()), *daphne_args, application,
+        ]
+        self.drain_timeout = drain_timeout
+        self.workers = {}
+        self.restart_at = []
+        self.restart_delay = 1
+        self.stopping = False
+        self.reload_requested = False
+
+    def spawn(self):
+        worker = Worker(subprocess.Popen(self.command, pass_fds=(self.sock.fileno(),)))
+        self.workers[worker.pid] = worker
+        logger.info('Started worker %s', worker.pid)
+        return worker
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        for _ in range(self.size):
+            self.spawn()
+
+        while not self.stopping:
+            self.reap()
+            now = time.monotonic()
+            due = [when for when in self.restart_at if when <= now]
+            for when in due:
+                self.restart_at.remove(when)
+                self.spawn()
+            if self.reload_requested:
+                self.reload_requested = False
+                self.rolling_restart()
+            time.sleep(POLL_INTERVAL)
+
+        logger.info('Stopping %d workers', len(self.workers))
+        self.stop(list(self.workers.values()))
+        self.sock.close()
+
+    def _on_stop(self, signum, frame):
+        self.stopping = True
+
+    def _on_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def reap(self):
+        for pid, worker in list(self.workers.items()):
+            code = worker.process.poll()
+            if code is None:
+                continue
+            del self.workers[pid]
+            if worker.draining or self.stopping:
+                continue
+            if time.monotonic() - worker.started < STABLE_SECONDS:
+                self.restart_delay = min(self.restart_delay * 2, MAX_RESTART_DELAY)
+            else:
+                self.restart_delay = 1
+            logger.warning('Worker %s exited with code %s, restarting in %ss', pid, code, self.restart_delay)
+            self.restart_at.append(time.monotonic() + self.restart_delay)
+
+    def rolling_restart(self):
+        # 새 워커가 먼저 accept를 시작하므로 접속을 받지 못하는 순간이 없다
+        for worker in list(self.workers.values()):
+            if self.stopping:
+                return
+            self.spawn()
+            time.sleep(1)
+            self.stop([worker])
+            self.workers.pop(worker.pid, None)
+
+    def stop(self, workers):
+        for worker in workers:
+            worker.draining = True
+            self._signal(worker, signal.SIGUSR1)
+        deadline = time.monotonic() + self.drain_timeout + 5
+        for sig, wait_until in ((signal.SIGTERM, deadline), (signal.SIGKILL, deadline + 5)):
+            for worker in workers:
+                try:
+                    worker.process.wait(timeout=max(0, wait_until - time.monotonic()))
+                except subprocess.TimeoutExpired:
+                    logger.warning('Worker %s did not drain in time, sending %s', worker.pid, sig.name)
+                    self._signal(worker, sig)
+        for worker in workers:
+            worker.process.wait()
+
+    @staticmethod
+    def _signal(worker, sig):
+        try:
+            worker.process.send_signal(sig)
+        except ProcessLookupError:
+            pass
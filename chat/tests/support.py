@@ -0,0 +1,39 @@
+from contextlib import ExitStack
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from chat.models import ChatRoom, User
+from chat.routing import websocket_urlpatterns
+
+# 채널 레이어가 필요한 테스트는 override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)로 Redis 없이 실행한다
+IN_MEMORY_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+def use_page_cache(cache):
+    """newest_page_cache를 가져다 쓰는 모듈 모두에서 cache로 바꾸는 context manager."""
+    from chat import archive, page_cache, signals, views
+    stack = ExitStack()
+    for module in (archive, page_cache, signals, views):
+        stack.enter_context(mock.patch.object(module, 'newest_page_cache', cache))
+    return stack
+
+
+def make_room(*travel_user_ids, **fields):
+    room = ChatRoom.objects.create(**fields)
+    users = [User.objects.get_or_create(travel_user_id=travel_user_id)[0] for travel_user_id in travel_user_ids]
+    room.users.add(*users)
+    return room
+
+
+amake_room = sync_to_async(make_room)
+
+
+async def connect(path, **kwargs):
+    """path로 접속한 WebsocketCommunicator. 접속이 거절되면 AssertionError."""
+    communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path, **kwargs)
+    connected, _ = await communicator.connect()
+    assert connected, f'{path} rejected'
+    return communicator
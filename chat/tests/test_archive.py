@@ -0,0 +1,192 @@
+import tempfile
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.apps import apps
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from chat import archive, views
+from chat.archive import archive_messages, load_segment
+from chat.models import ArchivedSegment, ChatRoom, Message
+from chat.page_cache import LocalPageCache
+from chat.pagination import encode_cursor
+from chat.search import FTS_TABLE
+
+from .support import make_room
+
+backfill = import_module('chat.migrations.0008_message_search_backfill')
+
+
+class ArchiveTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        archive_dir = override_settings(CHAT_ARCHIVE_DIR=directory.name)
+        archive_dir.enable()
+        self.addCleanup(archive_dir.disable)
+        load_segment.cache_clear()
+        self.room = make_room(1)
+        sender = self.room.users.get()
+        self.now = timezone.now()
+        # 석 달에 걸친 오래된 메시지 30개와 최근 메시지 5개
+        self.messages = [
+            Message.objects.create(room=self.room, sender=sender, text=f'old hotel {i}',
+                                   timestamp=self.now - timedelta(days=300 - i * 3))
+            for i in range(30)
+        ] + [
+            Message.objects.create(room=self.room, sender=sender, text=f'new {i}',
+                                   timestamp=self.now - timedelta(minutes=5 - i))
+            for i in range(5)
+        ]
+        self.ids = [m.id for m in self.messages]
+        self.url = f'/chat/{self.room.id}/messages/'
+
+    def archive(self, days=30, batch_size=4):
+        return archive_messages(self.now - timedelta(days=days), batch_size)
+
+    def walk_back(self, page_size):
+        body = self.client.get(self.url, {'page_size': page_size}).json()
+        seen = [m['id'] for m in body['results']]
+        while body['prev']:
+            body = self.client.get(self.url, {'page_size': page_size, 'before': body['prev']}).json()
+            seen[:0] = [m['id'] for m in body['results']]
+        return seen, body
+
+    def walk_forward(self, page_size, body):
+        seen = [m['id'] for m in body['results']]
+        while body['next']:
+            body = self.client.get(self.url, {'page_size': page_size, 'after': body['next']}).json()
+            seen.extend(m['id'] for m in body['results'])
+        return seen
+
+
+class ArchiveMessagesTest(ArchiveTestCase):
+    def test_moves_old_messages_into_monthly_segments(self):
+        self.assertEqual(self.archive(), 30)
+        self.assertEqual(Message.objects.count(), 5)
+        self.assertGreaterEqual(ArchivedSegment.objects.count(), 3)
+        self.assertEqual(sum(ArchivedSegment.objects.values_list('message_count', flat=True)), 30)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.archived_until, self.messages[29].timestamp)
+
+    def test_merges_into_existing_segment(self):
+        self.archive(days=250)
+        self.archive(days=1)
+        self.assertEqual(Message.objects.count(), 5)
+        self.assertEqual(sum(ArchivedSegment.objects.values_list('message_count', flat=True)), 30)
+        seen, _ = self.walk_back(6)
+        self.assertEqual(seen, self.ids)
+
+    def test_messages_saved_before_search_index(self):
+        # 0006 이전에 저장되어 0008에서 색인된 메시지도 삭제 트리거가 인덱스를 깨뜨리지 않는다
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')")
+            backfill.rebuild(None, SimpleNamespace(connection=connection, execute=cursor.execute))
+        self.assertEqual(self.archive(), 30)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('integrity-check', 1)")
+        results = self.client.get('/chat/search/', {'travel_user_id': 1, 'q': 'hotel'}).json()['results']
+        self.assertEqual(results, [])
+
+    def test_report_and_prune(self):
+        self.archive(days=250)
+        self.archive(days=1)
+        out = StringIO()
+        call_command('archive_messages', '--report', stdout=out)
+        # 다시 쓴 세그먼트의 이전 파일은 고아로 남는다
+        self.assertIn('Orphaned segment file', out.getvalue())
+        self.assertNotIn('Missing', out.getvalue())
+
+
+class ReadThroughTest(ArchiveTestCase):
+    def test_walk_back_across_boundary(self):
+        expected, _ = self.walk_back(7)
+        self.archive()
+        for page_size in (7, 4, 5):
+            seen, _ = self.walk_back(page_size)
+            self.assertEqual(seen, self.ids)
+        self.assertEqual(seen, expected)
+
+    def test_walk_forward_across_boundary(self):
+        self.archive()
+        _, oldest = self.walk_back(4)
+        self.assertEqual(self.walk_forward(4, oldest), self.ids)
+
+    def test_after_cursor_inside_archive(self):
+        self.archive()
+        message = self.messages[4]
+        body = self.client.get(self.url, {'page_size': 5, 'after': encode_cursor(message.timestamp, message.id)}).json()
+        self.assertEqual([m['id'] for m in body['results']], self.ids[5:10])
+        # 아카이브의 마지막 메시지 다음 페이지는 핫 테이블에서 이어진다
+        message = self.messages[27]
+        body = self.client.get(self.url, {'page_size': 5, 'after': encode_cursor(message.timestamp, message.id)}).json()
+        self.assertEqual([m['id'] for m in body['results']], self.ids[28:33])
+        self.assertIsNotNone(body['next'])
+
+    def test_archived_entries_match_hot_serialization(self):
+        hot = self.client.get(self.url, {'page_size': 50}).json()['results']
+        self.archive()
+        self.assertEqual(self.client.get(self.url, {'page_size': 50}).json()['results'], hot)
+
+    def test_fully_archived_room(self):
+        Message.objects.filter(room=self.room).update(timestamp=self.now - timedelta(days=40))
+        self.archive()
+        self.assertEqual(Message.objects.count(), 0)
+        seen, _ = self.walk_back(6)
+        self.assertEqual(sorted(seen), sorted(self.ids))
+
+    def test_no_archive_lookup_for_hot_pages(self):
+        other = make_room(1)
+        Message.objects.create(room=other, sender=self.room.users.get(), text='hello')
+        # 아카이브가 없는 방은 짧은 첫 페이지와 가장 오래된 페이지도 핫 테이블 쿼리 하나로 끝난다
+        with self.assertNumQueries(1):
+            self.client.get(f'/chat/{other.id}/messages/')
+        first = self.client.get(self.url, {'page_size': 20}).json()
+        with self.assertNumQueries(1):
+            self.client.get(self.url, {'page_size': 20, 'before': first['prev']})
+
+        self.archive()
+        newest = self.client.get(self.url, {'page_size': 3}).json()
+        # 최신 구간을 가리키는 after 커서는 세그먼트를 찾지 않는다
+        with self.assertNumQueries(1):
+            self.client.get(self.url, {'page_size': 3, 'after': newest['prev']})
+        # 핫 테이블 끝에 닿으면 세그먼트 행을 한 번 더 읽는다
+        with self.assertNumQueries(2):
+            self.client.get(self.url, {'page_size': 10})
+
+    def test_newest_page_cache(self):
+        cache = LocalPageCache(10, 10)
+        with mock.patch.object(views, 'newest_page_cache', cache), mock.patch.object(archive, 'newest_page_cache', cache):
+            self.archive()
+            body = self.client.get(self.url, {'page_size': 3}).json()
+            self.assertEqual(len(body['results']), 3)
+            self.assertIsNotNone(body['prev'])
+            # 핫 메시지가 5개뿐이어도 아카이브가 있으므로 '방의 전체 메시지'로 캐시하지 않는다
+            body = self.client.get(self.url, {'page_size': 6}).json()
+            self.assertIsNotNone(body['prev'])
+
+            Message.objects.all().update(timestamp=self.now - timedelta(days=40))
+            self.archive()
+            response = self.client.get(self.url, {'page_size': 3})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['results']), 3)
+
+
+class BackfillArchivedUntilTest(TestCase):
+    def test_backfill(self):
+        migration = import_module('chat.migrations.0009_chatroom_archived_until')
+        room, other = make_room(1), make_room(2)
+        last = timezone.now() - timedelta(days=40)
+        for timestamp in (last - timedelta(days=40), last):
+            ArchivedSegment.objects.create(room=room, month=timestamp.date().replace(day=1), path='x',
+                                           first_timestamp=timestamp, first_message_id=1,
+                                           last_timestamp=timestamp, last_message_id=1)
+        migration.backfill(apps, None)
+        self.assertEqual(ChatRoom.objects.get(id=room.id).archived_until, last)
+        self.assertIsNone(ChatRoom.objects.get(id=other.id).archived_until)
@@ -0,0 +1,138 @@
+import functools
+
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from chat.backpressure import (
+    PROTOCOL_SCOPE_KEY, SLOW_CONSUMER_CLOSE_CODE, DaphneProtocolMiddleware, WriteGate, attach_write_gate,
+    find_protocol,
+)
+from chat.identity import user_identity_cache
+from chat.throttle import sender_limiter
+from config.asgi import application
+
+from .support import IN_MEMORY_LAYERS, amake_room, connect
+
+
+class FakeProtocol:
+    """daphne WebSocket protocol 중 attach_write_gate가 쓰는 부분."""
+
+    transport = object()
+    producer = None
+
+    def registerProducer(self, producer, streaming):
+        if self.producer is not None:
+            raise RuntimeError('Cannot register producer, because a producer is already registered.')
+        self.producer = producer
+
+
+async def handle_reply(send, protocol, message):
+    await send(message)
+
+
+def daphne_send(send, protocol, style):
+    """daphne가 앱에 넘기는 send. '2.5'는 protocol을 closure로 잡은 lambda, '3'은 functools.partial."""
+    if style == '2.5':
+        return lambda message: handle_reply(send, protocol, message)
+    return functools.partial(handle_reply, send, protocol)
+
+
+def daphne_style_app(protocol, style='2.5'):
+    """daphne처럼 protocol이 묶인 send로 config.asgi.application(세션·인증 middleware 포함)을 실행한다."""
+    async def wrapped(scope, receive, send):
+        await application(scope, receive, daphne_send(send, protocol, style))
+    return wrapped
+
+
+class WriteGateTest(SimpleTestCase):
+    def test_attach(self):
+        protocol = FakeProtocol()
+        gate = attach_write_gate(protocol)
+        self.assertIs(protocol.producer, gate)
+        self.assertTrue(gate.writable)
+        gate.pauseProducing()
+        self.assertFalse(gate.writable)
+        gate.resumeProducing()
+        self.assertTrue(gate.writable)
+
+    def test_not_daphne(self):
+        self.assertIsNone(attach_write_gate(None))
+        protocol = FakeProtocol()
+        protocol.registerProducer(WriteGate(), True)
+        self.assertIsNone(attach_write_gate(protocol))
+
+    def test_find_protocol(self):
+        protocol = FakeProtocol()
+        for style in ('2.5', '3'):
+            with self.subTest(style):
+                self.assertIs(find_protocol(daphne_send(None, protocol, style)), protocol)
+        self.assertIsNone(find_protocol(lambda message: None))
+        self.assertIsNone(find_protocol(FakeProtocol().registerProducer))
+
+    async def test_middleware_records_protocol(self):
+        protocol = FakeProtocol()
+        scopes = []
+
+        async def app(scope, receive, send):
+            scopes.append(scope)
+
+        scope = {'type': 'websocket'}
+        await DaphneProtocolMiddleware(app)(scope, None, daphne_send(None, protocol, '3'))
+        await DaphneProtocolMiddleware(app)(scope, None, lambda message: None)
+        self.assertIs(scopes[0][PROTOCOL_SCOPE_KEY], protocol)
+        self.assertNotIn(PROTOCOL_SCOPE_KEY, scopes[1])
+        self.assertNotIn(PROTOCOL_SCOPE_KEY, scope)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, CHAT_OUTBOX_MAX_BYTES=600)
+class SlowConsumerTest(TransactionTestCase):
+    def setUp(self):
+        user_identity_cache.clear()
+        sender_limiter._buckets.clear()
+
+    async def fill_slow_socket(self):
+        """송신 버퍼가 막힌 소켓(slow)에 메시지 10개를 방송하고 (slow, protocol, fast)를 반환한다."""
+        room = await amake_room(1)
+        protocol = FakeProtocol()
+        slow = WebsocketCommunicator(daphne_style_app(protocol), f'/ws/chat/{room.id}/')
+        self.assertTrue((await slow.connect())[0])
+        fast = await connect(f'/ws/chat/{room.id}/')
+        await slow.receive_json_from()
+        await fast.receive_json_from()
+        protocol.producer.pauseProducing()
+        for i in range(10):
+            await fast.send_json_to({'sender_id': 1, 'message': f'm{i}'})
+            await fast.receive_json_from()
+        return slow, protocol, fast
+
+    async def test_gate_attached_through_asgi_stack(self):
+        # 세션 middleware가 send를 감싸도 daphne 2.5, 3 모두 gate가 걸린다
+        room = await amake_room(1)
+        for style in ('2.5', '3'):
+            with self.subTest(style):
+                protocol = FakeProtocol()
+                communicator = WebsocketCommunicator(daphne_style_app(protocol, style), f'/ws/chat/{room.id}/')
+                self.assertTrue((await communicator.connect())[0])
+                self.assertIsInstance(protocol.producer, WriteGate)
+                await communicator.disconnect()
+
+    async def test_drop_policy(self):
+        with self.settings(CHAT_SLOW_CONSUMER_POLICY='drop'):
+            slow, protocol, fast = await self.fill_slow_socket()
+            self.assertTrue(await slow.receive_nothing(0.1))
+            protocol.producer.resumeProducing()
+            # 버린 프레임 수를 먼저 알리고 남은 프레임을 순서대로 보낸다
+            dropped = await slow.receive_json_from()
+            self.assertEqual(dropped['type'], 'dropped')
+            self.assertGreater(dropped['count'], 0)
+            rest = [await slow.receive_json_from() for _ in range(10 - dropped['count'])]
+            self.assertEqual([frame['message'] for frame in rest], [f'm{i}' for i in range(dropped['count'], 10)])
+        await slow.disconnect()
+        await fast.disconnect()
+
+    async def test_disconnect_policy(self):
+        with self.settings(CHAT_SLOW_CONSUMER_POLICY='disconnect'), self.assertLogs('chat.consumers', 'INFO'):
+            slow, _, fast = await self.fill_slow_socket()
+            output = await slow.receive_output()
+        self.assertEqual((output['type'], output['code']), ('websocket.close', SLOW_CONSUMER_CLOSE_CODE))
+        await fast.disconnect()
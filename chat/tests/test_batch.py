@@ -0,0 +1,53 @@
+import json
+
+from django.test import TransactionTestCase, override_settings
+
+from chat.identity import user_identity_cache
+
+from .support import IN_MEMORY_LAYERS, amake_room, connect
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, CHAT_RATE_LIMITS={}, CHAT_BATCH_WINDOW=0.2)
+class BatchedFramesTest(TransactionTestCase):
+    def setUp(self):
+        user_identity_cache.clear()
+
+    async def send_messages(self, count):
+        room = await amake_room(1)
+        sender = await connect(f'/ws/chat/{room.id}/')
+        batched = await connect(f'/ws/chat/{room.id}/?batch=1')
+        await sender.receive_json_from()
+        await batched.receive_json_from()
+        for i in range(count):
+            await sender.send_json_to({'sender_id': 1, 'message': f'm{i}'})
+        # batch 없이 접속한 소켓은 프레임마다 객체 하나를 받는다
+        for i in range(count):
+            self.assertEqual((await sender.receive_json_from())['message'], f'm{i}')
+        await sender.disconnect()
+        return batched
+
+    async def test_frames_within_window_share_one_array(self):
+        batched = await self.send_messages(3)
+        frame = json.loads(await batched.receive_from(timeout=2))
+        self.assertIsInstance(frame, list)
+        self.assertEqual([item['message'] for item in frame], ['m0', 'm1', 'm2'])
+        self.assertTrue(await batched.receive_nothing(timeout=0.3))
+        await batched.disconnect()
+
+    async def test_max_frames_splits_arrays(self):
+        with self.settings(CHAT_BATCH_MAX_FRAMES=2):
+            batched = await self.send_messages(3)
+            frames = [json.loads(await batched.receive_from(timeout=2)) for _ in range(2)]
+        self.assertEqual([[item['message'] for item in frame] for frame in frames], [['m0', 'm1'], ['m2']])
+        await batched.disconnect()
+
+    async def test_errors_are_batched_in_order(self):
+        room = await amake_room(1)
+        batched = await connect(f'/ws/chat/{room.id}/?batch=1')
+        self.assertIsInstance(await batched.receive_json_from(), list)
+        await batched.send_json_to({'sender_id': 1})
+        await batched.send_json_to({'sender_id': 1, 'message': 'hello'})
+        frame = await batched.receive_json_from(timeout=2)
+        self.assertIn('error', frame[0])
+        self.assertEqual(frame[1]['message'], 'hello')
+        await batched.disconnect()
@@ -0,0 +1,75 @@
+import asyncio
+
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from chat.bench import rest, ws_fanout
+from chat.bench.support import compare_metrics, percentile
+
+from .support import IN_MEMORY_LAYERS
+
+
+class SupportTest(SimpleTestCase):
+    def test_percentile(self):
+        self.assertIsNone(percentile([], 0.5))
+        self.assertEqual(percentile([3, 1, 2], 0.5), 2)
+        self.assertEqual(percentile(range(101), 0.99), 99)
+
+    def test_compare_metrics(self):
+        self.assertIsNone(compare_metrics('rate', 90, 100, True, 0.2))
+        self.assertIsNotNone(compare_metrics('rate', 70, 100, True, 0.2))
+        self.assertIsNone(compare_metrics('p95', 110, 100, False, 0.2))
+        self.assertIsNotNone(compare_metrics('p95', 130, 100, False, 0.2))
+        self.assertIsNone(compare_metrics('p95', 130, None, False, 0.2))
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, CHAT_RATE_LIMITS={})
+class WsFanoutBenchmarkTest(TransactionTestCase):
+    def test_small_run_delivers_everything(self):
+        results = asyncio.run(ws_fanout.run_benchmark([2, 3], rooms=2, messages_per_room=3, rate=0, timeout=10))
+        self.assertEqual([scenario['room_size'] for scenario in results['scenarios']], [2, 3])
+        for scenario in results['scenarios']:
+            self.assertEqual(scenario['delivered'], scenario['expected_deliveries'])
+        self.assertEqual(ws_fanout.find_regressions(results, results, 0.2), [])
+
+    def test_missing_deliveries_reported(self):
+        scenario = {'room_size': 2, 'rooms': 1, 'messages_per_room': 1, 'rate': 0,
+                    'delivered': 1, 'expected_deliveries': 2}
+        regressions = ws_fanout.find_regressions({'scenarios': [scenario]}, None, 0.2)
+        self.assertEqual(regressions, ['room_size=2 delivered 1 of 2'])
+
+
+class RestBenchmarkTest(TestCase):
+    def test_query_budgets(self):
+        dataset = rest.run_dataset(rooms=3, messages_per_room=12, members_per_room=3, iterations=2)
+        self.assertEqual(set(dataset['endpoints']), set(rest.QUERY_BUDGETS))
+        self.assertEqual(rest.find_regressions({'datasets': [dataset]}, None, 0.5), [])
+
+    def test_find_regressions(self):
+        def dataset(rooms, queries, p50=1.0):
+            return {'rooms': rooms, 'messages_per_room': 10,
+                    'endpoints': {'message_list': {'queries': queries, 'p50_ms': p50, 'p95_ms': p50}}}
+
+        self.assertEqual(
+            rest.find_regressions({'datasets': [dataset(1, 2)]}, None, 0.5),
+            ['1x10 message_list: 2 queries > budget 1'],
+        )
+        self.assertIn('message_list: query count grows with dataset size [1, 0]',
+                      rest.find_regressions({'datasets': [dataset(1, 1), dataset(2, 0)]}, None, 0.5))
+        regressions = rest.find_regressions({'datasets': [dataset(1, 1, p50=3.0)]},
+                                            {'datasets': [dataset(1, 1, p50=1.0)]}, 0.5)
+        self.assertEqual(len(regressions), 2)
+
+
+class RoomDetailTest(TestCase):
+    def test_detail_sees_current_rows(self):
+        from chat.models import ChatRoom
+
+        room = ChatRoom.objects.create(room_name='before')
+        self.assertEqual(self.client.get(f'/chat/rooms/{room.id}/').json()['room_name'], 'before')
+        ChatRoom.objects.filter(id=room.id).update(room_name='after')
+        self.assertEqual(self.client.get(f'/chat/rooms/{room.id}/').json()['room_name'], 'after')
+        response = self.client.put(f'/chat/rooms/{room.id}/', {'room_name': 'renamed', 'users': []},
+                                   content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(ChatRoom.objects.get(id=room.id).room_name, 'renamed')
+        self.assertEqual(self.client.get('/chat/rooms/999/').status_code, 404)
@@ -0,0 +1,77 @@
+import msgpack
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from chat.bench import codecs as codec_bench
+from chat.codecs import JsonCodec, MsgpackCodec, encode_shared, encoded_frames, negotiate
+from chat.identity import user_identity_cache
+from chat.routing import websocket_urlpatterns
+
+from .support import IN_MEMORY_LAYERS, amake_room, connect
+
+FRAMES = [{'type': 'chat_message', 'message': '안녕 👋', 'sender_id': 1}, {'type': 'ephemeral', 'events': [['typing', 1, True]]}]
+
+
+class CodecTest(SimpleTestCase):
+    def test_round_trip(self):
+        for codec in (JsonCodec, MsgpackCodec):
+            for frame in FRAMES:
+                self.assertEqual(codec.decode(codec.encode(frame)), frame)
+
+    def test_join_is_an_encoded_array(self):
+        for codec in (JsonCodec, MsgpackCodec):
+            joined = codec.join([codec.encode(frame) for frame in FRAMES])
+            self.assertEqual(codec.decode(joined), FRAMES)
+
+    def test_negotiate(self):
+        self.assertEqual(negotiate(None), (JsonCodec, None))
+        self.assertEqual(negotiate(['unknown', 'msgpack']), (MsgpackCodec, 'msgpack'))
+        self.assertEqual(negotiate(['json', 'msgpack']), (JsonCodec, 'json'))
+
+    def test_shared_encoding_per_codec(self):
+        encoded_frames.clear()
+        self.assertEqual(encode_shared(JsonCodec, ('k',), FRAMES[0]), JsonCodec.encode(FRAMES[0]))
+        self.assertEqual(encode_shared(MsgpackCodec, ('k',), FRAMES[0]), MsgpackCodec.encode(FRAMES[0]))
+        # 같은 key면 내용이 아니라 처음 인코딩한 결과를 돌려준다
+        self.assertEqual(encode_shared(JsonCodec, ('k',), FRAMES[1]), JsonCodec.encode(FRAMES[0]))
+
+    def test_benchmark_round_trips(self):
+        results = codec_bench.run_benchmark(2)
+        sizes = {(item['shape'], item['codec']): item['bytes'] for item in results['results']}
+        for shape in codec_bench.sample_shapes():
+            self.assertLess(sizes[shape, 'msgpack'], sizes[shape, 'json'])
+        self.assertEqual(codec_bench.find_regressions(results, results, 0.5), [])
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class MsgpackSocketTest(TransactionTestCase):
+    def setUp(self):
+        user_identity_cache.clear()
+
+    async def test_binary_frames(self):
+        room = await amake_room(1)
+        communicator = await connect(f'/ws/chat/{room.id}/', subprotocols=['msgpack'])
+        self.assertEqual(msgpack.unpackb(await communicator.receive_from())['type'], 'participants')
+        json_socket = await connect(f'/ws/chat/{room.id}/')
+        await json_socket.receive_json_from()
+
+        await communicator.send_to(bytes_data=MsgpackCodec.encode({'sender_id': 1, 'message': '안녕'}))
+        frame = MsgpackCodec.decode(await communicator.receive_from())
+        self.assertEqual((frame['type'], frame['message']), ('message', '안녕'))
+        # 같은 방의 JSON 소켓은 같은 메시지를 텍스트로 받는다
+        self.assertEqual((await json_socket.receive_json_from())['message'], '안녕')
+
+        # msgpack 소켓도 텍스트(JSON) 프레임은 받는다
+        await communicator.send_json_to({'sender_id': 1, 'message': 'text'})
+        self.assertEqual(MsgpackCodec.decode(await communicator.receive_from())['message'], 'text')
+        await communicator.disconnect()
+        await json_socket.disconnect()
+
+    async def test_accepts_requested_subprotocol(self):
+        room = await amake_room(1)
+        for subprotocols, accepted in ((['msgpack'], 'msgpack'), (['unknown'], None), (None, None)):
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{room.id}/',
+                                                 subprotocols=subprotocols)
+            self.assertEqual(await communicator.connect(), (True, accepted))
+            await communicator.disconnect()
@@ -0,0 +1,128 @@
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from chat.cache import TTLCache
+from chat.identity import user_identity_cache
+from chat.models import ChatRoom, Message, User
+
+from .support import IN_MEMORY_LAYERS, amake_room, connect, make_room
+
+
+class TTLCacheTest(SimpleTestCase):
+    def test_lru(self):
+        cache = TTLCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+    def test_ttl(self):
+        cache = TTLCache(10, ttl=10)
+        with mock.patch('chat.cache.time.monotonic', return_value=100):
+            cache.set('a', 1)
+        with mock.patch('chat.cache.time.monotonic', return_value=109):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('chat.cache.time.monotonic', return_value=110):
+            self.assertIsNone(cache.get('a'))
+        cache.set('b', 1, ttl=0)
+        self.assertIsNone(cache.get('b'))
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class ChatConsumerTest(TransactionTestCase):
+    def setUp(self):
+        user_identity_cache.clear()
+
+    async def test_message_fan_out(self):
+        room = await amake_room(1, 2)
+        sockets = [await connect(f'/ws/chat/{room.id}/') for _ in range(3)]
+        for socket in sockets:
+            self.assertEqual(len((await socket.receive_json_from())['participants']), 2)
+
+        with mock.patch('chat.identity.User.objects.only', wraps=User.objects.only) as lookup:
+            await sockets[0].send_json_to({'type': 'message', 'sender_id': 1, 'message': 'hi'})
+            frames = [await socket.receive_json_from() for socket in sockets]
+        # 발신 측에서 한 번만 조회한 sender가 이벤트에 실려 모든 수신자에게 간다
+        self.assertEqual(lookup.call_count, 1)
+        for frame in frames:
+            self.assertEqual(frame['type'], 'message')
+            self.assertEqual(frame['message'], 'hi')
+            self.assertEqual(frame['sender'], {'travel_user_id': 1})
+        self.assertEqual(await sync_to_async(Message.objects.filter(room_id=room.id).count)(), 1)
+        for socket in sockets:
+            await socket.disconnect()
+
+    async def test_non_participant_rejected(self):
+        room = await amake_room(1)
+        await sync_to_async(User.objects.create)(travel_user_id=3)
+        socket = await connect(f'/ws/chat/{room.id}/')
+        await socket.receive_json_from()
+        await socket.send_json_to({'type': 'message', 'sender_id': 3, 'message': 'no'})
+        self.assertIn('error', await socket.receive_json_from())
+        self.assertEqual(await sync_to_async(Message.objects.count)(), 0)
+        await socket.disconnect()
+
+
+class MembershipVersionTest(TestCase):
+    def version(self, room):
+        return ChatRoom.objects.values_list('membership_version', flat=True).get(id=room.id)
+
+    def test_bumped_from_both_sides(self):
+        room = make_room(1)
+        start = self.version(room)
+        other = User.objects.create(travel_user_id=2)
+        room.users.add(other)
+        self.assertEqual(self.version(room), start + 1)
+        other.chat_rooms.remove(room)
+        self.assertEqual(self.version(room), start + 2)
+        other.chat_rooms.add(room)
+        other.chat_rooms.clear()
+        self.assertEqual(self.version(room), start + 4)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class MembershipCacheTest(TransactionTestCase):
+    def setUp(self):
+        user_identity_cache.clear()
+
+    async def test_invite_and_leave(self):
+        room = await amake_room(1, 2)
+        await sync_to_async(User.objects.create)(travel_user_id=3)
+        first = await connect(f'/ws/chat/{room.id}/')
+        second = await connect(f'/ws/chat/{room.id}/')
+        await first.receive_json_from()
+        await second.receive_json_from()
+
+        await first.send_json_to({'type': 'invite', 'travel_user_id': 3})
+        self.assertEqual(len((await second.receive_json_from())['participants']), 3)
+        types = {(await first.receive_json_from())['type'], (await first.receive_json_from())['type']}
+        self.assertEqual(types, {'invite', 'participants'})
+        # 다른 소켓의 참가자 캐시도 participants_update로 갱신되어 새 참가자가 바로 보낼 수 있다
+        await second.send_json_to({'type': 'message', 'sender_id': 3, 'message': 'yes'})
+        self.assertEqual((await first.receive_json_from())['message'], 'yes')
+        await second.receive_json_from()
+
+        await second.send_json_to({'type': 'leave', 'sender_id': 2})
+        self.assertEqual(len((await first.receive_json_from())['participants']), 2)
+        self.assertEqual((await first.receive_json_from())['type'], 'room_update')
+        await first.send_json_to({'type': 'message', 'sender_id': 2, 'message': 'x'})
+        self.assertIn('error', await first.receive_json_from())
+        await first.disconnect()
+        await second.disconnect()
+
+    async def test_rest_membership_change_noticed(self):
+        room = await amake_room(1)
+        await sync_to_async(User.objects.create)(travel_user_id=5)
+        socket = await connect(f'/ws/chat/{room.id}/')
+        await socket.receive_json_from()
+        await socket.send_json_to({'type': 'message', 'sender_id': 5, 'message': 'x'})
+        self.assertIn('error', await socket.receive_json_from())
+
+        # 소켓을 거치지 않은 변경은 membership_version으로 알아챈다
+        await sync_to_async(lambda: room.users.add(User.objects.get(travel_user_id=5)))()
+        await socket.send_json_to({'type': 'message', 'sender_id': '5', 'message': 'x'})
+        self.assertEqual((await socket.receive_json_from())['message'], 'x')
+        await socket.disconnect()
@@ -0,0 +1,72 @@
+import asyncio
+import os
+import tempfile
+import threading
+
+from django.db import connections
+from django.db.utils import OperationalError
+from django.test import SimpleTestCase
+
+from chat.backends.sqlite3.base import DatabaseWrapper
+from chat.db import SerializedWriter, lock_wait_stats
+
+
+def production_connection(path, alias):
+    settings_dict = dict(connections['default'].settings_dict)
+    settings_dict.update({
+        'ENGINE': 'chat.backends.sqlite3', 'NAME': path,
+        'OPTIONS': {'timeout': 0.1, 'pragmas': {'journal_mode': 'WAL', 'busy_timeout': 100}},
+    })
+    return DatabaseWrapper(settings_dict, alias=alias)
+
+
+class ProductionSqliteBackendTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'db.sqlite3')
+        self.first = production_connection(self.path, 'first')
+        self.second = production_connection(self.path, 'second')
+        self.addCleanup(self.first.close)
+        self.addCleanup(self.second.close)
+
+    def test_pragmas_applied(self):
+        with self.first.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 100)
+
+    def test_immediate_transaction_takes_write_lock(self):
+        with self.first.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (x INTEGER)')
+        before = lock_wait_stats.stats()['count']
+        self.first.immediate_transactions = True
+        self.first._start_transaction_under_autocommit()
+        self.assertEqual(lock_wait_stats.stats()['count'], before + 1)
+        try:
+            # 읽기만 한 트랜잭션이어도 쓰기 잠금을 잡고 있으므로 다른 연결의 쓰기는 busy_timeout 후 실패한다
+            with self.assertRaisesRegex(OperationalError, 'locked'):
+                with self.second.cursor() as cursor:
+                    cursor.execute('INSERT INTO t VALUES (1)')
+            with self.second.cursor() as cursor:
+                cursor.execute('SELECT COUNT(*) FROM t')
+                self.assertEqual(cursor.fetchone()[0], 0)
+        finally:
+            self.first.connection.rollback()
+
+
+class SerializedWriterTest(SimpleTestCase):
+    async def test_runs_in_order_on_one_thread(self):
+        writer = SerializedWriter()
+        seen = []
+
+        def work(index):
+            seen.append((index, threading.current_thread().name))
+            return index
+
+        results = await asyncio.gather(*(writer.run(work, index) for index in range(5)))
+        self.assertEqual(results, list(range(5)))
+        self.assertEqual([index for index, _ in seen], list(range(5)))
+        self.assertEqual(len({name for _, name in seen}), 1)
+        self.assertTrue(seen[0][1].startswith('sqlite-writer'))
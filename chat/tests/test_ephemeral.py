@@ -0,0 +1,135 @@
+import asyncio
+import unittest
+
+from asgiref.sync import sync_to_async
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+
+from chat.identity import user_identity_cache
+from chat.models import Message
+from chat.pagination import encode_cursor
+from chat.presence import LocalPresence, RedisPresence, presence
+from chat.throttle import sender_limiter
+
+from .support import IN_MEMORY_LAYERS, amake_room, connect
+
+try:
+    from fakeredis import aioredis as fake_aioredis
+except ImportError:
+    fake_aioredis = None
+
+
+class PresenceContract:
+    """LocalPresence와 RedisPresence가 함께 지켜야 하는 동작. make_presence(ttl)을 구현한다."""
+
+    async def test_online_while_any_connection_is_open(self):
+        store = self.make_presence(60)
+        self.assertTrue(await store.join(1, 'a', 7))
+        self.assertFalse(await store.join(1, 'b', 7))
+        self.assertTrue(await store.join(1, 'c', 8))
+        self.assertEqual(await store.online(1), [7, 8])
+        self.assertFalse(await store.leave(1, 'a', 7))
+        self.assertTrue(await store.leave(1, 'b', 7))
+        self.assertEqual(await store.online(1), [8])
+        self.assertEqual(await store.online(2), [])
+
+    async def test_expires_without_heartbeat(self):
+        store = self.make_presence(0.05)
+        await store.join(1, 'a', 7)
+        await store.join(1, 'b', 8)
+        await asyncio.sleep(0.03)
+        await store.touch(1, 'b', 8)
+        await asyncio.sleep(0.03)
+        self.assertEqual(await store.online(1), [8])
+
+
+class LocalPresenceTest(PresenceContract, unittest.IsolatedAsyncioTestCase):
+    def make_presence(self, ttl):
+        return LocalPresence(ttl)
+
+
+@unittest.skipIf(fake_aioredis is None, 'fakeredis is not installed')
+class RedisPresenceTest(PresenceContract, unittest.IsolatedAsyncioTestCase):
+    def make_presence(self, ttl):
+        store = RedisPresence('redis://presence', ttl)
+        client = fake_aioredis.FakeRedis()
+        store._client = lambda: client
+        return store
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, CHAT_EPHEMERAL_WINDOW=0.05)
+class EphemeralEventsTest(TransactionTestCase):
+    def setUp(self):
+        user_identity_cache.clear()
+        sender_limiter._buckets.clear()
+        presence._rooms.clear()
+
+    async def join(self):
+        """사용자 1, 2가 차례로 접속하고 presence 프레임까지 읽은 두 소켓을 반환한다."""
+        room = await amake_room(1, 2)
+        self.room_id = room.id
+        first = await connect(f'/ws/chat/{room.id}/?travel_user_id=1')
+        await first.receive_json_from()
+        self.assertEqual(await first.receive_json_from(), {'type': 'presence', 'online': [1]})
+        second = await connect(f'/ws/chat/{room.id}/?travel_user_id=2')
+        await second.receive_json_from()
+        self.assertEqual(await second.receive_json_from(), {'type': 'presence', 'online': [1, 2]})
+        self.assertEqual(await first.receive_json_from(), {'type': 'ephemeral', 'events': [['presence', 2, True]]})
+        return first, second
+
+    async def test_presence_on_connect_and_disconnect(self):
+        first, second = await self.join()
+        await second.disconnect()
+        self.assertEqual(await first.receive_json_from(), {'type': 'ephemeral', 'events': [['presence', 2, False]]})
+        await first.disconnect()
+
+    async def test_coalesced_within_window(self):
+        first, second = await self.join()
+        count = await sync_to_async(Message.objects.count)()
+        for _ in range(5):
+            await first.send_json_to({'type': 'typing'})
+        await first.send_json_to({'type': 'read', 'cursor': encode_cursor(timezone.now(), 3)})
+        frame = await second.receive_json_from(timeout=2)
+        self.assertEqual(frame['type'], 'ephemeral')
+        self.assertEqual([event[:2] for event in frame['events']], [['typing', 1], ['read', 1]])
+        # 보낸 사람에게는 돌아오지 않고 DB에도 저장하지 않는다
+        self.assertTrue(await first.receive_nothing(timeout=0.1))
+        self.assertEqual(await sync_to_async(Message.objects.count)(), count)
+        await first.disconnect()
+        await second.disconnect()
+
+    async def test_repeated_value_suppressed(self):
+        first, second = await self.join()
+        await first.send_json_to({'type': 'typing'})
+        await second.receive_json_from(timeout=2)
+        await first.send_json_to({'type': 'typing'})
+        self.assertTrue(await second.receive_nothing(timeout=0.2))
+        await first.send_json_to({'type': 'typing', 'typing': False})
+        self.assertEqual((await second.receive_json_from(timeout=2))['events'], [['typing', 1, False]])
+        await first.disconnect()
+        await second.disconnect()
+
+    async def test_rate_limited(self):
+        first, second = await self.join()
+        for i in range(30):
+            await first.send_json_to({'type': 'typing', 'typing': i % 2 == 0})
+        await asyncio.sleep(0.2)
+        self.assertEqual(len((await second.receive_json_from(timeout=2))['events']), 1)
+        await first.disconnect()
+        await second.disconnect()
+
+    async def test_non_participant_rejected(self):
+        first, second = await self.join()
+        await first.send_json_to({'type': 'typing', 'sender_id': 99})
+        self.assertIn('error', await first.receive_json_from())
+        await first.disconnect()
+        await second.disconnect()
+
+    async def test_expired_events_dropped(self):
+        first, second = await self.join()
+        # 채널 레이어에서 CHAT_EPHEMERAL_MAX_AGE보다 오래 머문 이벤트
+        with self.settings(CHAT_EPHEMERAL_MAX_AGE=-1):
+            await first.send_json_to({'type': 'typing'})
+            self.assertTrue(await second.receive_nothing(timeout=0.2))
+        await first.disconnect()
+        await second.disconnect()
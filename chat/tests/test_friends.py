@@ -0,0 +1,64 @@
+import threading
+from unittest import mock
+
+from django.test import TransactionTestCase
+
+from chat import upstream
+from chat.friends import accepted_friend_ids, friend_cache
+from chat.models import ChatRoom, User
+from chat.upstream import CircuitBreaker, UpstreamClient
+from chat.upstream_stub import StubUpstreamServer
+
+
+class FriendCacheTest(TransactionTestCase):
+    def setUp(self):
+        friend_cache.clear()
+        self.stub = StubUpstreamServer(friends={1: [2, 3]}, latency=0.05).start()
+        self.addCleanup(self.stub.stop)
+        client = UpstreamClient(self.stub.url, timeout=2, max_concurrency=4, retries=0, backoff=0.01,
+                                breaker=CircuitBreaker(5, 60))
+        patcher = mock.patch.object(upstream, 'upstream', client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        User.objects.create(travel_user_id=1, jwt_token='token-1', jwt_refresh_token='refresh-1')
+
+    def create_room(self, *friend_ids):
+        return self.client.post('/chat/rooms/', {
+            'travel_user_id': 1, 'users': [{'travel_user_id': friend_id} for friend_id in friend_ids],
+        }, content_type='application/json')
+
+    def test_cached_between_creations(self):
+        for _ in range(3):
+            self.assertEqual(self.create_room(2).status_code, 201)
+        self.assertEqual(self.stub.calls['friend/friend-list'], 1)
+        self.assertEqual(ChatRoom.objects.count(), 3)
+
+    def test_new_friend_refetched_once(self):
+        self.create_room(2)
+        self.stub.friends[1].append(4)
+        self.assertEqual(self.create_room(4).status_code, 201)
+        self.assertEqual(self.stub.calls['friend/friend-list'], 2)
+        self.assertEqual(self.create_room(9).status_code, 400)
+        self.assertEqual(self.stub.calls['friend/friend-list'], 3)
+
+    def test_concurrent_fetches_coalesced(self):
+        threads = [threading.Thread(target=accepted_friend_ids, args=(1, 'jwtToken=token-1')) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.stub.calls['friend/friend-list'], 1)
+
+    def test_expired_token_refreshed(self):
+        User.objects.filter(travel_user_id=1).update(jwt_token='expired')
+        response = self.create_room(2)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['jwtToken'], 'token-1')
+        self.assertEqual(User.objects.get(travel_user_id=1).jwt_token, 'token-1')
+
+    def test_login_invalidates(self):
+        accepted_friend_ids(1, 'jwtToken=token-1')
+        self.assertIsNotNone(friend_cache.get(1))
+        self.client.post('/users/', {'jwtToken': 'token-1', 'jwtRefreshToken': 'refresh-1'},
+                         content_type='application/json')
+        self.assertIsNone(friend_cache.get(1))
@@ -0,0 +1,109 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from channels.layers import channel_layers
+from django.test import TransactionTestCase
+
+from chat.identity import user_identity_cache
+from chat.layers import HybridChannelLayer
+
+from .support import amake_room, connect
+
+try:
+    import fakeredis
+    from fakeredis import aioredis as fake_aioredis
+    from redis.asyncio import ConnectionPool
+except ImportError:
+    fakeredis = None
+
+
+def make_layer(server, **config):
+    """server(fakeredis.FakeServer)를 Redis로 쓰는 HybridChannelLayer. 레이어 하나가 daphne 프로세스 하나다."""
+    layer = HybridChannelLayer(hosts=['redis://layer'], **config)
+    layer.create_pool = lambda index: ConnectionPool(connection_class=fake_aioredis.FakeConnection, server=server)
+    return layer
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class HybridChannelLayerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = fakeredis.FakeServer()
+        self.layer = make_layer(self.server)
+        self.other = make_layer(self.server)
+
+    async def asyncTearDown(self):
+        await self.layer.close_pools()
+        await self.other.close_pools()
+
+    async def join(self, layer, count):
+        channels = [await layer.new_channel() for _ in range(count)]
+        for channel in channels:
+            await layer.group_add('room', channel)
+        return channels
+
+    async def test_every_local_receiver_wakes(self):
+        channels = await self.join(self.layer, 3)
+        # 소켓마다 receive()를 기다리는 중에 보낸다. 그중 하나는 Redis BRPOP을 맡고 있다
+        receivers = [asyncio.ensure_future(self.layer.receive(channel)) for channel in channels]
+        await asyncio.sleep(0.05)
+        await self.layer.group_send('room', {'type': 'chat.message', 'text': 'hi'})
+        messages = await asyncio.wait_for(asyncio.gather(*receivers), 2)
+        self.assertEqual([message['text'] for message in messages], ['hi'] * 3)
+
+    async def test_remote_and_local_receivers(self):
+        local = await self.join(self.layer, 2)
+        remote = await self.join(self.other, 2)
+        receivers = [asyncio.ensure_future(layer.receive(channel))
+                     for layer, channels in ((self.layer, local), (self.other, remote)) for channel in channels]
+        await asyncio.sleep(0.05)
+        for i in range(3):
+            await self.layer.group_send('room', {'type': 'chat.message', 'n': i})
+        self.assertEqual([message['n'] for message in await asyncio.wait_for(asyncio.gather(*receivers), 2)],
+                         [0, 0, 0, 0])
+        # 나머지도 수신자마다 보낸 순서대로 도착한다
+        for layer, channels in ((self.layer, local), (self.other, remote)):
+            for channel in channels:
+                received = [(await asyncio.wait_for(layer.receive(channel), 2))['n'] for _ in range(2)]
+                self.assertEqual(received, [1, 2])
+
+    async def test_send_to_local_and_remote_channel(self):
+        (local,) = await self.join(self.layer, 1)
+        (remote,) = await self.join(self.other, 1)
+        await self.layer.send(local, {'type': 'a'})
+        await self.layer.send(remote, {'type': 'b'})
+        self.assertEqual(await asyncio.wait_for(self.layer.receive(local), 2), {'type': 'a'})
+        self.assertEqual(await asyncio.wait_for(self.other.receive(remote), 2), {'type': 'b'})
+
+    async def test_cancelled_receive_keeps_messages(self):
+        (channel,) = await self.join(self.layer, 1)
+        receiver = asyncio.ensure_future(self.layer.receive(channel))
+        await asyncio.sleep(0.01)
+        receiver.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await receiver
+        await self.layer.group_send('room', {'type': 'chat.message'})
+        self.assertEqual(await asyncio.wait_for(self.layer.receive(channel), 2), {'type': 'chat.message'})
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class HybridLayerSocketTest(TransactionTestCase):
+    def setUp(self):
+        user_identity_cache.clear()
+
+    async def test_sockets_in_one_group_all_receive(self):
+        server = fakeredis.FakeServer()
+        layer = make_layer(server)
+        room = await amake_room(1)
+        with patch.dict(channel_layers.backends, {'default': layer}):
+            try:
+                sockets = [await connect(f'/ws/chat/{room.id}/') for _ in range(3)]
+                for socket in sockets:
+                    await socket.receive_json_from()
+                await sockets[0].send_json_to({'sender_id': 1, 'message': 'hi'})
+                for socket in sockets:
+                    self.assertEqual((await socket.receive_json_from(timeout=2))['message'], 'hi')
+                for socket in sockets:
+                    await socket.disconnect()
+            finally:
+                await layer.close_pools()
@@ -0,0 +1,64 @@
+import math
+
+from django.test import SimpleTestCase, TestCase
+
+from chat.identity import user_identity_cache
+from chat.metrics import Counter, Gauge, Histogram, Registry, http_db_queries, http_request_seconds
+
+
+class MetricTypesTest(SimpleTestCase):
+    def test_counter_and_gauge(self):
+        counter = Counter('c', 'counter', ['view'])
+        counter.inc(view='a')
+        counter.inc(2, view='a"b')
+        self.assertEqual(counter.samples(), ['c{view="a"} 1.0', 'c{view="a\\"b"} 2.0'])
+        gauge = Gauge('g', 'gauge')
+        gauge.inc(3)
+        gauge.dec()
+        self.assertEqual(gauge.samples(), ['g 2.0'])
+        gauge.set(7)
+        self.assertEqual(gauge.samples(), ['g 7.0'])
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('h', 'histogram', buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value)
+        self.assertEqual(histogram.buckets[-1], math.inf)
+        self.assertEqual(histogram.samples(), [
+            'h_bucket{le="0.1"} 1', 'h_bucket{le="1.0"} 2', 'h_bucket{le="+Inf"} 3',
+            'h_count 3', 'h_sum 5.55',
+        ])
+
+    def test_registry_render(self):
+        registry = Registry()
+        registry.register(Counter('c', 'doc')).inc()
+        self.assertEqual(registry.render(), '# HELP c doc\n# TYPE c counter\nc 1.0\n')
+
+
+class MetricsMiddlewareTest(TestCase):
+    def setUp(self):
+        user_identity_cache.clear()
+
+    def request_count(self, view):
+        # 버킷별 개수(마지막 원소는 합계)를 모두 더하면 관측 횟수다
+        return sum(sum(series[:-1]) for key, series in http_request_seconds._series.items() if key[0] == view)
+
+    def test_labels_use_url_names(self):
+        before = self.request_count('health_check')
+        self.client.get('/')
+        self.assertEqual(self.request_count('health_check'), before + 1)
+
+        with self.assertLogs('django.request', 'WARNING'):
+            self.client.get('/chat/999/messages/')
+            self.client.get('/no-such-page/')
+        self.assertIn(('chat_messages',), http_db_queries._values)
+        self.assertGreater(self.request_count('unmatched'), 0)
+
+    def test_endpoint(self):
+        self.client.get('/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('chat_http_request_seconds_bucket{view="health_check",method="GET",status="200",le="+Inf"}', body)
+        self.assertIn('chat_write_behind{stat="depth"}', body)
+        self.assertIn('chat_sqlite_lock_wait{stat="count"}', body)
@@ -0,0 +1,52 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from chat.identity import user_identity_cache
+from chat.models import ChatRoom, Message, User
+from chat.operations import invite_to_room, leave_room, post_message, room_participants, user_rooms
+
+from .support import make_room
+
+
+class OperationsTest(TestCase):
+    def setUp(self):
+        user_identity_cache.clear()
+        self.room = make_room(1, 2)
+
+    def test_post_message(self):
+        message, sender = post_message(self.room.id, 1, 'hi')
+        self.assertEqual(sender, {'travel_user_id': 1})
+        self.assertEqual(Message.objects.get().text, 'hi')
+        self.room.refresh_from_db()
+        self.assertEqual((self.room.message_count, self.room.last_message_text), (1, 'hi'))
+
+    def test_post_message_non_participant(self):
+        User.objects.create(travel_user_id=3)
+        self.assertIsNone(post_message(self.room.id, 3, 'no'))
+        self.assertFalse(Message.objects.exists())
+
+    def test_post_message_reuses_identity(self):
+        post_message(self.room.id, 1, 'first', check_membership=False)
+        with CaptureQueriesContext(connection) as queries:
+            post_message(self.room.id, 1, 'second', check_membership=False)
+        self.assertFalse(any('"chat_user"' in query['sql'] and 'FROM' in query['sql'] for query in queries))
+
+    def test_invite_and_leave(self):
+        User.objects.create(travel_user_id=3)
+        participants, version = invite_to_room(self.room.id, 3)
+        self.assertEqual({p['travel_user_id'] for p in participants}, {1, 2, 3})
+        participants, newer = leave_room(self.room.id, 2)
+        self.assertEqual({p['travel_user_id'] for p in participants}, {1, 3})
+        self.assertGreater(newer, version)
+        self.assertEqual((participants, newer), room_participants(self.room.id))
+
+    def test_user_rooms(self):
+        other = make_room(1, 3)
+        make_room(2)
+        with self.assertNumQueries(2):
+            rooms = user_rooms(1)
+        self.assertEqual(set(rooms), {self.room.id, other.id})
+        participants, version = rooms[other.id]
+        self.assertEqual({p['travel_user_id'] for p in participants}, {1, 3})
+        self.assertEqual(version, ChatRoom.objects.get(id=other.id).membership_version)
@@ -0,0 +1,205 @@
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+import redis
+from asgiref.sync import sync_to_async
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from chat.identity import user_identity_cache
+from chat.models import Message
+from chat.operations import post_message
+from chat.page_cache import LocalPageCache, RedisPageCache, render_page
+from chat.writebehind import message_queue
+
+from .support import IN_MEMORY_LAYERS, connect, make_room, use_page_cache
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+def entries(*ids, start=None):
+    start = start or timezone.now()
+    return [((start + timedelta(seconds=i), i), f'{{"id":{i}}}'.encode()) for i in ids]
+
+
+class PageCacheContract:
+    """LocalPageCache와 RedisPageCache가 함께 지켜야 하는 동작. make_cache(size)를 구현한다."""
+
+    def setUp(self):
+        self.start = timezone.now().replace(microsecond=0)
+
+    def entries(self, *ids):
+        return entries(*ids, start=self.start)
+
+    def ids(self, result):
+        page, has_more = result
+        return [key[1] for key, _ in page], has_more
+
+    def test_miss_until_filled(self):
+        cache = self.make_cache(5)
+        self.assertIsNone(cache.get(1, 3))
+        cache.fill(1, self.entries(1, 2, 3, 4), False, cache.generation(1))
+        self.assertEqual(self.ids(cache.get(1, 3)), ([2, 3, 4], True))
+        # 방의 전체 메시지가 아니면 캐시된 수 이상을 요청할 때 DB로 간다
+        self.assertIsNone(cache.get(1, 4))
+
+    def test_complete_page(self):
+        cache = self.make_cache(5)
+        cache.fill(1, self.entries(1, 2), True, cache.generation(1))
+        self.assertEqual(self.ids(cache.get(1, 4)), ([1, 2], False))
+        cache.fill(2, [], True, cache.generation(2))
+        self.assertEqual(cache.get(2, 4), ([], False))
+
+    def test_add_keeps_order_and_size(self):
+        cache = self.make_cache(3)
+        cache.fill(1, self.entries(1, 2), True, cache.generation(1))
+        cache.add(1, self.entries(4))
+        cache.add(1, self.entries(3))
+        cache.add(1, self.entries(3))
+        self.assertEqual(self.ids(cache.get(1, 2)), ([3, 4], True))
+        # 넘쳐서 잘려 나간 페이지는 더 이상 방의 전체 메시지가 아니다
+        self.assertIsNone(cache.get(1, 3))
+
+    def test_add_to_missing_page_is_ignored(self):
+        cache = self.make_cache(3)
+        cache.add(1, self.entries(1))
+        self.assertIsNone(cache.get(1, 1))
+
+    def test_stale_fill_is_dropped(self):
+        cache = self.make_cache(5)
+        generation = cache.generation(1)
+        cache.add(1, self.entries(3))
+        cache.fill(1, self.entries(1, 2), True, generation)
+        self.assertIsNone(cache.get(1, 2))
+
+    def test_invalidate(self):
+        cache = self.make_cache(5)
+        cache.fill(1, self.entries(1, 2), True, cache.generation(1))
+        generation = cache.generation(1)
+        cache.invalidate(1)
+        self.assertIsNone(cache.get(1, 2))
+        self.assertNotEqual(cache.generation(1), generation)
+
+    def test_items_round_trip(self):
+        cache = self.make_cache(5)
+        page = self.entries(1, 2)
+        cache.fill(1, page, True, cache.generation(1))
+        self.assertEqual(cache.get(1, 2), (page, False))
+
+
+class LocalPageCacheTest(PageCacheContract, SimpleTestCase):
+    def make_cache(self, size):
+        return LocalPageCache(size, rooms=2)
+
+    def test_rooms_evicted_lru(self):
+        cache = self.make_cache(5)
+        for room_id in (1, 2):
+            cache.fill(room_id, self.entries(1), True, cache.generation(room_id))
+        cache.get(1, 1)
+        cache.fill(3, self.entries(1), True, cache.generation(3))
+        self.assertIsNone(cache.get(2, 1))
+        self.assertIsNotNone(cache.get(1, 1))
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class RedisPageCacheTest(PageCacheContract, SimpleTestCase):
+    def make_cache(self, size):
+        server = fakeredis.FakeServer()
+        with mock.patch('redis.Redis.from_url', return_value=fakeredis.FakeRedis(server=server)):
+            return RedisPageCache('redis://cache', size, ttl=60)
+
+    def test_redis_errors_are_misses(self):
+        cache = self.make_cache(5)
+        cache.fill(1, self.entries(1), True, cache.generation(1))
+        with mock.patch.object(cache._client, 'zrevrange', side_effect=redis.ConnectionError):
+            with self.assertLogs('chat.page_cache', 'WARNING'):
+                self.assertIsNone(cache.get(1, 1))
+
+
+class RenderPageTest(SimpleTestCase):
+    def test_body(self):
+        page = entries(1, 2)
+        self.assertEqual(render_page(page, False), b'{"results":[{"id":1},{"id":2}],"prev":null,"next":null}')
+        self.assertTrue(render_page(page, True).endswith(b',"next":null}'))
+        self.assertNotIn(b'"prev":null', render_page(page, True))
+
+
+class NewestPageViewTest(TestCase):
+    def setUp(self):
+        user_identity_cache.clear()
+        self.cache = LocalPageCache(100, 10)
+        stack = use_page_cache(self.cache)
+        stack.__enter__()
+        self.addCleanup(stack.close)
+        self.room = make_room(1)
+        for i in range(5):
+            post_message(self.room.id, 1, f'm{i}')
+        self.url = f'/chat/{self.room.id}/messages/'
+
+    def test_served_from_cache(self):
+        uncached = self.client.get(self.url, {'page_size': 3}).json()
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url, {'page_size': 3}).json()
+        self.assertEqual(cached, uncached)
+        self.assertEqual([m['text'] for m in cached['results']], ['m2', 'm3', 'm4'])
+        older = self.client.get(self.url, {'page_size': 3, 'before': cached['prev']}).json()
+        self.assertEqual([m['text'] for m in older['results']], ['m0', 'm1'])
+
+    def test_new_messages_added(self):
+        self.client.get(self.url, {'page_size': 3})
+        # 캐시는 저장이 커밋된 뒤에 갱신된다
+        with self.captureOnCommitCallbacks(execute=True):
+            post_message(self.room.id, 1, 'm5')
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url, {'page_size': 9}).json()
+        self.assertEqual([m['text'] for m in cached['results']], [f'm{i}' for i in range(6)])
+        self.assertIsNone(cached['prev'])
+        self.cache.clear()
+        self.assertEqual(self.client.get(self.url, {'page_size': 9}).json(), cached)
+
+    def test_edit_invalidates(self):
+        self.client.get(self.url)
+        message = Message.objects.filter(room=self.room).last()
+        message.text = 'edited'
+        message.save()
+        self.assertEqual(self.client.get(self.url, {'page_size': 3}).json()['results'][-1]['text'], 'edited')
+
+    def test_unknown_room(self):
+        with self.assertLogs('django.request', 'WARNING'):
+            self.assertEqual(self.client.get('/chat/999/messages/', {'page_size': 3}).status_code, 404)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, CHAT_WRITE_BEHIND=True)
+class WriteBehindPageCacheTest(TransactionTestCase):
+    def setUp(self):
+        user_identity_cache.clear()
+        self.cache = LocalPageCache(100, 10)
+        stack = use_page_cache(self.cache)
+        stack.__enter__()
+        self.addCleanup(stack.close)
+
+    async def test_flushed_messages_reach_cache(self):
+        room = await sync_to_async(make_room)(1)
+        await sync_to_async(post_message)(room.id, 1, 'first')
+        url = f'/chat/{room.id}/messages/'
+        await sync_to_async(self.client.get)(url)
+
+        communicator = await connect(f'/ws/chat/{room.id}/')
+        await communicator.receive_json_from()
+        await communicator.send_json_to({'type': 'message', 'sender_id': 1, 'message': 'wb'})
+        await communicator.receive_json_from()
+        await message_queue.flush()
+        await communicator.disconnect()
+
+        @sync_to_async
+        def read():
+            with self.assertNumQueries(0):
+                cached = self.client.get(url).json()
+            self.cache.clear()
+            self.assertEqual(self.client.get(url).json(), cached)
+            return [m['text'] for m in cached['results']]
+        self.assertEqual(await read(), ['first', 'wb'])
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from chat.models import Message
+from chat.pagination import decode_cursor, encode_cursor, paginate_messages
+
+from .support import make_room
+
+
+class CursorTest(TestCase):
+    def test_round_trip(self):
+        timestamp = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(timestamp, 42)), (timestamp, 42))
+
+    def test_invalid(self):
+        for cursor in ('zzz', '', encode_cursor(timezone.now(), 1)[:-3], 5, None, ['a'], b'abc'):
+            with self.assertRaises(ValidationError):
+                decode_cursor(cursor)
+
+    def test_naive_timestamp_rejected(self):
+        with self.assertRaises(ValidationError):
+            decode_cursor(encode_cursor(datetime(2024, 1, 1, 12, 0), 1))
+
+
+class PaginateMessagesTest(TestCase):
+    def setUp(self):
+        self.room = make_room(1)
+        sender = self.room.users.get()
+        start = timezone.now() - timedelta(hours=1)
+        # 같은 timestamp의 메시지는 id로 순서가 정해진다
+        self.messages = [
+            Message.objects.create(room=self.room, sender=sender, text=f'm{i}', timestamp=start + timedelta(seconds=i // 2))
+            for i in range(7)
+        ]
+
+    def page(self, **kwargs):
+        return paginate_messages(Message.objects.filter(room=self.room), 3, **kwargs)
+
+    def test_newest_page(self):
+        messages, prev_cursor, next_cursor = self.page()
+        self.assertEqual([m.text for m in messages], ['m4', 'm5', 'm6'])
+        self.assertIsNotNone(prev_cursor)
+        self.assertIsNone(next_cursor)
+
+    def test_walk_back_and_forward(self):
+        seen = []
+        messages, prev_cursor, _ = self.page()
+        seen[:0] = messages
+        while prev_cursor:
+            messages, prev_cursor, next_cursor = self.page(before=decode_cursor(prev_cursor))
+            seen[:0] = messages
+        self.assertEqual(seen, self.messages)
+
+        forward = list(messages)
+        while next_cursor:
+            messages, _, next_cursor = self.page(after=decode_cursor(next_cursor))
+            forward.extend(messages)
+        self.assertEqual(forward, self.messages)
+
+    def test_empty_before_keeps_cursor(self):
+        oldest = (self.messages[0].timestamp, self.messages[0].id)
+        messages, prev_cursor, next_cursor = self.page(before=oldest)
+        self.assertEqual(messages, [])
+        self.assertIsNone(prev_cursor)
+        self.assertEqual(decode_cursor(next_cursor), oldest)
+
+
+class MessageListAPITest(TestCase):
+    def setUp(self):
+        self.room = make_room(7)
+        sender = self.room.users.get()
+        for i in range(7):
+            Message.objects.create(room=self.room, sender=sender, text=f'm{i}')
+
+    def get(self, **params):
+        return self.client.get(f'/chat/{self.room.id}/messages/', params)
+
+    def test_pages(self):
+        body = self.get(page_size=3).json()
+        self.assertEqual([m['text'] for m in body['results']], ['m4', 'm5', 'm6'])
+        self.assertIsNone(body['next'])
+        body = self.get(page_size=3, before=body['prev']).json()
+        self.assertEqual([m['text'] for m in body['results']], ['m1', 'm2', 'm3'])
+        body = self.get(page_size=3, before=body['prev']).json()
+        self.assertEqual([m['text'] for m in body['results']], ['m0'])
+        self.assertIsNone(body['prev'])
+        body = self.get(page_size=3, after=body['next']).json()
+        self.assertEqual([m['text'] for m in body['results']], ['m1', 'm2', 'm3'])
+
+    def test_errors(self):
+        self.assertEqual(self.get(before='zzz').status_code, 400)
+        self.assertEqual(self.get(page_size=0).status_code, 400)
+        self.assertEqual(self.get(page_size='x').status_code, 400)
+        self.assertEqual(self.get(before='a', after='b').status_code, 400)
+        self.assertEqual(self.client.get('/chat/999/messages/').status_code, 404)
@@ -0,0 +1,94 @@
+from asgiref.sync import sync_to_async
+from django.test import TransactionTestCase, override_settings
+
+from chat.identity import user_identity_cache
+from chat.operations import post_message
+from chat.pagination import message_cursor
+from chat.replay import recent_messages
+
+from .support import IN_MEMORY_LAYERS, connect, make_room
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class ReplayTest(TransactionTestCase):
+    def setUp(self):
+        user_identity_cache.clear()
+        recent_messages._rooms.clear()
+        recent_messages._subscribers.clear()
+
+    @sync_to_async
+    def make_history(self, count):
+        room = make_room(1)
+        cursors = [message_cursor(post_message(room.id, 1, f'm{i}')[0]) for i in range(count)]
+        return room.id, cursors
+
+    async def connect_after(self, room_id, last_seen):
+        communicator = await connect(f'/ws/chat/{room_id}/?last_seen={last_seen}')
+        await communicator.receive_json_from()
+        return communicator, await communicator.receive_json_from()
+
+    async def test_replay_from_buffer(self):
+        room_id, cursors = await self.make_history(5)
+        first, replay = await self.connect_after(room_id, cursors[1])
+        self.assertEqual(replay['type'], 'replay')
+        self.assertEqual([m['message'] for m in replay['messages']], ['m2', 'm3', 'm4'])
+        self.assertTrue(replay['complete'])
+
+        await first.send_json_to({'type': 'message', 'sender_id': 1, 'message': 'live'})
+        live = await first.receive_json_from()
+        self.assertEqual(live['message'], 'live')
+        # 두 번째 클라이언트는 방송된 메시지를 버퍼에서 받는다
+        second, replay = await self.connect_after(room_id, cursors[4])
+        self.assertEqual([(m['message'], m['cursor']) for m in replay['messages']], [('live', live['cursor'])])
+        await first.disconnect()
+        await second.disconnect()
+
+    async def test_db_fallback_with_limit(self):
+        room_id, cursors = await self.make_history(8)
+        size = recent_messages.size
+        recent_messages.size = 2
+        self.addCleanup(setattr, recent_messages, 'size', size)
+        with self.settings(CHAT_REPLAY_LIMIT=3):
+            communicator, replay = await self.connect_after(room_id, cursors[0])
+        self.assertEqual([m['message'] for m in replay['messages']], ['m1', 'm2', 'm3'])
+        self.assertFalse(replay['complete'])
+        await communicator.disconnect()
+
+    async def test_write_behind(self):
+        room_id, cursors = await self.make_history(2)
+        with self.settings(CHAT_WRITE_BEHIND=True):
+            sender = await connect(f'/ws/chat/{room_id}/')
+            await sender.receive_json_from()
+            await sender.send_json_to({'type': 'message', 'sender_id': 1, 'message': 'wb'})
+            live = await sender.receive_json_from()
+            behind, replay = await self.connect_after(room_id, cursors[1])
+            self.assertEqual([m['message'] for m in replay['messages']], ['wb'])
+            current, replay = await self.connect_after(room_id, live['cursor'])
+            self.assertEqual(replay['messages'], [])
+        for communicator in (sender, behind, current):
+            await communicator.disconnect()
+
+    async def test_invalid_last_seen(self):
+        room_id, _ = await self.make_history(1)
+        communicator, frame = await self.connect_after(room_id, 'zz')
+        self.assertIn('error', frame)
+        await communicator.disconnect()
+
+    async def test_non_string_last_seen_on_user_socket(self):
+        room_id, _ = await self.make_history(1)
+        communicator = await connect('/ws/user/1/')
+        await communicator.receive_json_from()
+        for last_seen in (5, ['a'], {'cursor': 'a'}):
+            await communicator.send_json_to({'type': 'replay', 'room_id': room_id, 'last_seen': last_seen})
+            self.assertIn('error', await communicator.receive_json_from())
+        await communicator.disconnect()
+
+    async def test_non_string_read_cursor(self):
+        room_id, _ = await self.make_history(1)
+        communicator = await connect(f'/ws/chat/{room_id}/?travel_user_id=1')
+        await communicator.receive_json_from()
+        await communicator.receive_json_from()
+        for cursor in (5, ['a']):
+            await communicator.send_json_to({'type': 'read', 'cursor': cursor})
+            self.assertIn('error', await communicator.receive_json_from())
+        await communicator.disconnect()
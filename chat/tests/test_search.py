@@ -0,0 +1,96 @@
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from chat.identity import user_identity_cache
+from chat.models import ChatRoom, Message, User
+from chat.operations import post_message
+from chat.search import FTS_TABLE
+
+backfill = import_module('chat.migrations.0008_message_search_backfill')
+
+
+def search(client, travel_user_id, q, **params):
+    return client.get('/chat/search/', {'travel_user_id': travel_user_id, 'q': q, **params})
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        user_identity_cache.clear()
+        a = User.objects.create(travel_user_id=1)
+        b = User.objects.create(travel_user_id=2)
+        self.r1 = ChatRoom.objects.create()
+        self.r1.users.add(a, b)
+        self.r2 = ChatRoom.objects.create()
+        self.r2.users.add(b)
+        post_message(self.r1.id, 1, '호텔 주소는 <b>서울</b> 중구입니다')
+        post_message(self.r1.id, 2, 'hotel address please')
+        post_message(self.r1.id, 2, 'the hotel is nice')
+        post_message(self.r2.id, 2, 'hotel address secret room')
+
+    def assertIndexIntact(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('integrity-check', 1)")
+
+    def test_matches_only_member_rooms(self):
+        results = search(self.client, 1, 'hotel address').json()['results']
+        self.assertEqual([m['text'] for m in results], ['hotel address please'])
+        self.assertIn('<mark>hotel</mark>', results[0]['snippet'])
+
+    def test_snippet_is_escaped(self):
+        results = search(self.client, 1, '호텔').json()['results']
+        self.assertEqual(len(results), 1)
+        self.assertIn('&lt;b&gt;', results[0]['snippet'])
+
+    def test_paging_and_room_filter(self):
+        first = search(self.client, 2, 'hotel', page_size=2).json()
+        self.assertEqual((len(first['results']), first['next']), (2, 2))
+        second = search(self.client, 2, 'hotel', page_size=2, page=2).json()
+        self.assertEqual((len(second['results']), second['next']), (1, None))
+        self.assertEqual(len(search(self.client, 2, 'hotel', room_id=self.r2.id).json()['results']), 1)
+
+    def test_operators_are_not_interpreted(self):
+        self.assertEqual(search(self.client, 1, '"*').status_code, 400)
+
+    def test_edit_updates_index(self):
+        message = Message.objects.get(text='hotel address please')
+        message.text = 'motel'
+        message.save()
+        self.assertEqual(search(self.client, 1, 'address').json()['results'], [])
+        self.assertEqual(len(search(self.client, 1, 'motel').json()['results']), 1)
+
+    def test_cursor_opens_message_list(self):
+        cursor = search(self.client, 1, 'nice').json()['results'][0]['cursor']
+        older = self.client.get(f'/chat/{self.r1.id}/messages/', {'before': cursor}).json()
+        self.assertEqual(len(older['results']), 2)
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')")
+        self.assertEqual(search(self.client, 2, 'hotel').json()['results'], [])
+        out = StringIO()
+        call_command('rebuild_message_search', chunk_size=2, optimize=True, stdout=out)
+        self.assertIn('Indexed 4 messages', out.getvalue())
+        self.assertEqual(len(search(self.client, 2, 'hotel').json()['results']), 3)
+        self.assertIndexIntact()
+
+    def test_backfill_migration_indexes_existing_messages(self):
+        # 0006 이전에 저장된 메시지처럼 인덱스에 없는 상태를 만든다
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')")
+        with connection.cursor() as cursor:
+            # TestCase 트랜잭션 안에서는 SQLite schema editor를 열 수 없어 execute만 흉내 낸다
+            backfill.rebuild(None, SimpleNamespace(connection=connection, execute=cursor.execute))
+        self.assertEqual(len(search(self.client, 2, 'hotel').json()['results']), 3)
+
+        # 삭제·수정 트리거가 인덱스에 있는 행을 지우므로 인덱스가 깨지지 않는다
+        Message.objects.filter(text='the hotel is nice').delete()
+        message = Message.objects.get(text='hotel address please')
+        message.text = 'motel'
+        message.save()
+        self.assertIndexIntact()
+        self.assertEqual(len(search(self.client, 2, 'hotel').json()['results']), 1)
@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from chat.models import ChatRoom, Message
+from chat.serializers import ChatRoomSerializer
+from chat.summaries import record_messages
+
+from .support import make_room
+
+
+class RecordMessagesTest(TestCase):
+    def setUp(self):
+        self.room = make_room(7)
+        self.sender = self.room.users.get()
+
+    def test_latest_and_count(self):
+        messages = [Message.objects.create(room=self.room, sender=self.sender, text=f'm{i}') for i in range(3)]
+        record_messages(messages)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.message_count, 3)
+        self.assertEqual(self.room.last_message_text, 'm2')
+        self.assertEqual(self.room.last_message_timestamp, messages[-1].timestamp)
+        self.assertEqual(self.room.last_message_sender, self.sender)
+
+    def test_older_message_keeps_summary(self):
+        latest = Message.objects.create(room=self.room, sender=self.sender, text='new')
+        record_messages([latest])
+        older = Message.objects.create(room=self.room, sender=self.sender, text='old',
+                                       timestamp=latest.timestamp - timedelta(seconds=1))
+        record_messages([older])
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.message_count, 2)
+        self.assertEqual(self.room.last_message_text, 'new')
+
+
+class RoomListAPITest(TestCase):
+    def setUp(self):
+        for _ in range(5):
+            room = make_room(7, 8)
+            sender = room.users.get(travel_user_id=7)
+            record_messages([Message.objects.create(room=room, sender=sender, text=f'm{i}') for i in range(3)])
+
+    def test_summary_fields(self):
+        rooms = self.client.get('/chat/rooms/', {'travel_user_id': 7}).json()
+        self.assertEqual(len(rooms), 5)
+        self.assertEqual(rooms[0]['latest_message'], 'm2')
+        self.assertEqual(rooms[0]['message_count'], 3)
+        self.assertEqual(rooms[0]['latest_message_sender']['travel_user_id'], 7)
+        self.assertNotIn('messages', rooms[0])
+
+    def test_timestamp_format_matches_room_serializer(self):
+        listed = self.client.get('/chat/rooms/', {'travel_user_id': 7}).json()[0]
+        room = ChatRoom.objects.get(id=listed['id'])
+        self.assertEqual(listed['latest_message_timestamp'], ChatRoomSerializer(room).data['latest_message_timestamp'])
+        self.assertEqual(listed['latest_message_timestamp'], room.last_message_timestamp.isoformat())
+
+    def test_query_count_independent_of_messages(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/chat/rooms/', {'travel_user_id': 7})
+        for room in ChatRoom.objects.all():
+            record_messages([Message.objects.create(room=room, sender=room.users.first(), text='more')])
+        with CaptureQueriesContext(connection) as more_queries:
+            self.client.get('/chat/rooms/', {'travel_user_id': 7})
+        self.assertEqual(len(queries), len(more_queries))
+
+    def test_expand_messages(self):
+        rooms = self.client.get('/chat/rooms/', {'travel_user_id': 7, 'expand': 'messages'}).json()
+        self.assertEqual(len(rooms[0]['messages']), 3)
+
+    def test_requires_user(self):
+        self.assertEqual(self.client.get('/chat/rooms/').status_code, 400)
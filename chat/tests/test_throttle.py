@@ -0,0 +1,117 @@
+import unittest
+from unittest import mock
+
+import redis
+from asgiref.sync import sync_to_async
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from chat.identity import user_identity_cache
+from chat.models import Message
+from chat.throttle import BucketSet, LocalRateLimiter, RedisRateLimiter, TokenBucket, parse_limits, sender_limiter
+
+from .support import IN_MEMORY_LAYERS, amake_room, connect
+
+try:
+    from fakeredis import aioredis as fake_aioredis
+except ImportError:
+    fake_aioredis = None
+
+
+class TokenBucketTest(SimpleTestCase):
+    def test_burst_then_refill(self):
+        with mock.patch('chat.throttle.time.monotonic', return_value=100.0) as clock:
+            bucket = TokenBucket(rate=2, burst=3)
+            self.assertEqual([bucket.allow() for _ in range(4)], [True, True, True, False])
+            clock.return_value = 100.5
+            self.assertEqual([bucket.allow(), bucket.allow()], [True, False])
+            clock.return_value = 200.0
+            self.assertEqual(sum(bucket.allow() for _ in range(10)), 3)
+
+    def test_parse_limits(self):
+        self.assertEqual(parse_limits({'message': '5/20', 'invite': '0.5', 'leave': 3}),
+                         {'message': (5.0, 20), 'invite': (0.5, 1), 'leave': (3.0, 3)})
+
+    def test_bucket_set(self):
+        buckets = BucketSet({'message': (1, 1)})
+        self.assertTrue(buckets.allow('message'))
+        self.assertFalse(buckets.allow('message'))
+        self.assertTrue(all(buckets.allow('typing') for _ in range(5)))
+
+
+class RateLimiterContract:
+    async def test_per_key_buckets(self):
+        limiter = self.make_limiter()
+        results = [await limiter.allow('message', 1, (0.001, 2)) for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertTrue(await limiter.allow('message', 2, (0.001, 2)))
+        self.assertTrue(await limiter.allow('invite', 1, (0.001, 2)))
+
+
+class LocalRateLimiterTest(RateLimiterContract, unittest.IsolatedAsyncioTestCase):
+    def make_limiter(self):
+        return LocalRateLimiter()
+
+    async def test_evicts_oldest_key(self):
+        limiter = LocalRateLimiter(max_keys=2)
+        for key in (1, 2, 1, 3):
+            await limiter.allow('message', key, (1, 1))
+        self.assertEqual(list(limiter._buckets), [('message', 1), ('message', 3)])
+
+
+@unittest.skipIf(fake_aioredis is None, 'fakeredis is not installed')
+class RedisRateLimiterTest(RateLimiterContract, unittest.IsolatedAsyncioTestCase):
+    def make_limiter(self):
+        client = fake_aioredis.FakeRedis()
+        patcher = mock.patch('redis.asyncio.Redis.from_url', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return RedisRateLimiter('redis://rate')
+
+    async def test_redis_errors_allow(self):
+        limiter = self.make_limiter()
+        script = mock.AsyncMock(side_effect=redis.ConnectionError)
+        with mock.patch.object(limiter, '_script', return_value=script), \
+                self.assertLogs('chat.throttle', 'WARNING'):
+            self.assertTrue(await limiter.allow('message', 1, (1, 1)))
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class SocketThrottleTest(TransactionTestCase):
+    def setUp(self):
+        user_identity_cache.clear()
+        sender_limiter._buckets.clear()
+
+    async def test_sender_limit_spans_sockets(self):
+        room = await amake_room(1)
+        first = await connect(f'/ws/chat/{room.id}/')
+        second = await connect(f'/ws/chat/{room.id}/')
+        await first.receive_json_from()
+        await second.receive_json_from()
+        errors = 0
+        for i in range(15):
+            await first.send_json_to({'sender_id': 1, 'message': f'm{i}'})
+            errors += 'error' in await first.receive_json_from()
+        self.assertEqual(errors, 0)
+        for i in range(15):
+            await second.send_json_to({'sender_id': 1, 'message': f'n{i}'})
+        second_errors = 0
+        while not await second.receive_nothing(0.3):
+            second_errors += 'error' in await second.receive_json_from()
+        self.assertGreater(second_errors, 0)
+        # 발신자 버킷(기본 5/20)을 넘는 메시지는 저장되지 않는다. 테스트 도중 채워지는 토큰은 하나 정도다
+        self.assertIn(await sync_to_async(Message.objects.count)(), (20, 21))
+        await first.disconnect()
+        await second.disconnect()
+
+    async def test_connection_limit(self):
+        room = await amake_room(1)
+        with self.settings(CHAT_RATE_LIMITS={'message': '0.001/2'}):
+            socket = await connect(f'/ws/chat/{room.id}/')
+            await socket.receive_json_from()
+            frames = []
+            for i in range(3):
+                await socket.send_json_to({'sender_id': 1, 'message': f'm{i}'})
+                frames.append(await socket.receive_json_from())
+        self.assertEqual(['error' in frame for frame in frames], [False, False, True])
+        self.assertEqual(await sync_to_async(Message.objects.count)(), 2)
+        await socket.disconnect()
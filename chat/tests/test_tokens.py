@@ -0,0 +1,52 @@
+import base64
+import json
+import time
+
+from django.test import SimpleTestCase, override_settings
+
+from chat.tokens import cached_verification, jwt_verification_cache, token_cache_key, token_remaining_lifetime
+
+
+def make_token(exp):
+    payload = base64.urlsafe_b64encode(json.dumps({'exp': exp}).encode()).decode().rstrip('=')
+    return f'header.{payload}.signature'
+
+
+class CachedVerificationTest(SimpleTestCase):
+    def setUp(self):
+        jwt_verification_cache.clear()
+        self.calls = 0
+
+    def verify(self):
+        self.calls += 1
+        return {'data': {'travelUserId': 3}}
+
+    def test_remaining_lifetime(self):
+        self.assertAlmostEqual(token_remaining_lifetime(make_token(time.time() + 100)), 100, delta=2)
+        self.assertIsNone(token_remaining_lifetime('not-a-jwt'))
+
+    def test_success_cached(self):
+        token = make_token(time.time() + 100)
+        cached_verification(token, self.verify)
+        self.assertEqual(cached_verification(token, self.verify), {'data': {'travelUserId': 3}})
+        self.assertEqual(self.calls, 1)
+        # 캐시에는 토큰 원문 대신 해시를 키로 쓴다
+        self.assertIsNotNone(jwt_verification_cache.get(token_cache_key(token)))
+        self.assertIsNone(jwt_verification_cache.get(token))
+
+    def test_expired_token_not_cached(self):
+        token = make_token(time.time() - 5)
+        cached_verification(token, self.verify)
+        cached_verification(token, self.verify)
+        self.assertEqual(self.calls, 2)
+
+    @override_settings(CHAT_JWT_NEGATIVE_TTL=60)
+    def test_failure_cached_briefly(self):
+        cached_verification('bad', lambda: {'error': 'Token expired'})
+        self.assertEqual(cached_verification('bad', self.verify), {'error': 'Token expired'})
+        self.assertEqual(self.calls, 0)
+
+    def test_missing_token_not_cached(self):
+        cached_verification('', self.verify)
+        cached_verification('', self.verify)
+        self.assertEqual(self.calls, 2)
@@ -0,0 +1,138 @@
+import asyncio
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from chat import upstream
+from chat.friends import friend_cache
+from chat.models import User
+from chat.tokens import jwt_verification_cache
+from chat.upstream import CircuitBreaker, UpstreamClient
+from chat.upstream_stub import StubUpstreamServer
+
+
+class UpstreamClientTest(SimpleTestCase):
+    def setUp(self):
+        self.stub = StubUpstreamServer(friends={1: [2, 3]}).start()
+        self.addCleanup(self.stub.stop)
+        client = UpstreamClient(self.stub.url, timeout=2, max_concurrency=4, retries=2, backoff=0.01,
+                                breaker=CircuitBreaker(2, 60))
+        patcher = mock.patch.object(upstream, 'upstream', client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_endpoints(self):
+        self.assertEqual(upstream.verify_jwt('jwtToken=token-1'), {'data': {'travelUserId': 1}})
+        self.assertEqual(upstream.verify_jwt('jwtToken=bad')['status_code'], 401)
+        self.assertEqual(len(upstream.get_friends('jwtToken=token-1')), 2)
+        self.assertEqual(upstream.get_friends('jwtToken=bad')['status_code'], 401)
+        refreshed = upstream.refresh_jwt_token('jwtToken=bad; jwtRefreshToken=refresh-1')
+        self.assertEqual(refreshed['jwtToken'], 'token-1')
+
+    def test_retries_then_opens_circuit(self):
+        self.stub.fail_status = 503
+        self.assertIn('error', upstream.verify_jwt('jwtToken=token-1'))
+        # GET은 retries만큼 다시 시도한다
+        self.assertEqual(self.stub.calls['travel-user/reading'], 3)
+        upstream.verify_jwt('jwtToken=token-1')
+        self.assertIn('circuit', upstream.verify_jwt('jwtToken=token-1')['error'])
+        self.assertEqual(self.stub.calls['travel-user/reading'], 6)
+
+    def test_post_not_retried(self):
+        self.stub.fail_status = 503
+        self.assertIn('error', upstream.refresh_jwt_token('jwtRefreshToken=refresh-1'))
+        self.assertEqual(self.stub.calls['auth/token/refresh'], 1)
+
+
+class AsyncUpstreamClientTest(SimpleTestCase):
+    def setUp(self):
+        self.stub = StubUpstreamServer(friends={1: [2, 3]}).start()
+        self.addCleanup(self.stub.stop)
+        # 테스트마다 이벤트 루프가 따로 돌므로 각 테스트가 끝에서 aclose()로 세션을 닫는다
+        self.client = UpstreamClient(self.stub.url, timeout=2, max_concurrency=4, retries=2, backoff=0.01,
+                                     breaker=CircuitBreaker(2, 60))
+        patcher = mock.patch.object(upstream, 'upstream', self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_endpoints(self):
+        self.assertEqual(await upstream.averify_jwt('jwtToken=token-1'), {'data': {'travelUserId': 1}})
+        self.assertEqual((await upstream.averify_jwt('jwtToken=bad'))['status_code'], 401)
+        self.assertEqual(len(await upstream.aget_friends('jwtToken=token-1')), 2)
+        refreshed = await upstream.arefresh_jwt_token('jwtToken=bad; jwtRefreshToken=refresh-1')
+        self.assertEqual(refreshed['jwtToken'], 'token-1')
+        await self.client.aclose()
+
+    async def test_retries_then_opens_circuit(self):
+        self.stub.fail_status = 503
+        self.assertIn('error', await upstream.averify_jwt('jwtToken=token-1'))
+        self.assertEqual(self.stub.calls['travel-user/reading'], 3)
+        await upstream.averify_jwt('jwtToken=token-1')
+        # 동기 호출과 같은 breaker를 쓴다
+        self.assertIn('circuit', upstream.verify_jwt('jwtToken=token-1')['error'])
+        self.assertIn('circuit', (await upstream.averify_jwt('jwtToken=token-1'))['error'])
+        self.assertEqual(self.stub.calls['travel-user/reading'], 6)
+        await self.client.aclose()
+
+    async def test_post_not_retried(self):
+        self.stub.fail_status = 503
+        self.assertIn('error', await upstream.arefresh_jwt_token('jwtRefreshToken=refresh-1'))
+        self.assertEqual(self.stub.calls['auth/token/refresh'], 1)
+        await self.client.aclose()
+
+    async def test_concurrent_calls_share_one_session(self):
+        results = await asyncio.gather(*(upstream.averify_jwt('jwtToken=token-1') for _ in range(8)))
+        self.assertEqual(results, [{'data': {'travelUserId': 1}}] * 8)
+        self.assertEqual(len(self.client._async_state), 1)
+        await self.client.aclose()
+        self.assertEqual(len(self.client._async_state), 0)
+
+    async def test_malformed_body(self):
+        with mock.patch.object(self.client, 'arequest', return_value=(200, 'html')):
+            self.assertIn('error', await upstream.averify_jwt('c'))
+            self.assertIn('error', await upstream.aget_friends('c'))
+
+
+class MalformedResponseTest(SimpleTestCase):
+    def respond(self, body, status_code=200):
+        return mock.patch.object(upstream.upstream, 'request', return_value=(status_code, body))
+
+    def test_non_json_bodies(self):
+        for body in (None, 'html', [1]):
+            with self.respond(body):
+                self.assertIn('error', upstream.verify_jwt('c'))
+                self.assertIn('error', upstream.refresh_jwt_token('c'))
+        for body in (None, 'html', {'a': 1}, [None], [{'friendTravelUserDto': 'x'}]):
+            with self.respond(body):
+                self.assertIn('error', upstream.get_friends('c'))
+
+    def test_refresh_missing_tokens(self):
+        with self.respond({'jwtToken': 'only-access'}):
+            self.assertIn('error', upstream.refresh_jwt_token('c'))
+
+
+class MalformedResponseViewTest(TestCase):
+    def setUp(self):
+        jwt_verification_cache.clear()
+        friend_cache.clear()
+
+    def test_login_with_non_json_body(self):
+        with mock.patch.object(upstream.upstream, 'request', return_value=(200, None)):
+            response = self.client.post('/users/', {'jwtToken': 'a', 'jwtRefreshToken': 'r'},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_room_creation_with_non_json_refresh(self):
+        User.objects.create(travel_user_id=1, jwt_token='expired', jwt_refresh_token='r')
+        responses = iter([(401, {'error': 'Token expired'}), (200, None)])
+        with mock.patch.object(upstream.upstream, 'request', side_effect=lambda *args: next(responses)):
+            response = self.client.post('/chat/rooms/', {'travel_user_id': 1, 'users': [{'travel_user_id': 2}]},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_room_creation_with_non_json_friends(self):
+        User.objects.create(travel_user_id=1, jwt_token='t', jwt_refresh_token='r')
+        with mock.patch.object(upstream.upstream, 'request', return_value=(200, None)):
+            response = self.client.post('/chat/rooms/', {'travel_user_id': 1, 'users': [{'travel_user_id': 2}]},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 400)
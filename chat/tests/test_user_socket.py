@@ -0,0 +1,87 @@
+from django.test import TransactionTestCase, override_settings
+
+from chat.identity import user_identity_cache
+from chat.presence import presence
+
+from .support import IN_MEMORY_LAYERS, amake_room, connect
+
+
+async def receive(communicator):
+    """presence 같은 ephemeral 프레임을 건너뛴 다음 프레임."""
+    while True:
+        frame = await communicator.receive_json_from()
+        if frame.get('type') != 'ephemeral':
+            return frame
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class UserSocketTest(TransactionTestCase):
+    def setUp(self):
+        user_identity_cache.clear()
+        presence._rooms.clear()
+
+    async def connect_user(self):
+        """사용자 1은 shared(2와 함께)와 own 방에 참가하고 other 방에는 2만 있다. /ws/user/1/ 소켓과 첫 rooms 프레임."""
+        self.shared = (await amake_room(1, 2)).id
+        self.own = (await amake_room(1)).id
+        self.other = (await amake_room(2)).id
+        socket = await connect('/ws/user/1/')
+        return socket, await socket.receive_json_from()
+
+    async def test_subscribes_to_every_room(self):
+        socket, rooms = await self.connect_user()
+        self.assertEqual(rooms['type'], 'rooms')
+        self.assertEqual(sorted(room['room_id'] for room in rooms['rooms']), [self.shared, self.own])
+        self.assertEqual(rooms['rooms'][0]['online'], [1])
+        await socket.disconnect()
+
+    async def test_frames_carry_room_id(self):
+        socket, _ = await self.connect_user()
+        room_socket = await connect(f'/ws/chat/{self.shared}/')
+        await room_socket.receive_json_from()
+        await room_socket.send_json_to({'sender_id': 2, 'message': 'hi'})
+        frame = await receive(socket)
+        self.assertEqual((frame['type'], frame['room_id'], frame['message']), ('message', self.shared, 'hi'))
+        # 방 소켓에는 room_id를 붙이지 않는다
+        self.assertNotIn('room_id', await room_socket.receive_json_from())
+        await room_socket.disconnect()
+        await socket.disconnect()
+
+    async def test_sender_is_the_connected_user(self):
+        socket, _ = await self.connect_user()
+        await socket.send_json_to({'room_id': self.own, 'message': 'mine', 'sender_id': 2})
+        frame = await receive(socket)
+        self.assertEqual((frame['room_id'], frame['sender']['travel_user_id']), (self.own, 1))
+        await socket.disconnect()
+
+    async def test_other_rooms_rejected(self):
+        socket, _ = await self.connect_user()
+        await socket.send_json_to({'room_id': self.other, 'message': 'x'})
+        self.assertIn('error', await receive(socket))
+        await socket.send_json_to({'type': 'subscribe', 'room_id': self.other})
+        self.assertIn('error', await receive(socket))
+        await socket.disconnect()
+
+    async def test_invited_room_subscribed(self):
+        socket, _ = await self.connect_user()
+        inviter = await connect('/ws/user/2/')
+        await inviter.receive_json_from()
+        await inviter.send_json_to({'type': 'invite', 'room_id': self.other, 'travel_user_id': 1})
+        rooms = await receive(socket)
+        self.assertEqual((rooms['type'], rooms['rooms'][0]['room_id']), ('rooms', self.other))
+        self.assertEqual(await receive(socket), {'type': 'room_update', 'room_id': self.other})
+        await inviter.disconnect()
+        await socket.disconnect()
+
+    async def test_leave_unsubscribes(self):
+        socket, _ = await self.connect_user()
+        await socket.send_json_to({'type': 'leave', 'room_id': self.shared})
+        self.assertEqual((await receive(socket))['type'], 'left')
+        room_socket = await connect(f'/ws/chat/{self.shared}/')
+        await room_socket.receive_json_from()
+        await room_socket.send_json_to({'sender_id': 2, 'message': 'after'})
+        await room_socket.receive_json_from()
+        while not await socket.receive_nothing(0.2):
+            self.assertNotEqual((await socket.receive_json_from())['type'], 'message')
+        await room_socket.disconnect()
+        await socket.disconnect()
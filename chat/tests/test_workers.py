@@ -0,0 +1,159 @@
+import asyncio
+import socket
+import time
+from io import StringIO
+from unittest.mock import Mock, patch
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from chat import supervisor
+from chat.drain import SERVICE_RESTART_CLOSE_CODE, Drainer, drainer
+from chat.identity import user_identity_cache
+from chat.supervisor import Supervisor, bind_socket
+
+from .support import IN_MEMORY_LAYERS, amake_room, connect
+
+REDIS_BACKENDS = {
+    'CHAT_PRESENCE_BACKEND': 'redis',
+    'CHAT_RATE_LIMIT_BACKEND': 'redis',
+    'CHAT_PAGE_CACHE_BACKEND': 'redis',
+}
+
+
+@patch('chat.management.commands.run_ws_workers.bind_socket')
+@patch('chat.management.commands.run_ws_workers.Supervisor')
+class RunWsWorkersTest(SimpleTestCase):
+    def run_command(self, *args):
+        return call_command('run_ws_workers', *args, stdout=StringIO())
+
+    def test_default_is_one_worker(self, supervisor_class, bind_socket):
+        self.run_command()
+        self.assertEqual(supervisor_class.call_args.args[1], 1)
+        supervisor_class.return_value.run.assert_called_once()
+
+    def test_refuses_multiple_workers_with_local_backend(self, supervisor_class, bind_socket):
+        for name in REDIS_BACKENDS:
+            with self.subTest(name), self.settings(**{**REDIS_BACKENDS, name: 'local'}):
+                with self.assertRaisesMessage(CommandError, name):
+                    self.run_command('--workers', '2')
+        bind_socket.assert_not_called()
+        supervisor_class.assert_not_called()
+
+    def test_multiple_workers_with_redis_backends(self, supervisor_class, bind_socket):
+        with self.settings(**REDIS_BACKENDS):
+            self.run_command('--workers', '4')
+        self.assertEqual(supervisor_class.call_args.args[1], 4)
+
+    def test_local_backends_with_one_worker(self, supervisor_class, bind_socket):
+        with self.settings(CHAT_PRESENCE_BACKEND='local', CHAT_RATE_LIMIT_BACKEND='local'):
+            self.run_command('--workers', '1')
+        supervisor_class.return_value.run.assert_called_once()
+
+
+class FakeProcess:
+    pid_counter = 100
+
+    def __init__(self):
+        FakeProcess.pid_counter += 1
+        self.pid = FakeProcess.pid_counter
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+
+class SupervisorTest(SimpleTestCase):
+    def setUp(self):
+        self.supervisor = Supervisor(Mock(**{'fileno.return_value': 3}), 2, 'config.asgi:application', 1)
+        self.spawn = patch.object(supervisor.subprocess, 'Popen', side_effect=lambda *a, **k: FakeProcess())
+        self.spawn.start()
+        self.addCleanup(self.spawn.stop)
+
+    def test_restarts_crashed_worker_with_backoff(self):
+        with self.assertLogs('chat.supervisor', 'INFO'):
+            worker = self.supervisor.spawn()
+        worker.process.returncode = 1
+        with self.assertLogs('chat.supervisor', 'WARNING'):
+            self.supervisor.reap()
+        self.assertNotIn(worker.pid, self.supervisor.workers)
+        self.assertEqual(len(self.supervisor.restart_at), 1)
+        # 금방 죽은 워커는 재시작 간격을 두 배로 늘린다
+        self.assertEqual(self.supervisor.restart_delay, 2)
+
+    def test_drained_worker_is_not_restarted(self):
+        with self.assertLogs('chat.supervisor', 'INFO'):
+            worker = self.supervisor.spawn()
+        worker.draining = True
+        worker.process.returncode = 0
+        self.supervisor.reap()
+        self.assertEqual(self.supervisor.workers, {})
+        self.assertEqual(self.supervisor.restart_at, [])
+
+
+class DaphneWorkerTest(SimpleTestCase):
+    def request(self, port):
+        with socket.create_connection(('127.0.0.1', port), timeout=5) as connection:
+            connection.sendall(b'GET /no-such-page/ HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n')
+            return connection.recv(64)
+
+    def test_worker_accepts_connections(self):
+        # 설치된 daphne로 실제 워커를 띄운다. 실행에 실패하면 워커가 바로 죽고 재시작만 반복한다
+        sock = bind_socket('127.0.0.1', 0)
+        self.addCleanup(sock.close)
+        port = sock.getsockname()[1]
+        launcher = Supervisor(sock, 1, 'config.asgi:application', 1, ['-v', '0'])
+        with self.assertLogs('chat.supervisor', 'INFO'):
+            worker = launcher.spawn()
+        try:
+            deadline = time.monotonic() + 30
+            response = b''
+            while not response and time.monotonic() < deadline:
+                self.assertIsNone(worker.process.poll(), 'daphne worker exited')
+                try:
+                    response = self.request(port)
+                except OSError:
+                    time.sleep(0.2)
+            self.assertTrue(response.startswith(b'HTTP/1.1 404'), response)
+        finally:
+            launcher.stop([worker])
+        # SIGUSR1로 drain한 뒤 스스로 종료한다
+        self.assertIsNotNone(worker.process.returncode)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, CHAT_RECONNECT_JITTER=0)
+class DrainTest(TransactionTestCase):
+    def setUp(self):
+        user_identity_cache.clear()
+
+    async def test_socket_drain_sends_reconnect_and_closes(self):
+        room = await amake_room(1)
+        before = set(drainer.sockets)
+        communicator = await connect(f'/ws/chat/{room.id}/')
+        await communicator.receive_json_from()
+        (consumer,) = set(drainer.sockets) - before
+
+        await consumer.drain()
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'reconnect', 'retry_after': 0})
+        output = await communicator.receive_output()
+        self.assertEqual((output['type'], output['code']), ('websocket.close', SERVICE_RESTART_CLOSE_CODE))
+        await communicator.disconnect()
+        self.assertNotIn(consumer, drainer.sockets)
+
+    async def test_worker_drain_stops_after_sockets_close(self):
+        worker_drainer = Drainer()
+
+        class Socket:
+            async def drain(self):
+                worker_drainer.unregister(self)
+
+        sockets = [Socket(), Socket()]
+        for socket in sockets:
+            worker_drainer.register(socket)
+        with patch.object(Drainer, 'stop_listening') as stop_listening, patch('chat.drain.os.kill') as kill:
+            await asyncio.wait_for(worker_drainer.drain(), 2)
+            # 두 번째 SIGUSR1은 무시한다
+            await worker_drainer.drain()
+        stop_listening.assert_called_once()
+        kill.assert_called_once()
+        self.assertEqual(len(worker_drainer.sockets), 0)
@@ -0,0 +1,69 @@
+from asgiref.sync import sync_to_async
+from django.test import TransactionTestCase, override_settings
+
+from chat.identity import get_user_identity, user_identity_cache
+from chat.models import ChatRoom, Message
+from chat.writebehind import MessageWriteBehindQueue, message_queue
+
+from .support import IN_MEMORY_LAYERS, amake_room, connect, make_room
+
+
+class MessageWriteBehindQueueTest(TransactionTestCase):
+    def setUp(self):
+        user_identity_cache.clear()
+
+    def test_batches_and_summaries(self):
+        room = make_room(1)
+        queue = MessageWriteBehindQueue(batch_size=10, flush_interval=60)
+        identity = get_user_identity(1)
+        queue._ensure_flusher = lambda: None
+        for i in range(5):
+            queue.enqueue(room.id, identity, f'm{i}')
+        self.assertEqual(queue.depth, 5)
+        queue.batch_size = 2
+        queue.flush_sync()
+
+        messages = list(Message.objects.order_by('timestamp', 'id'))
+        self.assertEqual([m.text for m in messages], [f'm{i}' for i in range(5)])
+        # enqueue 순서대로 timestamp가 증가한다
+        self.assertEqual(len({m.timestamp for m in messages}), 5)
+        room.refresh_from_db()
+        self.assertEqual((room.message_count, room.last_message_text), (5, 'm4'))
+        self.assertEqual(queue.stats()['flush_count'], 3)
+
+    def test_bad_row_does_not_drop_batch(self):
+        room = make_room(1)
+        queue = MessageWriteBehindQueue(batch_size=10, flush_interval=60)
+        identity = get_user_identity(1)
+        queue._ensure_flusher = lambda: None
+        queue.enqueue(room.id, identity, 'kept')
+        queue.enqueue(room.id + 1000, identity, 'lost')
+        with self.assertLogs('chat.writebehind', 'ERROR'):
+            queue.flush_sync()
+        self.assertEqual(list(Message.objects.values_list('text', flat=True)), ['kept'])
+        self.assertEqual((queue.stats()['flushed_total'], queue.stats()['dropped_total']), (1, 1))
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, CHAT_WRITE_BEHIND=True)
+class WriteBehindConsumerTest(TransactionTestCase):
+    def setUp(self):
+        user_identity_cache.clear()
+
+    async def test_broadcast_before_persist(self):
+        room = await amake_room(1)
+        socket = await connect(f'/ws/chat/{room.id}/')
+        await socket.receive_json_from()
+        for i in range(5):
+            await socket.send_json_to({'type': 'message', 'sender_id': 1, 'message': f'm{i}'})
+        timestamps = [(await socket.receive_json_from())['timestamp'] for _ in range(5)]
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertEqual(len(set(timestamps)), 5)
+
+        await message_queue.flush()
+        texts = await sync_to_async(
+            lambda: list(Message.objects.order_by('timestamp').values_list('text', flat=True))
+        )()
+        self.assertEqual(texts, [f'm{i}' for i in range(5)])
+        count = await sync_to_async(lambda: ChatRoom.objects.get(id=room.id).message_count)()
+        self.assertEqual(count, 5)
+        await socket.disconnect()
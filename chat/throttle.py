@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """초당 rate개씩 채워지고 최대 burst개까지 쌓이는 토큰 버킷. 하나의 이벤트 루프/스레드 안에서만 사용한다."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def allow(self, cost=1):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
+
+
+def parse_limits(limits):
+    """{'message': '5/20', ...} 형식의 설정을 {종류: (rate, burst)}로 바꾼다. burst를 생략하면 rate와 같다."""
+    parsed = {}
+    for kind, value in limits.items():
+        rate, _, burst = str(value).partition('/')
+        parsed[kind] = float(rate), int(burst or max(1, float(rate)))
+    return parsed
+
+
+class BucketSet:
+    """이벤트 종류별 TokenBucket 모음 (소켓 하나용). 제한이 없는 종류는 항상 허용한다."""
+
+    def __init__(self, limits):
+        self.buckets = {kind: TokenBucket(rate, burst) for kind, (rate, burst) in limits.items()}
+
+    def allow(self, kind, cost=1):
+        bucket = self.buckets.get(kind)
+        return bucket is None or bucket.allow(cost)
+
+
+class LocalRateLimiter:
+    """
+    (종류, key)별 TokenBucket (프로세스 로컬). daphne 프로세스가 여러 개면 각자 따로 센다.
+    버킷이 max_keys개를 넘으면 가장 오래 쓰지 않은 것부터 버린다.
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    async def allow(self, kind, key, limit, cost=1):
+        """limit은 (rate, burst)."""
+        bucket = self._buckets.get((kind, key))
+        if bucket is None:
+            bucket = self._buckets[(kind, key)] = TokenBucket(*limit)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end((kind, key))
+        return bucket.allow(cost)
+
+
+# 토큰 수와 갱신 시각(ms)을 hash 하나에 둔다. 시각은 프로세스 간 시계 차이가 없도록 Redis TIME을 쓴다
+_ALLOW_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate / 1000)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return allowed
+"""
+
+
+class RedisRateLimiter:
+    """
+    LocalRateLimiter와 같은 인터페이스의 Redis 구현. 모든 daphne 프로세스가 같은 버킷을 쓴다.
+    Redis 오류 시에는 허용한다 (소켓별 버킷은 계속 적용된다).
+    """
+
+    def __init__(self, url, prefix='chat:rate'):
+        self.url = url
+        self.prefix = prefix
+        self._scripts = {}
+
+    def _script(self):
+        # redis.asyncio 커넥션은 이벤트 루프에 묶이므로 루프마다 따로 만든다
+        loop = asyncio.get_running_loop()
+        script = self._scripts.get(loop)
+        if script is None:
+            script = self._scripts[loop] = aioredis.Redis.from_url(self.url).register_script(_ALLOW_SCRIPT)
+        return script
+
+    async def allow(self, kind, key, limit, cost=1):
+        rate, burst = limit
+        try:
+            return bool(await self._script()(keys=[f'{self.prefix}:{kind}:{key}'], args=[rate, burst, cost]))
+        except redis.RedisError:
+            logger.warning('Rate limit check failed for %s %s, allowing', kind, key, exc_info=True)
+            return True
+
+
+def make_rate_limiter(backend):
+    if backend == 'redis':
+        return RedisRateLimiter(settings.REDIS_URL)
+    return LocalRateLimiter()
+
+
+# 발신자(travel_user_id)별 제한. 소켓별 제한은 consumer마다 BucketSet을 둔다
+sender_limiter = make_rate_limiter(settings.CHAT_RATE_LIMIT_BACKEND)
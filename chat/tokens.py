@@ -0,0 +1,53 @@
+import base64
+import hashlib
+import json
+import time
+
+from django.conf import settings
+
+from .cache import make_cache
+
+jwt_verification_cache = make_cache(
+    settings.CHAT_JWT_CACHE_BACKEND, 'jwt', settings.CHAT_JWT_CACHE_SIZE, settings.CHAT_JWT_CACHE_TTL
+)
+
+
+def token_cache_key(access_token):
+    # 토큰 원문은 캐시에 남기지 않는다
+    return hashlib.sha256(access_token.encode()).hexdigest()
+
+
+def token_remaining_lifetime(access_token):
+    """JWT payload의 exp까지 남은 시간(초). 서명은 검증하지 않으며, 알 수 없으면 None."""
+    try:
+        payload = access_token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload.encode()))['exp']
+        return float(exp) - time.time()
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def cached_verification(access_token, verify):
+    """
+    verify()의 결과를 access token 해시를 키로 캐시한다.
+    성공 결과는 토큰의 남은 수명을 넘지 않게, 실패 결과는 CHAT_JWT_NEGATIVE_TTL 동안만 보관한다.
+    """
+    if not access_token:
+        return verify()
+
+    key = token_cache_key(access_token)
+    result = jwt_verification_cache.get(key)
+    if result is not None:
+        return result
+
+    result = verify()
+    if 'error' in result:
+        ttl = settings.CHAT_JWT_NEGATIVE_TTL
+    else:
+        ttl = settings.CHAT_JWT_CACHE_TTL
+        remaining = token_remaining_lifetime(access_token)
+        if remaining is not None:
+            ttl = min(ttl, remaining)
+    jwt_verification_cache.set(key, result, ttl=ttl)
+    return result
@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+
+import aiohttp
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .metrics import upstream_seconds
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamError(Exception):
+    pass
+
+
+def _json_or_none(parse):
+    try:
+        return parse()
+    except ValueError:
+        return None
+
+
+class CircuitBreaker:
+    """
+    연속 실패가 failure_threshold에 도달하면 reset_timeout 동안 호출을 막는다.
+    그 뒤에는 한 번의 시험 호출만 통과시키고, 성공하면 다시 닫힌다.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # half-open: 결과가 나올 때까지 다른 호출은 계속 막는다
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class UpstreamClient:
+    """
+    다른 서버(OTHER_SERVER_URL) 호출용 클라이언트.
+    keep-alive 커넥션 풀, 호출별 timeout, 동시 호출 수 제한, GET 재시도(jitter), circuit breaker를 제공하며
+    동기(requests)와 비동기(aiohttp) 양쪽에서 같은 breaker를 공유한다.
+    aiohttp 세션과 동시 호출 제한은 이벤트 루프에 묶이므로 루프마다 따로 두고, 루프가 사라지면 함께 버린다.
+    """
+
+    def __init__(self, base_url, timeout, max_concurrency, retries, backoff, breaker):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker
+        self._sync_slots = threading.BoundedSemaphore(max_concurrency)
+        self._session = None
+        self._session_pid = None
+        # 이벤트 루프 -> (aiohttp.ClientSession, asyncio.Semaphore)
+        self._async_state = weakref.WeakKeyDictionary()
+
+    def _url(self, path):
+        if not self.base_url:
+            raise UpstreamError('OTHER_SERVER_URL is not configured')
+        return self.base_url + path
+
+    def _retry_delay(self, attempt):
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    def _attempts(self, method):
+        # 멱등한 GET만 재시도한다
+        return self.retries + 1 if method == 'GET' else 1
+
+    def session(self):
+        # gunicorn 워커 fork 이후에는 부모의 커넥션을 공유하지 않도록 새로 만든다
+        if self._session is None or self._session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+            self._session_pid = os.getpid()
+        return self._session
+
+    def request(self, method, path, cookie):
+        """(status_code, json 본문)을 반환한다. 연결 실패·timeout·5xx가 재시도 후에도 계속되면 UpstreamError."""
+        url = self._url(path)
+        if not self.breaker.allow():
+            raise UpstreamError('Upstream unavailable (circuit open)')
+        if not self._sync_slots.acquire(timeout=self.timeout):
+            raise UpstreamError('Upstream busy')
+        try:
+            attempts = self._attempts(method)
+            for attempt in range(attempts):
+                try:
+                    response = self.session().request(method, url, headers={'Cookie': cookie}, timeout=self.timeout)
+                    if response.status_code >= 500:
+                        raise UpstreamError(f'Unexpected status code: {response.status_code}')
+                    body = _json_or_none(response.json)
+                except (requests.exceptions.RequestException, UpstreamError) as e:
+                    if attempt + 1 >= attempts:
+                        self.breaker.record_failure()
+                        raise UpstreamError(str(e)) from e
+                    time.sleep(self._retry_delay(attempt))
+                    continue
+                self.breaker.record_success()
+                return response.status_code, body
+        finally:
+            self._sync_slots.release()
+
+    def async_session(self):
+        loop = asyncio.get_running_loop()
+        state = self._async_state.get(loop)
+        if state is None or state[0].closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+            session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+            state = self._async_state[loop] = (session, asyncio.Semaphore(self.max_concurrency))
+        return state
+
+    async def arequest(self, method, path, cookie):
+        """request()의 비동기판. 스레드를 잡지 않고 같은 breaker, timeout, 재시도 규칙을 따른다."""
+        url = self._url(path)
+        if not self.breaker.allow():
+            raise UpstreamError('Upstream unavailable (circuit open)')
+        session, slots = self.async_session()
+        try:
+            await asyncio.wait_for(slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise UpstreamError('Upstream busy') from None
+        try:
+            attempts = self._attempts(method)
+            for attempt in range(attempts):
+                try:
+                    async with session.request(method, url, headers={'Cookie': cookie}) as response:
+                        if response.status >= 500:
+                            raise UpstreamError(f'Unexpected status code: {response.status}')
+                        try:
+                            body = await response.json(content_type=None)
+                        except ValueError:
+                            body = None
+                        status_code = response.status
+                except (aiohttp.ClientError, asyncio.TimeoutError, UpstreamError) as e:
+                    if attempt + 1 >= attempts:
+                        self.breaker.record_failure()
+                        raise UpstreamError(str(e) or type(e).__name__) from e
+                    await asyncio.sleep(self._retry_delay(attempt))
+                    continue
+                self.breaker.record_success()
+                return status_code, body
+        finally:
+            slots.release()
+
+    async def aclose(self):
+        """현재 이벤트 루프의 aiohttp 세션을 닫는다. 루프를 끝내기 전에 호출한다."""
+        state = self._async_state.pop(asyncio.get_running_loop(), None)
+        if state is not None:
+            await state[0].close()
+
+
+upstream = UpstreamClient(
+    settings.OTHER_SERVER_URL,
+    timeout=settings.CHAT_UPSTREAM_TIMEOUT,
+    max_concurrency=settings.CHAT_UPSTREAM_MAX_CONCURRENCY,
+    retries=settings.CHAT_UPSTREAM_RETRIES,
+    backoff=settings.CHAT_UPSTREAM_BACKOFF,
+    breaker=CircuitBreaker(settings.CHAT_UPSTREAM_BREAKER_THRESHOLD, settings.CHAT_UPSTREAM_BREAKER_RESET),
+)
+
+
+def _verify_result(status_code, body):
+    if status_code == 200:
+        if not isinstance(body, dict):
+            return {'error': 'Invalid response from JWT server'}
+        return {'data': body}
+    if status_code == 401:
+        return {'error': 'Token expired', 'status_code': 401}
+    return {'error': f'Unexpected status code: {status_code}'}
+
+
+def _refresh_result(status_code, body):
+    if status_code != 200:
+        return {'error': f'Unexpected status code: {status_code}', 'status_code': status_code}
+    # 200이어도 본문이 JSON이 아니거나 토큰이 빠져 있으면 호출하는 쪽에서 KeyError/TypeError가 나지 않도록 error로 바꾼다
+    if not isinstance(body, dict) or not body.get('jwtToken') or not body.get('jwtRefreshToken'):
+        return {'error': 'Invalid response from token refresh'}
+    return body
+
+
+def _friends_result(status_code, body):
+    if status_code != 200:
+        return {'error': f'Unexpected status code: {status_code}', 'status_code': status_code}
+    if not isinstance(body, list):
+        return {'error': 'Invalid response from friend list'}
+    for friend in body:
+        if not isinstance(friend, dict) or not isinstance(friend.get('friendTravelUserDto'), dict) \
+                or not friend['friendTravelUserDto'].get('travelUserId'):
+            return {'error': 'Friend list contains user with null travelUserId'}
+    return body
+
+
+def _call(method, path, cookie, parse):
+    started = time.perf_counter()
+    try:
+        status_code, body = upstream.request(method, path, cookie)
+    except UpstreamError as e:
+        upstream_seconds.observe(time.perf_counter() - started, endpoint=path, outcome='error')
+        return {'error': str(e)}
+    upstream_seconds.observe(time.perf_counter() - started, endpoint=path, outcome=status_code)
+    return parse(status_code, body)
+
+
+async def _acall(method, path, cookie, parse):
+    started = time.perf_counter()
+    try:
+        status_code, body = await upstream.arequest(method, path, cookie)
+    except UpstreamError as e:
+        upstream_seconds.observe(time.perf_counter() - started, endpoint=path, outcome='error')
+        return {'error': str(e)}
+    upstream_seconds.observe(time.perf_counter() - started, endpoint=path, outcome=status_code)
+    return parse(status_code, body)
+
+
+def verify_jwt(cookie):
+    return _call('GET', 'travel-user/reading', cookie, _verify_result)
+
+
+def refresh_jwt_token(cookie):
+    return _call('POST', 'auth/token/refresh', cookie, _refresh_result)
+
+
+def get_friends(cookie):
+    return _call('GET', 'friend/friend-list', cookie, _friends_result)
+
+
+async def averify_jwt(cookie):
+    return await _acall('GET', 'travel-user/reading', cookie, _verify_result)
+
+
+async def arefresh_jwt_token(cookie):
+    return await _acall('POST', 'auth/token/refresh', cookie, _refresh_result)
+
+
+async def aget_friends(cookie):
+    return await _acall('GET', 'friend/friend-list', cookie, _friends_result)
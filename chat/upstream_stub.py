@@ -0,0 +1,105 @@
+import json
+import threading
+import time
+from collections import Counter
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubUpstreamServer:
+    """
+    인증/친구 API를 흉내 내는 로컬 서버. UpstreamClient와 벤치마크를 외부 서버 없이 돌리기 위한 용도.
+    jwtToken 쿠키가 'token-<travelUserId>' 형식이면 해당 사용자로 인증되고 그 외에는 401을 돌려준다.
+    토큰 갱신은 jwtRefreshToken 쿠키가 'refresh-<travelUserId>' 형식일 때 성공한다.
+    friends[travelUserId]에 있는 id들은 accept 상태의 친구로 응답한다.
+    """
+
+    def __init__(self, friends=None, latency=0.0, fail_status=None):
+        self.friends = friends or {}
+        self.latency = latency
+        self.fail_status = fail_status
+        self.calls = Counter()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}/'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status_code, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _travel_user_id(self, name='jwtToken', prefix='token-'):
+                cookie = SimpleCookie(self.headers.get('Cookie', ''))
+                token = cookie[name].value if name in cookie else ''
+                if not token.startswith(prefix):
+                    return None
+                try:
+                    return int(token[len(prefix):])
+                except ValueError:
+                    return None
+
+            def _handle(self):
+                path = self.path.lstrip('/')
+                stub.calls[path] += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub.fail_status:
+                    return self._reply(stub.fail_status, {'error': 'stub failure'})
+
+                if path == 'auth/token/refresh':
+                    travel_user_id = self._travel_user_id('jwtRefreshToken', 'refresh-')
+                else:
+                    travel_user_id = self._travel_user_id()
+                if travel_user_id is None:
+                    return self._reply(401, {'error': 'Token expired'})
+
+                if path == 'travel-user/reading':
+                    return self._reply(200, {'travelUserId': travel_user_id})
+                if path == 'friend/friend-list':
+                    return self._reply(200, [
+                        {'friendStatus': 'acceptance', 'friendTravelUserDto': {'travelUserId': friend_id}}
+                        for friend_id in stub.friends.get(travel_user_id, [])
+                    ])
+                if path == 'auth/token/refresh':
+                    return self._reply(200, {
+                        'jwtToken': f'token-{travel_user_id}',
+                        'jwtRefreshToken': f'refresh-{travel_user_id}',
+                    })
+                return self._reply(404, {'error': 'not found'})
+
+            do_GET = _handle
+            do_POST = _handle
+
+        return Handler
@@ -5,4 +5,5 @@ urlpatterns = [
     path('rooms/', views.ChatRoomListCreateAPIView.as_view(), name='chat_rooms'),
     path('rooms/<int:pk>/', views.ChatRoomRetrieveUpdateAPIView.as_view(), name='chat_room_update'),
     path('<int:room_id>/messages/', views.MessageListAPIView.as_view(), name='chat_messages'),
+    path('search/', views.MessageSearchAPIView.as_view(), name='chat_message_search'),
 ]
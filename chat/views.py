@@ -1,77 +1,22 @@
 import logging
-import os
 
-import requests
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .models import ChatRoom, Message, User
-from .serializers import ChatRoomSerializer, MessageSerializer
+from .archive import archived_until, read_through, room_messages
+from .friends import accepted_friend_ids, invalidate_friends
+from .models import ChatRoom, User
+from .page_cache import newest_page_cache, page_entries, render_page, render_results
+from .pagination import decode_cursor, encode_cursor, paginate_messages
+from .search import highlight, search_messages
+from .serializers import ChatRoomListSerializer, ChatRoomSerializer, MessageSerializer
+from .tokens import cached_verification
+from .upstream import refresh_jwt_token, verify_jwt
 from rest_framework.exceptions import ValidationError
-from django.http import Http404
+from django.conf import settings
+from django.http import Http404, HttpResponse
 
 logger = logging.getLogger('django')
-other_server_url = os.environ.get("OTHER_SERVER_URL")
-
-def verify_jwt(url, cookie):
-    headers = {
-        'Cookie': cookie
-    }
-
-    url = url + "travel-user/reading"
-
-    try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-
-        if response.status_code == 200:
-            return {
-                'data': response.json()
-            }
-        else:
-            if response.status_code == 401:
-                return {'error': 'Token expired', 'status_code': 401}
-            return {'error': f'Unexpected status code: {response.status_code}'}
-    except requests.exceptions.RequestException as e:
-        return {'error': str(e)}
-
-def refresh_jwt_token(url, cookie):
-    headers = {
-        'Cookie': cookie
-    }
-    url = url + "auth/token/refresh"
-
-    try:
-        response = requests.post(url, headers=headers)
-        response.raise_for_status()
-
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {'error': f'Unexpected status code: {response.status_code}'}
-    except requests.exceptions.RequestException as e:
-        return {'error': str(e)}
-
-def get_friends(url, cookie):
-    url = url + "friend/friend-list"
-    headers = {
-        'Cookie': cookie
-    }
-
-    try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-
-        if response.status_code == 200:
-            friends = response.json()
-            for friend in friends:
-                if not friend.get('friendTravelUserDto') or not friend['friendTravelUserDto'].get('travelUserId'):
-                    return {'error': 'Friend list contains user with null travelUserId'}
-            return friends
-        else:
-            return {'error': f'Unexpected status code: {response.status}'}
-    except requests.exceptions.RequestException as e:
-        return {'error': str(e)}
 
 class UserGetAndCreateView(APIView):
     def post(self, request, format=None):
@@ -83,7 +28,7 @@ class UserGetAndCreateView(APIView):
             return Response({f'error': 'Tokens are missing'}, status=status.HTTP_400_BAD_REQUEST)
 
         cookie = f"jwtToken={access_token}; jwtRefreshToken={refresh_token}"
-        jwt_response = verify_jwt(other_server_url, cookie)
+        jwt_response = cached_verification(access_token, lambda: verify_jwt(cookie))
 
         if 'error' in jwt_response:
             return Response({'error': jwt_response['error']}, status=status.HTTP_401_UNAUTHORIZED)
@@ -102,6 +47,8 @@ class UserGetAndCreateView(APIView):
         user.jwt_token = access_token
         user.jwt_refresh_token = refresh_token
         user.save()
+        # 새로 로그인한 사용자의 친구 목록은 다음 방 생성 때 다시 가져온다
+        invalidate_friends(travel_user_id)
 
         return Response({'message': 'Token verified', 'travelUserId': travel_user_id}, status=status.HTTP_200_OK)
 
@@ -110,10 +57,16 @@ class ChatRoomListCreateAPIView(APIView):
         travel_user_id = request.query_params.get('travel_user_id')
 
         if travel_user_id:
-            chat_rooms = ChatRoom.objects.filter(users__travel_user_id=travel_user_id)
+            chat_rooms = ChatRoom.objects.filter(users__travel_user_id=travel_user_id).prefetch_related('users')
         else:
             return Response({'error': 'travel_user_id is required'}, status=status.HTTP_400_BAD_REQUEST)
-        serializer = ChatRoomSerializer(chat_rooms, many=True)
+
+        # 전체 메시지가 포함된 형태는 expand=messages로 요청할 때만 내려준다
+        if request.query_params.get('expand') == 'messages':
+            chat_rooms = chat_rooms.prefetch_related('messages__sender')
+            serializer = ChatRoomSerializer(chat_rooms, many=True)
+        else:
+            serializer = ChatRoomListSerializer(chat_rooms.select_related('last_message_sender'), many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def post(self, request, format=None):
@@ -129,45 +82,50 @@ class ChatRoomListCreateAPIView(APIView):
             try:
                 user = User.objects.get(travel_user_id=travel_user_id)
                 cookie = f"jwtToken={user.jwt_token}; jwtRefreshToken={user.jwt_refresh_token}"
-                friends_data = get_friends(other_server_url, cookie)
-
-                if 'error' in friends_data:
-                    if friends_data.get('status_code') == 401:
-                        refresh_response = refresh_jwt_token(other_server_url, cookie)
-                        if 'error' in refresh_response:
-                            return Response({'error': refresh_response['error']}, status=status.HTTP_401_UNAUTHORIZED)
-                        user.jwt_token = refresh_response['jwtToken']
-                        user.jwt_refresh_token = refresh_response['jwtRefreshToken']
-                        user.save()
-
-                        new_tokens['jwtToken'] = refresh_response['jwtToken']
-                        new_tokens['jwtRefreshToken'] = refresh_response['jwtRefreshToken']
-                        cookie = f"jwtToken={user.jwt_token}; jwtRefreshToken={user.jwt_refresh_token}"
-                        friends_data = get_friends(cookie)
-                    if 'error' in friends_data:
-                        return Response({'error': friends_data['error']}, status=status.HTTP_400_BAD_REQUEST)
-                else:
-                    accepted_friends = {friend['friendTravelUserDto']['travelUserId'] for friend in friends_data if friend['friendStatus'] == 'acceptance'}
-                    user_ids = [user_data['travel_user_id'] for user_data in users_data]
-                    if not all(user_id in accepted_friends for user_id in user_ids):
-                        return Response({'error': '모든 사용자들은 방을 만들기 위해 친구여야 합니다.'}, status=status.HTTP_400_BAD_REQUEST)
-
-                    user_ids.append(travel_user_id)
-                    for user_id in user_ids:
-                        User.objects.get_or_create(travel_user_id=user_id)
-
-                    room = ChatRoom.objects.create(room_name="New Chat Room")
-                    room_users = User.objects.filter(travel_user_id__in=user_ids)
-                    room.users.set(room_users)
-                    room.save()
-
-                    logger.info(f"Room created with users: {[user.travel_user_id for user in room.users.all()]}")
-
-                    response_data = ChatRoomSerializer(room).data
-                    if new_tokens:
-                        response_data.update(new_tokens)
-
-                    return Response(response_data, status=status.HTTP_201_CREATED)
+                friend_ids = accepted_friend_ids(travel_user_id, cookie)
+
+                if isinstance(friend_ids, dict) and friend_ids.get('status_code') == 401:
+                    refresh_response = refresh_jwt_token(cookie)
+                    if 'error' in refresh_response:
+                        return Response({'error': refresh_response['error']}, status=status.HTTP_401_UNAUTHORIZED)
+                    user.jwt_token = refresh_response['jwtToken']
+                    user.jwt_refresh_token = refresh_response['jwtRefreshToken']
+                    user.save()
+
+                    new_tokens['jwtToken'] = refresh_response['jwtToken']
+                    new_tokens['jwtRefreshToken'] = refresh_response['jwtRefreshToken']
+                    cookie = f"jwtToken={user.jwt_token}; jwtRefreshToken={user.jwt_refresh_token}"
+                    friend_ids = accepted_friend_ids(travel_user_id, cookie, refresh=True)
+                if isinstance(friend_ids, dict):
+                    return Response({'error': friend_ids['error']}, status=status.HTTP_400_BAD_REQUEST)
+
+                accepted_friends, from_cache = friend_ids
+                user_ids = [user_data['travel_user_id'] for user_data in users_data]
+                if from_cache and not all(user_id in accepted_friends for user_id in user_ids):
+                    # 캐시 이후에 친구가 되었을 수 있으므로 한 번만 업스트림에서 다시 확인한다
+                    friend_ids = accepted_friend_ids(travel_user_id, cookie, refresh=True)
+                    if isinstance(friend_ids, dict):
+                        return Response({'error': friend_ids['error']}, status=status.HTTP_400_BAD_REQUEST)
+                    accepted_friends, from_cache = friend_ids
+                if not all(user_id in accepted_friends for user_id in user_ids):
+                    return Response({'error': '모든 사용자들은 방을 만들기 위해 친구여야 합니다.'}, status=status.HTTP_400_BAD_REQUEST)
+
+                user_ids.append(travel_user_id)
+                for user_id in user_ids:
+                    User.objects.get_or_create(travel_user_id=user_id)
+
+                room = ChatRoom.objects.create(room_name="New Chat Room")
+                room_users = User.objects.filter(travel_user_id__in=user_ids)
+                room.users.set(room_users)
+                room.save()
+
+                logger.info(f"Room created with users: {[user.travel_user_id for user in room.users.all()]}")
+
+                response_data = ChatRoomSerializer(room).data
+                if new_tokens:
+                    response_data.update(new_tokens)
+
+                return Response(response_data, status=status.HTTP_201_CREATED)
 
             except User.DoesNotExist:
                 return Response({'error': 'User not found.'}, status=status.HTTP_404_NOT_FOUND)
@@ -176,14 +134,16 @@ class ChatRoomListCreateAPIView(APIView):
                 return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 class ChatRoomRetrieveUpdateAPIView(APIView):
-    def get_object(self, pk):
+    def get_object(self, pk, queryset=None):
+        if queryset is None:
+            queryset = ChatRoom.objects.all()
         try:
-            return ChatRoom.objects.get(pk=pk)
+            return queryset.get(pk=pk)
         except ChatRoom.DoesNotExist:
             raise Http404
 
     def get(self, request, pk, format=None):
-        chat_room = self.get_object(pk)
+        chat_room = self.get_object(pk, ChatRoom.objects.prefetch_related('users', 'messages__sender'))
         serializer = ChatRoomSerializer(chat_room)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -201,11 +161,115 @@ class ChatRoomRetrieveUpdateAPIView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class MessageListAPIView(APIView):
+    def get_page_size(self, request):
+        page_size = request.query_params.get('page_size')
+        if not page_size:
+            return settings.CHAT_MESSAGE_PAGE_SIZE
+        try:
+            page_size = int(page_size)
+        except ValueError:
+            raise ValidationError('page_size는 정수여야 합니다.')
+        if page_size < 1:
+            raise ValidationError('page_size는 1 이상이어야 합니다.')
+        return min(page_size, settings.CHAT_MESSAGE_MAX_PAGE_SIZE)
+
     def get(self, request, room_id, format=None):
         if not room_id:
             raise ValidationError('room_id 파라미터가 필요합니다.')
-        messages = Message.objects.filter(room_id=room_id)
-        if not messages.exists():
+
+        before = request.query_params.get('before')
+        after = request.query_params.get('after')
+        if before and after:
+            raise ValidationError('before와 after는 함께 사용할 수 없습니다.')
+
+        page_size = self.get_page_size(request)
+        if newest_page_cache is not None and not before and not after and page_size < newest_page_cache.size:
+            return self.get_newest_page(room_id, page_size)
+        return self.get_page(room_id, page_size,
+                             before=decode_cursor(before) if before else None,
+                             after=decode_cursor(after) if after else None)
+
+    def get_page(self, room_id, page_size, before=None, after=None):
+        messages, prev_cursor, next_cursor = paginate_messages(
+            room_messages(room_id),
+            page_size,
+            before=before,
+            after=after,
+        )
+        # 핫 테이블에서 모자란 오래된 메시지는 archive_messages가 옮겨 둔 세그먼트에서 이어 읽는다
+        archived = read_through(room_id, page_size, messages, prev_cursor, next_cursor, before=before, after=after)
+        if archived is not None:
+            return HttpResponse(render_results(*archived), content_type='application/json')
+        if not messages and before is None and after is None:
             raise Http404('해당 room_id로 메시지를 찾을 수 없습니다.')
+
         serializer = MessageSerializer(messages, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response({
+            'results': serializer.data,
+            'prev': prev_cursor,
+            'next': next_cursor,
+        }, status=status.HTTP_200_OK)
+
+    def get_newest_page(self, room_id, page_size):
+        # 최신 페이지는 미리 직렬화해 둔 JSON을 이어 붙여 응답한다 (ORM·serializer를 거치지 않음)
+        cached = newest_page_cache.get(room_id, page_size)
+        if cached is None:
+            generation = newest_page_cache.generation(room_id)
+            rows = list(room_messages(room_id).order_by('-timestamp', '-id')[:newest_page_cache.size])
+            entries = page_entries(rows[::-1])
+            # 아카이브된 메시지가 있으면 핫 테이블의 메시지가 방의 전체 메시지가 아니다
+            complete = len(rows) < newest_page_cache.size and archived_until(room_id, rows) is None
+            newest_page_cache.fill(room_id, entries, complete, generation)
+            cached = entries[-page_size:], len(entries) > page_size or not complete
+
+        entries, has_more = cached
+        if not entries:
+            # 메시지가 모두 아카이브된 방일 수 있다
+            return self.get_page(room_id, page_size)
+        return HttpResponse(render_page(entries, has_more), content_type='application/json')
+
+
+class MessageSearchAPIView(APIView):
+    def get_positive_int(self, request, name, default):
+        value = request.query_params.get(name)
+        if not value:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValidationError(f'{name}는 정수여야 합니다.')
+        if value < 1:
+            raise ValidationError(f'{name}는 1 이상이어야 합니다.')
+        return value
+
+    def get(self, request, format=None):
+        travel_user_id = request.query_params.get('travel_user_id')
+        if not travel_user_id:
+            return Response({'error': 'travel_user_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            travel_user_id = int(travel_user_id)
+        except ValueError:
+            raise ValidationError('travel_user_id는 정수여야 합니다.')
+
+        room_id = request.query_params.get('room_id')
+        room_id = self.get_positive_int(request, 'room_id', None) if room_id else None
+        page = self.get_positive_int(request, 'page', 1)
+        page_size = min(self.get_positive_int(request, 'page_size', settings.CHAT_MESSAGE_PAGE_SIZE),
+                        settings.CHAT_MESSAGE_MAX_PAGE_SIZE)
+
+        messages = search_messages(travel_user_id, request.query_params.get('q'), page_size + 1,
+                                   offset=(page - 1) * page_size, room_id=room_id)
+        results = [{
+            'id': message.id,
+            'room': message.room_id,
+            'text': message.text,
+            'snippet': highlight(message.snippet),
+            'timestamp': message.timestamp,
+            'sender': {'travel_user_id': message.sender_travel_user_id},
+            # 메시지 목록 API의 before/after로 앞뒤 대화를 불러올 수 있다
+            'cursor': encode_cursor(message.timestamp, message.id),
+        } for message in messages[:page_size]]
+        return Response({
+            'results': results,
+            'next': page + 1 if len(messages) > page_size else None,
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,171 @@
+import asyncio
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .db import db_writer
+from .metrics import GaugeCollector, registry
+from .models import Message
+from .page_cache import cache_messages, with_sender
+from .summaries import record_messages
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriteBehindQueue:
+    """
+    소켓으로 받은 메시지를 바로 INSERT하지 않고 모아 두었다가 bulk_create로 한 번에 저장한다.
+    timestamp와 순서는 enqueue 시점에 정해지고, batch_size가 차거나 flush_interval이 지나면 flush된다.
+    """
+
+    def __init__(self, batch_size, flush_interval):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._lock = threading.Lock()
+        self._last_timestamp = None
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+
+        self.enqueued_total = 0
+        self.flushed_total = 0
+        self.flush_count = 0
+        self.flush_errors = 0
+        self.dropped_total = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    @property
+    def depth(self):
+        return len(self._pending)
+
+    def _next_timestamp(self):
+        # 같은 프로세스에서 enqueue된 메시지는 timestamp가 항상 증가하도록 보정한다
+        now = timezone.now()
+        if self._last_timestamp is not None and now <= self._last_timestamp:
+            now = self._last_timestamp + timedelta(microseconds=1)
+        self._last_timestamp = now
+        return now
+
+    def enqueue(self, room_id, identity, text):
+        with self._lock:
+            message = Message(room_id=room_id, sender_id=identity['id'], text=text, timestamp=self._next_timestamp())
+            with_sender(message, identity)
+            self._pending.append(message)
+            self.enqueued_total += 1
+            depth = len(self._pending)
+
+        self._ensure_flusher()
+        if depth >= self.batch_size:
+            self._wakeup.set()
+        return message
+
+    def _ensure_flusher(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def _take(self, limit=None):
+        with self._lock:
+            limit = len(self._pending) if limit is None else limit
+            batch, self._pending = self._pending[:limit], self._pending[limit:]
+        return batch
+
+    async def flush(self):
+        while self._pending:
+            await db_writer.run(self._write, self._take(self.batch_size))
+
+    def flush_sync(self):
+        while self._pending:
+            self._write(self._take(self.batch_size))
+
+    def _write(self, batch):
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                Message.objects.bulk_create(batch)
+                record_messages(batch)
+        except Exception:
+            self.flush_errors += 1
+            logger.exception('Write-behind batch of %d messages failed, retrying row by row', len(batch))
+            batch = self._write_rows(batch)
+        else:
+            self.flushed_total += len(batch)
+        self._cache(batch)
+
+        elapsed = time.perf_counter() - started
+        self.flush_count += 1
+        self.last_flush_seconds = elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.total_flush_seconds += elapsed
+
+    def _write_rows(self, batch):
+        # 배치 중 일부(삭제된 방 등) 때문에 전체가 유실되지 않도록 한 건씩 다시 저장한다
+        saved = []
+        for message in batch:
+            message.pk = None
+            try:
+                with transaction.atomic():
+                    message.save(force_insert=True)
+                    record_messages([message])
+            except Exception:
+                self.dropped_total += 1
+                logger.exception('Dropping message for room %s from write-behind queue', message.room_id)
+            else:
+                self.flushed_total += 1
+                saved.append(message)
+        return saved
+
+    @staticmethod
+    def _cache(messages):
+        by_room = {}
+        for message in messages:
+            if message.pk is not None:
+                by_room.setdefault(message.room_id, []).append(message)
+        for room_id, room_messages in by_room.items():
+            cache_messages(room_id, room_messages)
+
+    def stats(self):
+        return {
+            'depth': self.depth,
+            'enqueued_total': self.enqueued_total,
+            'flushed_total': self.flushed_total,
+            'dropped_total': self.dropped_total,
+            'flush_count': self.flush_count,
+            'flush_errors': self.flush_errors,
+            'last_flush_seconds': self.last_flush_seconds,
+            'max_flush_seconds': self.max_flush_seconds,
+            'total_flush_seconds': self.total_flush_seconds,
+        }
+
+
+message_queue = MessageWriteBehindQueue(settings.CHAT_WRITE_BEHIND_BATCH_SIZE, settings.CHAT_WRITE_BEHIND_INTERVAL)
+
+registry.register(GaugeCollector(
+    'chat_write_behind', 'Write-behind message queue statistics.',
+    lambda: {(name,): value for name, value in message_queue.stats().items()}, ['stat'],
+))
+
+# 프로세스 종료 시 남은 메시지를 저장한다 (이벤트 루프가 이미 멈춘 뒤이므로 동기로 처리)
+atexit.register(message_queue.flush_sync)
@@ -10,15 +10,22 @@ from django.core.asgi import get_asgi_application
 from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 import chat.routing
+from chat.backpressure import DaphneProtocolMiddleware
+from chat.drain import drainer
 import redis
 from django.conf import settings
 
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
-    "websocket": AuthMiddlewareStack(
-        URLRouter(
-            chat.routing.websocket_urlpatterns
+    # 송신 버퍼 상태(chat.backpressure)를 보려면 daphne protocol을 세션 middleware보다 먼저 찾아야 한다
+    "websocket": DaphneProtocolMiddleware(
+        AuthMiddlewareStack(
+            URLRouter(
+                chat.routing.websocket_urlpatterns
+            )
         )
     ),
 })
 
+# run_ws_workers가 재시작·종료 시 보내는 SIGUSR1을 받으면 소켓을 정리하고 종료한다
+drainer.install()
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'chat.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -96,15 +97,122 @@ REST_FRAMEWORK = {
     ),
 }
 
+REDIS_URL = os.environ.get('REDIS_URL')
+
+# 소켓(채널)별 Redis 대기열 최대 길이와 메시지 만료(초). 넘치거나 만료된 이벤트는 channels_redis가 버린다.
+# 그룹 멤버십은 CHAT_GROUP_EXPIRY(초)가 지나면 만료되므로 가장 긴 접속 시간보다 길게 둔다.
+CHAT_CHANNEL_CAPACITY = int(os.environ.get('CHAT_CHANNEL_CAPACITY', 100))
+CHAT_CHANNEL_EXPIRY = int(os.environ.get('CHAT_CHANNEL_EXPIRY', 60))
+CHAT_GROUP_EXPIRY = int(os.environ.get('CHAT_GROUP_EXPIRY', 86400))
+
+# 1이면 같은 프로세스의 소켓에는 Redis를 거치지 않고 전달한다 (chat.layers.HybridChannelLayer). 기본은 channels_redis 그대로
+CHAT_LOCAL_FANOUT = os.environ.get('CHAT_LOCAL_FANOUT', '0').lower() in ('1', 'true', 'yes')
+
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'BACKEND': 'chat.layers.HybridChannelLayer' if CHAT_LOCAL_FANOUT else 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
-            "hosts": [os.environ.get('REDIS_URL')],
+            "hosts": [REDIS_URL],
+            "capacity": CHAT_CHANNEL_CAPACITY,
+            "expiry": CHAT_CHANNEL_EXPIRY,
+            "group_expiry": CHAT_GROUP_EXPIRY,
         },
     },
 }
 
+# 채팅 메시지 히스토리 페이지 크기
+CHAT_MESSAGE_PAGE_SIZE = int(os.environ.get('CHAT_MESSAGE_PAGE_SIZE', 50))
+CHAT_MESSAGE_MAX_PAGE_SIZE = int(os.environ.get('CHAT_MESSAGE_MAX_PAGE_SIZE', 200))
+
+# travel_user_id -> User 식별자 프로세스 캐시
+CHAT_IDENTITY_CACHE_SIZE = int(os.environ.get('CHAT_IDENTITY_CACHE_SIZE', 10000))
+CHAT_IDENTITY_CACHE_TTL = float(os.environ.get('CHAT_IDENTITY_CACHE_TTL', 300))
+
+# 소켓별 참가자 캐시를 DB 버전과 다시 맞춰보는 주기(초)
+CHAT_MEMBERSHIP_TTL = float(os.environ.get('CHAT_MEMBERSHIP_TTL', 30))
+
+# 메시지 write-behind 저장 (opt-in): 모아서 bulk_create로 저장한다
+CHAT_WRITE_BEHIND = os.environ.get('CHAT_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+CHAT_WRITE_BEHIND_BATCH_SIZE = int(os.environ.get('CHAT_WRITE_BEHIND_BATCH_SIZE', 100))
+CHAT_WRITE_BEHIND_INTERVAL = float(os.environ.get('CHAT_WRITE_BEHIND_INTERVAL', 0.05))
+
+# 다른 서버(인증/친구 API) 호출 설정
+OTHER_SERVER_URL = os.environ.get('OTHER_SERVER_URL')
+CHAT_UPSTREAM_TIMEOUT = float(os.environ.get('CHAT_UPSTREAM_TIMEOUT', 5))
+CHAT_UPSTREAM_MAX_CONCURRENCY = int(os.environ.get('CHAT_UPSTREAM_MAX_CONCURRENCY', 20))
+CHAT_UPSTREAM_RETRIES = int(os.environ.get('CHAT_UPSTREAM_RETRIES', 2))
+CHAT_UPSTREAM_BACKOFF = float(os.environ.get('CHAT_UPSTREAM_BACKOFF', 0.1))
+CHAT_UPSTREAM_BREAKER_THRESHOLD = int(os.environ.get('CHAT_UPSTREAM_BREAKER_THRESHOLD', 5))
+CHAT_UPSTREAM_BREAKER_RESET = float(os.environ.get('CHAT_UPSTREAM_BREAKER_RESET', 30))
+
+# 업스트림 JWT 검증 결과 캐시 ('local' 또는 'redis')
+CHAT_JWT_CACHE_BACKEND = os.environ.get('CHAT_JWT_CACHE_BACKEND', 'local')
+CHAT_JWT_CACHE_SIZE = int(os.environ.get('CHAT_JWT_CACHE_SIZE', 10000))
+CHAT_JWT_CACHE_TTL = float(os.environ.get('CHAT_JWT_CACHE_TTL', 300))
+CHAT_JWT_NEGATIVE_TTL = float(os.environ.get('CHAT_JWT_NEGATIVE_TTL', 5))
+
+# 방 생성 시 사용하는 사용자별 친구 목록 캐시 ('local' 또는 'redis')
+CHAT_FRIEND_CACHE_BACKEND = os.environ.get('CHAT_FRIEND_CACHE_BACKEND', 'local')
+CHAT_FRIEND_CACHE_SIZE = int(os.environ.get('CHAT_FRIEND_CACHE_SIZE', 10000))
+CHAT_FRIEND_CACHE_TTL = float(os.environ.get('CHAT_FRIEND_CACHE_TTL', 60))
+
+# 재접속 시 놓친 메시지 재전송: 방별 최근 메시지 버퍼 크기와 DB에서 한 번에 재전송할 최대 개수
+CHAT_REPLAY_BUFFER_SIZE = int(os.environ.get('CHAT_REPLAY_BUFFER_SIZE', 200))
+CHAT_REPLAY_LIMIT = int(os.environ.get('CHAT_REPLAY_LIMIT', 500))
+
+# 방별 최신 메시지 페이지 캐시 ('redis', 'local' 또는 빈 값=사용 안 함). 'local'은 단일 프로세스 배포 전용
+# CHAT_PAGE_CACHE_SIZE보다 작은 page_size 요청만 캐시에서 응답한다
+CHAT_PAGE_CACHE_BACKEND = os.environ.get('CHAT_PAGE_CACHE_BACKEND', '')
+CHAT_PAGE_CACHE_SIZE = int(os.environ.get('CHAT_PAGE_CACHE_SIZE', 100))
+CHAT_PAGE_CACHE_ROOMS = int(os.environ.get('CHAT_PAGE_CACHE_ROOMS', 1000))
+CHAT_PAGE_CACHE_TTL = float(os.environ.get('CHAT_PAGE_CACHE_TTL', 3600))
+
+# 저장하지 않는 이벤트(typing, read, presence): 묶어 보내는 간격(초), 같은 값 재전송 최소 간격(초), 소켓별 초당 허용 수
+CHAT_EPHEMERAL_WINDOW = float(os.environ.get('CHAT_EPHEMERAL_WINDOW', 0.25))
+CHAT_EPHEMERAL_REPEAT = float(os.environ.get('CHAT_EPHEMERAL_REPEAT', 3))
+CHAT_EPHEMERAL_RATE = float(os.environ.get('CHAT_EPHEMERAL_RATE', 5))
+CHAT_EPHEMERAL_BURST = int(os.environ.get('CHAT_EPHEMERAL_BURST', 10))
+
+# 소켓별·발신자별 토큰 버킷 ('초당 허용 수/burst'). 넘는 프레임은 DB에 닿기 전에 거절한다
+# 발신자별 버킷 저장소는 'local'(프로세스별) 또는 'redis'(daphne 프로세스 간 공유)
+CHAT_RATE_LIMITS = {
+    'message': os.environ.get('CHAT_RATE_LIMIT_MESSAGE', '5/20'),
+    'invite': os.environ.get('CHAT_RATE_LIMIT_INVITE', '1/5'),
+    'leave': os.environ.get('CHAT_RATE_LIMIT_LEAVE', '1/5'),
+    'subscribe': os.environ.get('CHAT_RATE_LIMIT_SUBSCRIBE', '2/20'),
+}
+CHAT_RATE_LIMIT_BACKEND = os.environ.get('CHAT_RATE_LIMIT_BACKEND', 'local')
+
+# ?batch=1로 접속한 소켓은 이 시간(초) 안에 생긴 이벤트를 배열 프레임 하나로 묶어 보낸다 (최대 CHAT_BATCH_MAX_FRAMES개)
+CHAT_BATCH_WINDOW = float(os.environ.get('CHAT_BATCH_WINDOW', 0.005))
+CHAT_BATCH_MAX_FRAMES = int(os.environ.get('CHAT_BATCH_MAX_FRAMES', 64))
+
+# 소켓 송신 버퍼(daphne transport)가 밀려 있는 동안 쌓아 두는 프레임의 최대 크기(bytes).
+# 넘치면 'drop'은 오래된 프레임부터 버리고 {'type': 'dropped'}로 알리며, 'disconnect'는 4008로 끊는다 (last_seen으로 재접속)
+CHAT_OUTBOX_MAX_BYTES = int(os.environ.get('CHAT_OUTBOX_MAX_BYTES', 256 * 1024))
+CHAT_SLOW_CONSUMER_POLICY = os.environ.get('CHAT_SLOW_CONSUMER_POLICY', 'drop')
+# 이보다 늦게 도착한 typing/read/presence 이벤트는 보내지 않는다(초)
+CHAT_EPHEMERAL_MAX_AGE = float(os.environ.get('CHAT_EPHEMERAL_MAX_AGE', 5))
+
+# run_ws_workers: daphne 워커 수, drain 시 소켓이 닫히기를 기다리는 시간(초),
+# reconnect 안내의 retry_after 최대값(초, 클라이언트가 한꺼번에 재접속하지 않도록 무작위로 흩뿌린다).
+# 워커를 2개 이상 띄우려면 접속 상태·발신 제한·페이지 캐시 저장소가 모두 redis여야 한다
+CHAT_WS_WORKERS = int(os.environ.get('CHAT_WS_WORKERS', 1))
+CHAT_DRAIN_TIMEOUT = float(os.environ.get('CHAT_DRAIN_TIMEOUT', 10))
+CHAT_RECONNECT_JITTER = float(os.environ.get('CHAT_RECONNECT_JITTER', 5))
+
+# 접속 상태 저장소 ('local' 또는 'redis')와 heartbeat가 없을 때 offline으로 보는 시간(초)
+CHAT_PRESENCE_BACKEND = os.environ.get('CHAT_PRESENCE_BACKEND', 'local')
+CHAT_PRESENCE_TTL = float(os.environ.get('CHAT_PRESENCE_TTL', 60))
+
+# archive_messages: 이 일수보다 오래된 메시지를 방별·월별 gzip 세그먼트(CHAT_ARCHIVE_DIR)로 옮긴다.
+# 옮긴 메시지는 메시지 목록 API에서 이어 읽히지만 전문 검색 대상에서는 빠진다.
+# CHAT_ARCHIVE_CACHE_SEGMENTS개의 최근 세그먼트는 압축을 푼 채로 프로세스 메모리에 둔다.
+CHAT_ARCHIVE_DIR = os.environ.get('CHAT_ARCHIVE_DIR', os.path.join(BASE_DIR, 'db_data', 'archive'))
+CHAT_ARCHIVE_AFTER_DAYS = int(os.environ.get('CHAT_ARCHIVE_AFTER_DAYS', 180))
+CHAT_ARCHIVE_BATCH_SIZE = int(os.environ.get('CHAT_ARCHIVE_BATCH_SIZE', 500))
+CHAT_ARCHIVE_CACHE_SEGMENTS = int(os.environ.get('CHAT_ARCHIVE_CACHE_SEGMENTS', 16))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -162,6 +270,22 @@ DATABASES = {
     }
 }
 
+# gunicorn과 daphne가 같은 SQLite 파일을 쓰므로 운영에서는 WAL 모드와 쓰기 잠금 대기를 켠다
+CHAT_SQLITE_PRODUCTION = os.environ.get('CHAT_SQLITE_PRODUCTION', '').lower() in ('1', 'true', 'yes')
+if CHAT_SQLITE_PRODUCTION:
+    DATABASES['default']['ENGINE'] = 'chat.backends.sqlite3'
+    DATABASES['default']['OPTIONS'] = {
+        'timeout': float(os.environ.get('CHAT_SQLITE_BUSY_TIMEOUT', 20)),
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': int(float(os.environ.get('CHAT_SQLITE_BUSY_TIMEOUT', 20)) * 1000),
+            'cache_size': -20000,
+            'temp_store': 'MEMORY',
+            'mmap_size': 134217728,
+        },
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
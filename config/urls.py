@@ -3,15 +3,22 @@ from django.conf.urls.static import static
 from django.conf import settings
 from chat.views import UserGetAndCreateView
 from django.http import HttpResponse
+from chat.metrics import registry
 
 
 def health_check(request):
     return HttpResponse("OK")
 
+
+def metrics(request):
+    # 프로세스별 지표이므로 gunicorn/daphne 워커마다 따로 수집된다
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 urlpatterns = [
     path('chat/', include('chat.urls')),
-    path('users/', UserGetAndCreateView.as_view()),
-    path('', health_check),
+    path('users/', UserGetAndCreateView.as_view(), name='users'),
+    path('metrics', metrics, name='metrics'),
+    path('', health_check, name='health_check'),
 ]
 
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
@@ -7,8 +7,9 @@ chmod 777 /tmp/client_body /tmp/proxy /tmp/fastcgi /tmp/uwsgi /tmp/scgi
 # Gunicorn 서버 실행
 gunicorn --bind 0.0.0.0:8002 config.wsgi:application &
 
-# Daphne 서버 실행
-daphne -b 0.0.0.0 -p 8003 config.asgi:application &
+# Daphne 워커 실행 (CHAT_WS_WORKERS개, 기본값 1). SIGHUP으로 순차 재시작.
+# 워커를 늘리려면 CHAT_PRESENCE_BACKEND, CHAT_RATE_LIMIT_BACKEND, CHAT_PAGE_CACHE_BACKEND를 redis로 설정한다
+python manage.py run_ws_workers --bind 0.0.0.0 --port 8003 &
 
 # 서비스들이 시작될 때까지 잠시 대기
 sleep 5